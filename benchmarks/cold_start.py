@@ -0,0 +1,50 @@
+"""
+Latency of the first query of a new session, which starts a new global frame, when the frame of the builtins
+is built for every global frame, as it was, and when it is built once and shared (see
+environment.build_global_frame).
+
+    python benchmarks/cold_start.py [--runs N] [--backend B]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "editor"))
+import execution
+import environment
+import local_server
+import session
+
+
+def measure(runs, backend, rebuild):
+    times = []
+    for _ in range(runs):
+        if rebuild:
+            environment.builtins = None
+        with session.activate(session.Session()) as current:
+            current.logger.autodraw = False
+            start = time.perf_counter()
+            result = local_server.handle(["(+ 1 2)"], 0, 0, -1, False, threading.Event(), backend=backend)
+            times.append(time.perf_counter() - start)
+        assert result["success"], result
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--backend", default="visual", choices=execution.BACKENDS)
+    args = parser.parse_args()
+
+    measure(1, args.backend, True)  # imports the primitives
+    for label, rebuild in [("built per session", True), ("shared", False)]:
+        times = measure(args.runs, args.backend, rebuild)
+        print(f"{label:18} median {statistics.median(times) * 1000:7.2f} ms   min {min(times) * 1000:7.2f} ms   "
+              f"max {max(times) * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Size of the substitution tree in the /process2 response, exported as per-expression states
+and as delta records, for programs that stop below and at OP_LIMIT.
+
+    python benchmarks/export_size.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "editor"))
+import execution
+import log
+
+PROGRAMS = {
+    "fib 10": "(define (fib n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))) (fib 10)",
+    "map 100": "(define (map f lst) (if (null? lst) nil (cons (f (car lst)) (map f (cdr lst)))))\n"
+               "(define (range n) (if (= n 0) nil (cons n (range (- n 1)))))\n"
+               "(map (lambda (x) (* x x)) (range 100))",
+    "fib 20 (OP_LIMIT)": "(define (fib n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))) (fib 20)",
+}
+
+
+def run(code):
+    log.logger = log.Logger()
+    log.logger.autodraw = False
+    log.announce = log.logger.log
+    log.logger.new_query()
+    execution.string_exec([code], log.logger.out, False, None, "visual")
+
+
+def measure(tree_format):
+    start = time.perf_counter()
+    out = json.dumps(log.logger.export(tree_format))
+    return len(out), time.perf_counter() - start
+
+
+def main():
+    for name, code in PROGRAMS.items():
+        run(code)
+        states_size, states_time = measure("states")
+        delta_size, delta_time = measure("delta")
+        print(f"{name:18} states {states_size / 1024:9.1f} KiB {states_time:6.2f}s   "
+              f"delta {delta_size / 1024:9.1f} KiB {delta_time:6.2f}s   "
+              f"{delta_size / states_size:6.1%}")
+
+
+if __name__ == "__main__":
+    main()
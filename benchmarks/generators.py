@@ -0,0 +1,92 @@
+"""
+Generator-style iteration with call/cc against materializing a list, on the iterative backend.
+
+Each workload runs twice: summing every element of 0..N-1, and searching for the first element
+at least N / 100, which a generator finds without producing the rest of the sequence. Peak memory
+is measured by tracemalloc.
+
+    python benchmarks/generators.py [--length N] [--backend iterative]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "editor"))
+import execution
+import log
+
+PRELUDE = """
+(define (make-range-generator n)
+  (define return nil)
+  (define resume nil)
+  (define (walk i)
+    (if (< i n)
+        (begin (call/cc (lambda (k) (set! resume k) (return i)))
+               (walk (+ i 1)))
+        (return 'done)))
+  (lambda ()
+    (call/cc (lambda (r)
+      (set! return r)
+      (if (null? resume) (walk 0) (resume nil))))))
+(define (range n)
+  (define (build i acc) (if (< i 0) acc (build (- i 1) (cons i acc))))
+  (build (- n 1) nil))
+"""
+
+WORKLOADS = {
+    ("generator", "sum"): """
+    (define (total g acc) (let ((x (g))) (if (eq? x 'done) acc (total g (+ acc x)))))
+    (total (make-range-generator {length}) 0)
+    """,
+    ("list", "sum"): """
+    (define (total lst acc) (if (null? lst) acc (total (cdr lst) (+ acc (car lst)))))
+    (total (range {length}) 0)
+    """,
+    ("generator", "search"): """
+    (define (search g) (let ((x (g))) (if (>= x {target}) x (search g))))
+    (search (make-range-generator {length}))
+    """,
+    ("list", "search"): """
+    (define (search lst) (if (>= (car lst) {target}) (car lst) (search (cdr lst))))
+    (search (range {length}))
+    """,
+}
+
+
+def run(code, backend):
+    log.logger = log.Logger()
+    log.logger.autodraw = False
+    log.announce = log.logger.log
+    log.logger.new_query()
+    execution.string_exec([PRELUDE + code], log.logger.out, False, None, backend)
+    return "".join("".join(x) for x in log.logger._out)
+
+
+def measure(code, backend):
+    tracemalloc.start()
+    start = time.perf_counter()
+    out = run(code, backend)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--length", type=int, default=20000)
+    parser.add_argument("--backend", default="iterative")
+    args = parser.parse_args()
+
+    target = args.length // 100
+    expected = {"sum": f"{args.length * (args.length - 1) // 2}\n", "search": f"{target}\n"}
+    for (style, workload), code in WORKLOADS.items():
+        out, peak, elapsed = measure(code.format(length=args.length, target=target), args.backend)
+        assert out.endswith(expected[workload]), out
+        print(f"{style:10} {workload:7} peak {peak / 2 ** 20:8.1f} MiB  {elapsed:7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
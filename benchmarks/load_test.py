@@ -0,0 +1,99 @@
+"""
+Requests per second and latency of the threaded server (local_server.ThreadedHTTPServer) and of the asyncio one
+(async_server.Server), under several clients that each send requests one after another for a while, for static
+files, for quick requests that run no code, and for runs of a short query. The server runs in a process of its own.
+
+    python benchmarks/load_test.py [--clients C] [--seconds S] [--scenarios NAME ...]
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import statistics
+import sys
+import threading
+import time
+import urllib.parse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "editor"))
+import execution
+import local_server
+
+SCENARIOS = {
+    "static": [("GET", "/", None), ("GET", "/scripts/main", None), ("GET", "/bootstrap.min.css", None)],
+    "quick": [("POST", "/list_files", {}), ("POST", "/documentation", {"query": "car"})],
+    "run": [("POST", "/process2", {"code[]": ["(define (f n) (if (= n 0) 0 (+ n (f (- n 1))))) (f 20)"],
+                                   "curr_i": 0, "curr_f": 0, "globalFrameID": -1, "tailViz": "false"})],
+}
+
+
+def serve(kind, ports):
+    if kind == "async":
+        import async_server
+        httpd = async_server.Server(("127.0.0.1", 0))
+    else:
+        httpd = local_server.ThreadedHTTPServer(("127.0.0.1", 0), local_server.Handler)
+    ports.put(httpd.server_address[1])
+    httpd.serve_forever()
+
+
+def client(port, requests, session_id, deadline, latencies):
+    # keeps its connection open between requests, if the server does
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    n = 0
+    while time.perf_counter() < deadline:
+        method, path, data = requests[n % len(requests)]
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode({**data, "sessionId": session_id}, doseq=True)
+        start = time.perf_counter()
+        connection.request(method, path, body, {"Content-Type": "application/x-www-form-urlencoded"})
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        assert response.status == 200, (path, response.status)
+        n += 1
+    connection.close()
+
+
+def measure(kind, requests, clients, seconds):
+    context = multiprocessing.get_context()
+    ports = context.Queue()
+    process = context.Process(target=serve, args=(kind, ports), daemon=True)
+    process.start()
+    port = ports.get()
+    try:
+        client(port, requests, "warm", time.perf_counter() + 0.5, [])
+        latencies = [[] for _ in range(clients)]
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=client, args=(port, requests, f"client{i}", deadline, latencies[i]))
+                   for i in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.join()
+    latencies = sorted(latency for latencies in latencies for latency in latencies)
+    return len(latencies) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--scenarios", nargs="*", default=list(SCENARIOS), choices=list(SCENARIOS))
+    args = parser.parse_args()
+
+    for scenario in args.scenarios:
+        for kind in ["threaded", "async"]:
+            throughput, median, p99 = measure(kind, SCENARIOS[scenario], args.clients, args.seconds)
+            print(f"{scenario:7} {kind:9} {throughput:9.1f} requests/s   median {median * 1000:7.2f} ms   "
+                  f"p99 {p99 * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
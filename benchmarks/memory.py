@@ -0,0 +1,70 @@
+"""
+Peak memory of building and traversing a large list, as measured by tracemalloc.
+
+The first part builds the list directly (Pairs, and the VisualExpression tree the substitution
+tree would wrap it in), the second builds and sums it with cons in Scheme, once per backend.
+
+    python benchmarks/memory.py [--length N] [--eval-length N] [--backends visual headless compiled]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "editor"))
+import execution
+import log
+from datamodel import Number
+from helper import make_list, pair_to_list
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def build_directly(length):
+    lst = make_list([Number(i) for i in range(length)])
+    log.VisualExpression(lst)
+    assert len(pair_to_list(lst)) == length
+
+
+def build_in_scheme(length, backend):
+    code = f"""
+    (define (build i acc) (if (= i 0) acc (build (- i 1) (cons i acc))))
+    (define (total lst acc) (if (null? lst) acc (total (cdr lst) (+ acc (car lst)))))
+    (total (build {length} nil) 0)
+    """
+    log.logger = log.Logger()
+    log.logger.autodraw = False
+    log.announce = log.logger.log
+    log.logger.new_query()
+    execution.string_exec([code], log.logger.out, False, None, backend)
+    out = "".join("".join(x) for x in log.logger._out)
+    assert out.endswith(f"{length * (length + 1) // 2}\n"), out
+
+
+def report(label, peak, elapsed):
+    print(f"{label:24} peak {peak / 2 ** 20:8.1f} MiB  {elapsed:7.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--length", type=int, default=100000)
+    parser.add_argument("--eval-length", type=int, default=5000)
+    parser.add_argument("--backends", nargs="*", default=list(execution.BACKENDS))
+    args = parser.parse_args()
+
+    report(f"direct ({args.length})", *measure(lambda: build_directly(args.length)))
+    for backend in args.backends:
+        report(f"{backend} ({args.eval_length})", *measure(lambda: build_in_scheme(args.eval_length, backend)))
+
+
+if __name__ == "__main__":
+    main()
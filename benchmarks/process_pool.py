@@ -0,0 +1,86 @@
+"""
+Queries per second that the server answers to several clients at once, running their code in its own threads
+and in pools of 1 to N worker processes (see worker_pool.py). With --hog, another client runs an infinite
+loop throughout. The speedup of the pools is bounded by the number of cores.
+
+    python benchmarks/process_pool.py [--clients C] [--queries Q] [--workers N] [--backend B] [--hog]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "editor"))
+import execution
+import local_server
+from worker_pool import WorkerPool
+
+PROGRAM = "(define (fib n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))) (fib 12)"
+
+
+def post(url, **data):
+    return urllib.request.urlopen(url, urllib.parse.urlencode(data, doseq=True).encode("ascii")).read()
+
+
+def run(url, session_id, code, backend):
+    result = json.loads(post(url + "/process2", **{"code[]": [code], "curr_i": 0, "curr_f": 0, "globalFrameID": -1,
+                                                   "tailViz": "false", "backend": backend, "sessionId": session_id}))
+    assert result["success"], result
+
+
+def measure(workers, clients, queries, backend, hog):
+    local_server.pool = WorkerPool(workers) if workers else None
+    httpd = local_server.ThreadedHTTPServer(("127.0.0.1", 0), local_server.Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    for i in range(clients):
+        run(url, f"client{i}", "0", backend)  # so that the sessions are created, and the workers warm
+
+    if hog:
+        # headless, so that its trace does not grow without bound
+        hog_thread = threading.Thread(target=run, args=(url, "hog", "(define (loop) (loop)) (loop)", "headless"))
+        hog_thread.start()
+        time.sleep(0.5)
+    threads = [threading.Thread(target=lambda i=i: [run(url, f"client{i}", PROGRAM, backend) for _ in range(queries)])
+               for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if hog:
+        post(url + "/cancel", sessionId="hog")
+        hog_thread.join()
+
+    httpd.shutdown()
+    httpd.server_close()
+    if local_server.pool is not None:
+        local_server.pool.close()
+        local_server.pool = None
+    return clients * queries / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=5, help="queries sent by each client")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="the largest pool to measure")
+    parser.add_argument("--backend", default="visual", choices=execution.BACKENDS)
+    parser.add_argument("--hog", action="store_true")
+    args = parser.parse_args()
+
+    base = None
+    for workers in range(args.workers + 1):
+        throughput = measure(workers, args.clients, args.queries, args.backend, args.hog)
+        base = base or throughput
+        print(f"{'threads' if not workers else f'{workers} workers':10} {throughput:8.2f} queries/s   "
+              f"{throughput / base:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Memory of a long editing session, in which each iteration clicks Run on a fresh program, evaluates a few
+expressions in the REPL and saves its state, as the client does after every run.
+Saving acknowledges the global frames that the client still holds, so the server releases the others and
+memory stays flat; with --no-release it grows with every Run.
+
+    python benchmarks/soak.py [--iterations N] [--every K] [--no-release]
+"""
+import argparse
+import gc
+import os
+import sys
+import threading
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "editor"))
+import execution
+import log
+import local_server
+
+PROGRAM = "(define (make-counter) (define n 0) (lambda () (set! n (+ n 1)) n))\n" \
+          "(define (range n) (if (= n 0) nil (cons n (range (- n 1)))))\n" \
+          "(define (counters n) (if (= n 0) nil (cons (make-counter) (counters (- n 1)))))\n" \
+          "(define cs (counters 8))\n" \
+          "((car cs))"
+
+QUERIES = ["((car (cdr cs)))", "(length (range 10))", "(define x (range 20))"]
+
+
+def query(code, result, cancellation_event):
+    curr_i = result["states"][-1][1] if result.get("states") else 0
+    out = local_server.handle([code], curr_i, result.get("f_delta", 0), result["globalFrameID"], False,
+                              cancellation_event)
+    # the client keeps the id of the global frame that it got from Run
+    out["globalFrameID"] = result["globalFrameID"]
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--every", type=int, default=10)
+    parser.add_argument("--no-release", action="store_true")
+    args = parser.parse_args()
+
+    log.logger = log.Logger()
+    log.logger.autodraw = False
+    log.announce = log.logger.log
+    cancellation_event = threading.Event()
+
+    tracemalloc.start()
+    for iteration in range(1, args.iterations + 1):
+        result = local_server.handle([PROGRAM], 0, 0, -1, False, cancellation_event)
+        for code in QUERIES:
+            result = query(code, result, cancellation_event)
+        if not args.no_release:
+            local_server.release_frames({"states": [{"globalFrameID": result["globalFrameID"],
+                                                     "generation": result["generation"]}]})
+        if iteration % args.every == 0:
+            gc.collect()
+            current = tracemalloc.get_traced_memory()[0]
+            print(f"{iteration:6}  {current / 2 ** 20:7.1f} MiB  {len(log.logger.frame_lookup):7} frames  "
+                  f"{len(log.logger.retained):5} global frames")
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Time and bytes to answer GETs of all the static files of the editor, reading each from disk and filling it in as a
+template on every request, as the server did, and from the cache of static_files.py, without compression,
+with gzip, and when the client revalidates its copy (304 Not Modified).
+
+    python benchmarks/static_assets.py [--repeat N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "editor"))
+import execution
+import local_server
+
+
+def paths():
+    static = os.path.join(ROOT, "editor", "static")
+    for directory, _, files in os.walk(static):
+        for file in sorted(files):
+            yield "/" + os.path.relpath(os.path.join(directory, file), static).replace(os.sep, "/")
+
+
+def read_every_time(path):
+    with open(os.path.join(ROOT, "editor", "static", path[1:]), "rb") as file:
+        return file.read().replace(b"<START_DATA>", bytes(repr(json.dumps({"files": local_server.main_files})),
+                                                          "utf-8"))
+
+
+def measure(get, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        size = sum(len(get(path)) for path in paths())
+    return size, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    etags = {}
+
+    def revalidate(path):
+        status, headers, body = local_server.static_file(path, {"accept-encoding": "gzip",
+                                                                "if-none-match": etags[path]})
+        assert status == 304
+        return body
+
+    def remember(path):
+        _, headers, body = local_server.static_file(path, {"accept-encoding": "gzip"})
+        etags[path] = dict(headers)["ETag"]
+        return body
+
+    measure(remember, 1)
+    for label, get in [("read every time", read_every_time),
+                       ("cached", lambda path: local_server.static_file(path, {})[2]),
+                       ("cached, gzip", lambda path: local_server.static_file(path, {"accept-encoding": "gzip"})[2]),
+                       ("revalidated", revalidate)]:
+        size, elapsed = measure(get, args.repeat)
+        print(f"{label:16} {size / 1024:9.1f} KiB   {elapsed * 1000:7.2f} ms for {len(etags)} files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Iterations per second of a tail-recursive loop whose recursive call sits in tail position of
+cond, case, and, or and let, once per backend.
+
+    python benchmarks/tail_calls.py [--iterations N] [--backends headless compiled iterative]
+
+Every iteration makes frames that the logger keeps for the environment diagram, so memory grows
+with N; a run of 10000000 iterations needs several GiB.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "editor"))
+import execution
+import log
+
+LOOP = """
+(define (loop i)
+  (cond ((= i 0) 'done)
+        (else (case (remainder i 2)
+                ((0) (and #t (loop (- i 1))))
+                (else (or #f (let ((j (- i 1))) (loop j))))))))
+(loop {iterations})
+"""
+
+
+def run(iterations, backend):
+    log.logger = log.Logger()
+    log.logger.autodraw = False
+    log.announce = log.logger.log
+    log.logger.new_query()
+    start = time.perf_counter()
+    execution.string_exec([LOOP.format(iterations=iterations)], log.logger.out, False, None, backend)
+    elapsed = time.perf_counter() - start
+    out = "".join("".join(x) for x in log.logger._out)
+    assert out.endswith("done\n"), out
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--backends", nargs="*", default=["headless", "compiled", "iterative"])
+    args = parser.parse_args()
+
+    for backend in args.backends:
+        elapsed = run(args.iterations, backend)
+        print(f"{backend:10} {args.iterations} iterations  {elapsed:7.2f}s  {args.iterations / elapsed:10.0f} / s")
+
+
+if __name__ == "__main__":
+    main()
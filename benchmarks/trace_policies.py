@@ -0,0 +1,59 @@
+"""
+Time, peak memory and trace size of a visual run under each trace policy, for a program well past OP_LIMIT.
+Peak memory is measured by tracemalloc; the trace size is the logger's own estimate, which the budget bounds.
+
+    python benchmarks/trace_policies.py [--n N] [--budget BYTES]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "editor"))
+import execution
+import log
+
+FIB = "(define (fib n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))) (fib {n})"
+
+POLICIES = {
+    "first": {},
+    "first+last 2000": {"policy": "first", "last": 2000},
+    "all": {"policy": "all"},
+    "depth 10": {"policy": "depth", "depth": 10},
+    "sample 50": {"policy": "sample", "n": 50},
+}
+
+
+def run(code, policy):
+    log.logger = log.Logger()
+    log.logger.autodraw = False
+    log.announce = log.logger.log
+    log.logger.policy = policy
+    log.logger.new_query()
+    tracemalloc.start()
+    start = time.perf_counter()
+    execution.string_exec([code], log.logger.out, False, None, "visual")
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=15)
+    parser.add_argument("--budget", type=int, default=log.TRACE_BUDGET)
+    args = parser.parse_args()
+
+    for name, params in POLICIES.items():
+        elapsed, peak = run(FIB.format(n=args.n), log.make_policy(**params, budget=args.budget))
+        steps = log.logger.i
+        size = len(json.dumps(log.logger.export("delta")["tree"]))
+        print(f"{name:16} {elapsed:7.2f}s  peak {peak / 2 ** 20:7.1f} MiB  trace {log.logger.trace_bytes / 2 ** 20:6.1f} MiB"
+              f"  json {size / 2 ** 20:6.2f} MiB  {steps} steps")
+
+
+if __name__ == "__main__":
+    main()
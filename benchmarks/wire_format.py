@@ -0,0 +1,65 @@
+"""
+Bytes and encode time of the /process2 responses to the queries of the test corpus (editor_tests/scm_tests),
+in JSON and in MessagePack (see wire.py), for both tree formats.
+
+    python benchmarks/wire_format.py [--repeat N]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "editor"))
+sys.path.append(os.path.join(ROOT, "editor_tests"))
+sys.path.append(os.path.join(ROOT, "editor_tests", "scm_tests"))
+import execution
+import log
+import wire
+
+
+def responses(tree_format):
+    out = []
+    for file in sorted(os.listdir(os.path.join(ROOT, "editor_tests", "scm_tests"))):
+        if not file.startswith("case"):
+            continue
+        for case in __import__(file[:-3]).cases:
+            log.logger = log.Logger()
+            log.logger.autodraw = False
+            log.announce = log.logger.log
+            global_frame = None
+            for query in case.queries:
+                log.logger.new_query(global_frame and log.logger.frame_lookup[id(global_frame)])
+                try:
+                    execution.string_exec(["\n".join(query.code)], log.logger.out, False, global_frame, "visual")
+                except Exception:
+                    continue
+                response = log.logger.export(tree_format)
+                if global_frame is None and response["globalFrameID"] != -1:
+                    global_frame = log.logger.frame_lookup[response["globalFrameID"]].base
+                out.append(response)
+    return out
+
+
+def measure(payloads, wire_format, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        size = sum(len(wire.encode(payload, wire_format)) for payload in payloads)
+    return size, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for tree_format in ["states", "delta"]:
+        payloads = responses(tree_format)
+        json_size, json_time = measure(payloads, "json", args.repeat)
+        msgpack_size, msgpack_time = measure(payloads, "msgpack", args.repeat)
+        print(f"{tree_format:7} {len(payloads)} responses   json {json_size / 1024:8.1f} KiB {json_time * 1000:7.1f} ms   "
+              f"msgpack {msgpack_size / 1024:8.1f} KiB {msgpack_time * 1000:7.1f} ms   {msgpack_size / json_size:6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 import argparse
 import json
 import os
+import threading
 from difflib import unified_diff
 
 import local_server
 import log
+import profiler
 from formatter import prettify
 
 
@@ -23,6 +25,18 @@ def reformat_files(src, dest=None, check=False):
     exit()
 
 
+def profile_file(src, limit):
+    with open(src) as src:
+        code = src.read()
+    log.logger.autodraw = False
+    result = local_server.handle([code], 0, 0, -1, False, threading.Event(), backend="headless", profile=True)
+    print("".join(result["out"]), end="")
+    if not result["success"]:
+        exit(1)
+    print(profiler.report(result["profile"], limit))
+    exit()
+
+
 parser = argparse.ArgumentParser(description="MiScheme Editor - Winter 2025")
 
 parser.add_argument("-f", "--files",
@@ -48,6 +62,27 @@ parser.add_argument("-r", "--reformat",
 parser.add_argument("-c", "--check",
                     help="Only check if formatting is correct, do not update.",
                     action="store_true")
+parser.add_argument("--profile",
+                    type=str,
+                    help="Runs file and prints the time spent in its special forms, builtins and procedures.",
+                    metavar="FILE")
+parser.add_argument("--profile-rows",
+                    type=int,
+                    default=30,
+                    help="The number of rows of the profile to print.")
+parser.add_argument("--spill-dir",
+                    type=str,
+                    help="Keep the substitution trees of long runs in files in this directory rather than in memory.",
+                    metavar="DIR")
+parser.add_argument("--workers",
+                    type=int,
+                    default=0,
+                    help="Run code in this many worker processes, so that several clients can use more than one core.",
+                    metavar="N")
+parser.add_argument("--async",
+                    dest="asynchronous",
+                    help="Serve on asyncio, keeping connections alive, rather than in a thread per request.",
+                    action="store_true")
 args = parser.parse_args()
 
 if args.reformat is not None:
@@ -55,6 +90,10 @@ if args.reformat is not None:
 
 
 log.logger.dotted = not args.no_dotted
+if args.spill_dir is not None:
+    log.logger.spill_to(args.spill_dir)
+if args.profile is not None:
+    profile_file(args.profile, args.profile_rows)
 
 scheme_files = [f for f in os.listdir(os.curdir) if f.endswith(".scm")]
 
@@ -73,4 +112,4 @@ else:
         with open("scratch.scm", "w"):
             pass
         file_names = ["scratch.scm"]
-local_server.start(file_names, args.port, not args.nobrowser)
+local_server.start(file_names, args.port, not args.nobrowser, args.workers, args.asynchronous)
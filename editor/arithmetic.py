@@ -2,7 +2,8 @@ import itertools
 import math
 from typing import List
 
-from datamodel import Expression, Number, bools, SingletonFalse, ValueHolder, Pair, SingletonTrue, Character, String, Vector
+from datamodel import Expression, Number, bools, SingletonFalse, ValueHolder, Pair, SingletonTrue, Character, String, Vector, \
+    Symbol
 from environment import global_attr
 from evaluate_apply import Frame
 from helper import assert_all_numbers, verify_exact_callable_length, verify_min_callable_length
@@ -182,7 +183,8 @@ class IsEq(BuiltIn):
     def execute_evaluated(self, operands: List[Expression], frame: Frame):
         verify_exact_callable_length(self, 2, len(operands))
         if all(isinstance(x, ValueHolder) for x in operands):
-            if isinstance(operands[0], (Number, Character, String)):
+            # identity, so small exact integers and characters are eq? to equal ones, as they are flyweights
+            if isinstance(operands[0], (Number, Character, String, Symbol)):
                 return bools[operands[0] is operands[1]]
             else:
                 return bools[operands[0].value == operands[1].value]
@@ -0,0 +1,335 @@
+import asyncio
+import base64
+import functools
+import hashlib
+import json
+import socket
+import struct
+import threading
+import traceback
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import local_server
+import wire
+
+# answered on the event loop, since they are quick and never wait for code to run
+ON_LOOP = {"/documentation", "/list_files", "/read_file"}
+
+EXECUTOR_THREADS = 64  # the most requests that run code, or wait for it, at once
+
+MAX_BODY_SIZE = 16 * 1024 * 1024  # the largest request body or WebSocket message that is read into memory
+
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+class Request:
+    def __init__(self, method: str, path: str, version: str, headers: dict, body: bytes):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers  # by lowercase name
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.1":
+            return connection != "close"
+        return connection == "keep-alive"
+
+
+class Server:
+    """
+    An HTTP/1.1 server on asyncio, which can take the place of local_server.ThreadedHTTPServer.
+    Connections are kept alive between requests. Static files and the requests in ON_LOOP are answered on the
+    event loop, and the others, which run code or wait for it, in a pool of threads.
+    A GET of /socket opens a WebSocket, which runs the code in each message it gets, and pushes its output back
+    as /process_stream would send it, see Server.socket_channel.
+    """
+
+    def __init__(self, address, threads=EXECUTOR_THREADS):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # as HTTPServer does
+        self.socket.bind(address)  # raises OSError if the port is in use
+        self.socket.listen()
+        self.server_address = self.socket.getsockname()
+        self.executor = ThreadPoolExecutor(threads)
+        self.loop: asyncio.AbstractEventLoop = None
+        self.stopped: asyncio.Event = None
+        self.started = threading.Event()
+        self.done = threading.Event()
+        self.connections = {}  # the writer of each open connection, by the task that serves it
+
+    def serve_forever(self):
+        # the loop is set for the thread, which asyncio objects made without one use before Python 3.10
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.serve())
+        finally:
+            self.loop.close()
+            self.done.set()
+
+    async def serve(self):
+        self.stopped = asyncio.Event()
+        self.started.set()
+        server = await asyncio.start_server(self.connection, sock=self.socket)
+        try:
+            await self.stopped.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+        # connections waiting for their next request end once they are closed, and the others are canceled
+        for writer in self.connections.values():
+            writer.close()
+        if self.connections:
+            await asyncio.wait(list(self.connections), timeout=1)
+        for task in list(self.connections):
+            task.cancel()
+        if self.connections:
+            await asyncio.wait(list(self.connections))
+        self.executor.shutdown(wait=False)
+
+    def shutdown(self):
+        # stops serve_forever from another thread, and waits for it to return, like socketserver's
+        self.started.wait()
+        self.loop.call_soon_threadsafe(self.stopped.set)
+        self.done.wait()
+
+    def server_close(self):
+        self.socket.close()
+
+    def connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # called by start_server for each connection, which is served in a task of its own
+        task = self.loop.create_task(self.serve_connection(reader, writer))
+        self.connections[task] = writer
+        task.add_done_callback(self.connections.pop)
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # asyncio only disables Nagle's algorithm for sockets made with IPPROTO_TCP, which self.socket is not
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except PayloadTooLarge:
+                    send_response(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "text/plain", b"", False)
+                    await writer.drain()
+                    return
+                if request is None:
+                    return
+                if request.method == "GET" and request.headers.get("upgrade", "").lower() == "websocket":
+                    await self.socket_channel(request, reader, writer)
+                    return
+                try:
+                    await self.handle(request, writer)
+                except ConnectionError:
+                    return
+                except Exception:
+                    traceback.print_exc()
+                    send_response(writer, HTTPStatus.INTERNAL_SERVER_ERROR, "text/plain", b"", False)
+                    return
+                await writer.drain()
+                if not request.keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            return
+        finally:
+            writer.close()
+
+    async def handle(self, request: Request, writer: asyncio.StreamWriter):
+        if request.method == "GET":
+            status, headers, body = local_server.static_file(request.path, request.headers)
+            send_head(writer, status, headers, request.keep_alive, body)
+            return
+        if request.method != "POST":
+            send_response(writer, HTTPStatus.NOT_IMPLEMENTED, "text/plain", b"", request.keep_alive)
+            return
+
+        data = urllib.parse.parse_qs(request.body.decode("ascii"))
+        if request.path == "/process_stream":
+            await self.stream(request, data, writer)
+            return
+        if request.path in ON_LOOP:
+            content_type, body = local_server.respond(request.path, data)
+        else:
+            content_type, body = await self.loop.run_in_executor(
+                self.executor, local_server.respond, request.path, data, request.headers.get("accept"))
+        send_response(writer, HTTPStatus.OK, content_type, body, request.keep_alive)
+        if request.path == "/kill":
+            await writer.drain()
+            self.stopped.set()
+
+    async def run_stream(self, data: dict, send):
+        # runs a /process_stream of data in the executor, and awaits send with each chunk that it writes
+        chunks = asyncio.Queue()
+        args, kwargs = local_server.stream_args(data)
+        run = self.loop.run_in_executor(self.executor, functools.partial(
+            local_server.dispatch, local_server.session_id(data), "run_stream", *args,
+            write=lambda chunk: self.loop.call_soon_threadsafe(chunks.put_nowait, chunk), **kwargs))
+        run.add_done_callback(lambda _: chunks.put_nowait(None))
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                await send(chunk)
+        except ConnectionError:  # the client went away
+            await self.loop.run_in_executor(self.executor, local_server.dispatch,
+                                            local_server.session_id(data), "cancel")
+            raise
+        await run
+
+    async def stream(self, request: Request, data: dict, writer: asyncio.StreamWriter):
+        # answers /process_stream in chunks, as local_server.Handler.stream_process does
+        wire_format = wire.negotiate(request.headers.get("accept"))
+        send_head(writer, HTTPStatus.OK, [("Content-Type", local_server.STREAM_CONTENT_TYPES[wire_format]),
+                                          ("Transfer-Encoding", "chunked")], request.keep_alive)
+
+        async def send(chunk):
+            line = local_server.encode_chunk(chunk, wire_format)
+            writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+            await writer.drain()
+
+        await self.run_stream(data, send)
+        writer.write(b"0\r\n\r\n")
+
+    async def socket_channel(self, request: Request, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Runs a WebSocket, on which the client sends the parameters of /process_stream or of /cancel as JSON
+        objects, with the path in "path" ("/process_stream" if left out), and the server pushes each chunk of
+        output back as a JSON text message. Runs sent while one is running wait for it, as they do in a session.
+        """
+        key = request.headers.get("sec-websocket-key", "").encode("ascii")
+        accept = base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID).digest()).decode("ascii")
+        send_head(writer, HTTPStatus.SWITCHING_PROTOCOLS,
+                  [("Upgrade", "websocket"), ("Connection", "Upgrade"), ("Sec-WebSocket-Accept", accept)], None)
+        await writer.drain()
+
+        send_lock = asyncio.Lock()
+
+        async def send(chunk):
+            async with send_lock:
+                write_frame(writer, 0x1, json.dumps(chunk).encode("utf-8"))
+                await writer.drain()
+
+        async def run(message):
+            data = {key: [val if isinstance(val, str) else json.dumps(val) for val in
+                          (vals if isinstance(vals, list) else [vals])] for key, vals in message.items()}
+            path = message.get("path", "/process_stream")
+            try:
+                if path == "/process_stream":
+                    await self.run_stream(data, send)
+                else:
+                    await self.loop.run_in_executor(self.executor, local_server.respond, path, data)
+            except ConnectionError:
+                pass
+            except Exception:
+                traceback.print_exc()
+
+        tasks = set()
+        try:
+            while True:
+                opcode, payload = await read_message(reader)
+                if opcode == 0x8:  # close
+                    async with send_lock:
+                        write_frame(writer, 0x8, payload[:2])
+                        await writer.drain()
+                    return
+                if opcode == 0x9:  # ping
+                    async with send_lock:
+                        write_frame(writer, 0xA, payload)
+                        await writer.drain()
+                elif opcode == 0x1:
+                    task = asyncio.ensure_future(run(json.loads(payload.decode("utf-8"))))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        except PayloadTooLarge:
+            async with send_lock:
+                write_frame(writer, 0x8, struct.pack(">H", 1009))  # Message Too Big
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def read_request(reader: asyncio.StreamReader):
+    # the next request on a connection, or None if the client closed it
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")[:-2]
+    method, target, version = request_line.split(" ", 2)
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_SIZE:
+        raise PayloadTooLarge
+    body = await reader.readexactly(length)
+    return Request(method, urllib.parse.unquote(target), version, headers, body)
+
+
+def send_head(writer: asyncio.StreamWriter, status: HTTPStatus, headers: list, keep_alive, body=b""):
+    # keep_alive is None if the response sets its own Connection header
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+    lines += [f"{name}: {value}" for name, value in headers]
+    if keep_alive is not None:
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+    # in one write with the body, since a segment written on its own can wait for the client's delayed ack
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+
+
+def send_response(writer: asyncio.StreamWriter, status: HTTPStatus, content_type, body: bytes, keep_alive: bool):
+    headers = [("Content-Length", len(body))]
+    if content_type is not None:
+        headers.append(("Content-Type", content_type))
+    send_head(writer, status, headers, keep_alive, body)
+
+
+async def read_message(reader: asyncio.StreamReader):
+    # the opcode and payload of the next WebSocket message, joining the frames of fragmented ones, which raises
+    # PayloadTooLarge before reading a frame that would make it larger than MAX_BODY_SIZE
+    opcode, payload = None, b""
+    while True:
+        first, second = await reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length, = struct.unpack(">H", await reader.readexactly(2))
+        elif length == 127:
+            length, = struct.unpack(">Q", await reader.readexactly(8))
+        if len(payload) + length > MAX_BODY_SIZE:
+            raise PayloadTooLarge
+        mask = await reader.readexactly(4) if second & 0x80 else None
+        data = await reader.readexactly(length)
+        if mask is not None:
+            mask = (mask * (length // 4 + 1))[:length]
+            data = (int.from_bytes(data, "big") ^ int.from_bytes(mask, "big")).to_bytes(length, "big")
+        if first & 0x0F >= 0x8:  # control frames may come between the fragments of a message
+            return first & 0x0F, data
+        if opcode is None:
+            opcode = first & 0x0F
+        payload += data
+        if first & 0x80:  # the last fragment
+            return opcode, payload
+
+
+def write_frame(writer: asyncio.StreamWriter, opcode: int, payload: bytes):
+    length = len(payload)
+    if length < 126:
+        head = struct.pack(">BB", 0x80 | opcode, length)
+    elif length < 2 ** 16:
+        head = struct.pack(">BBH", 0x80 | opcode, 126, length)
+    else:
+        head = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+    writer.write(head + payload)
@@ -0,0 +1,666 @@
+import typing
+from operator import attrgetter
+from typing import List, Optional
+
+import log
+from datamodel import Expression, Symbol, Pair, Undefined, Promise, SingletonTrue, SingletonFalse, Nil, Vector
+from environment import special_forms
+from evaluate_apply import Frame, SlotVars, Thunk, Callable, Applicable, evaluate_headless, add_return_frame, \
+    assign_return
+from helper import pair_to_list, make_list, verify_exact_callable_length, verify_min_callable_length
+from lists import Memv
+from log import fake_obj, MAX_TRACEBACK_LENGTH
+from primitives import BuiltIn
+from scheme_exceptions import OperandDeduceError, CallableResolutionError, SchemeError
+from special_forms import ProcedureObject, ProcedureBuilder, MacroObject, Lambda, Mu, Macro, Define, DefineMacro, \
+    Set, Begin, If, Quote, Cond, Let, LetStar, Case, Delay, begin_symbol, else_symbol
+
+# Syntactic analysis ("compile once, run many") backend for non-visual evaluation.
+# A parsed expression is turned into a tree of Python closures, each taking the frame to run in.
+# Special forms are resolved during analysis, so running the closures never re-inspects the source.
+# Anything the analyzer does not handle, including malformed special forms, is handed to evaluate_headless
+# when it is reached, so that errors are raised at the same point and with the same message as the interpreter.
+#
+# Variables bound by a lambda or let are resolved during analysis to a lexical address: the number of frames
+# to go up and a slot in that frame (see SlotVars). Names that can be bound in ways analysis cannot see, by eval,
+# a macro expansion, or the dynamic scoping of mu, fall back to lookup by name, so resolution never changes behavior.
+
+Code = typing.Callable[[Frame], Expression]
+
+analyzers = {}
+
+
+def analyzer(name):
+    def decorator(func):
+        analyzers[name] = func
+        return func
+
+    return decorator
+
+
+class TailCall:
+    # frame is the new frame of the call if operator is a ProcedureObject, otherwise the frame of the caller
+    def __init__(self, expr: Pair, operator: Applicable, operands: List[Expression], frame: Frame,
+                 caller: Frame):
+        self.expr = expr
+        self.operator = operator
+        self.operands = operands
+        self.frame = frame
+        # the call and the special forms in tail position it was returned through, innermost first, for tracebacks
+        self.contexts = [(expr, caller)]
+        # the frames of the lets it was returned through, innermost first, which are given its value
+        self.return_frames = []
+
+
+class Scope:
+    """
+    The names a frame made for a lambda or let can bind, numbered by slot.
+    Besides the parameters, these are the names of every define form in the body, whether or not it runs.
+    parent is None if the enclosing frame is not known when analyzing, and dynamic is set for mu,
+    whose frames have the caller's frame as parent.
+    """
+    def __init__(self, names: List[str], body: List[Expression], parent: Optional['Scope'], dynamic: bool = False):
+        self.layout = {}
+        for name in names:
+            self.layout.setdefault(name, len(self.layout))
+        for expr in body:
+            scan_defines(expr, self.layout)
+        self.parent = parent
+        self.dynamic = dynamic
+
+
+def scan_defines(expr: Expression, layout: typing.Dict[str, int]):
+    if not isinstance(expr, Pair):
+        return
+    operator = expr.first
+    if isinstance(operator, Symbol):
+        if operator.value in ("lambda", "mu", "quote"):
+            return
+        if operator.value in ("define", "define-macro") and isinstance(expr.rest, Pair):
+            target = expr.rest.first
+            if isinstance(target, Pair):
+                target = target.first
+                if isinstance(target, Symbol):
+                    layout.setdefault(target.value, len(layout))
+                return
+            if isinstance(target, Symbol):
+                layout.setdefault(target.value, len(layout))
+    while isinstance(expr, Pair):
+        scan_defines(expr.first, layout)
+        expr = expr.rest
+
+
+def resolve(scope: Optional[Scope], name: str) -> typing.Tuple[int, Optional[int]]:
+    """
+    Returns how many frames up name is bound, and in which slot.
+    If the slot is None, name is not bound by any frame known to the analysis, and is looked up by name from there.
+    """
+    depth = 0
+    while scope is not None:
+        index = scope.layout.get(name)
+        if index is not None:
+            return depth, index
+        depth += 1
+        if scope.dynamic:
+            break
+        scope = scope.parent
+    return depth, None
+
+
+def enclosing(frame: Frame, depth: int, name: str) -> Optional[Frame]:
+    # None if one of the frames skipped over was given a binding for name at runtime, e.g. by eval
+    for _ in range(depth):
+        extras = frame.vars.extras
+        if extras is not None and name in extras:
+            return None
+        frame = frame.parent
+    return frame
+
+
+class CompiledBody:
+    """The body of a procedure, analyzed on its first call and shared by every procedure made by one lambda."""
+    def __init__(self, exprs: List[Expression], scope: Scope):
+        self.exprs = exprs
+        self.scope = scope
+        self.code: Optional[Code] = None
+
+    def compile(self) -> Code:
+        self.code = analyze_sequence(self.exprs, True, self.scope)
+        if len(self.exprs) > 1:
+            # the interpreter runs such bodies as a begin form, which shows up in tracebacks
+            self.code = traced(make_list([begin_symbol] + self.exprs), self.code, True)
+        return self.code
+
+
+def analyze(expr: Expression, tail: bool = False, scope: Optional[Scope] = None) -> Code:
+    """
+    Compiles expr into a closure that evaluates it in a given frame, made for scope if that is known.
+    If tail is set, calls in tail position return a TailCall instead of being made.
+    """
+    if isinstance(expr, Symbol):
+        return analyze_symbol(expr, scope)
+    elif isinstance(expr, Pair):
+        operator = expr.first
+        if isinstance(operator, Symbol) and operator.value in special_forms:
+            if operator.value in analyzers:
+                try:
+                    return traced(expr, analyzers[operator.value](expr, pair_to_list(expr.rest), tail, scope), tail)
+                except SchemeError:
+                    pass  # malformed, so let the interpreter raise the error once it is reached
+            return interpret(expr)
+        return analyze_application(expr, tail, scope)
+    elif isinstance(expr, Vector):
+        return interpret(expr)
+    else:
+        return analyze_constant(expr)
+
+
+def analyze_constant(expr: Expression) -> Code:
+    def run(frame):
+        return expr
+
+    return run
+
+
+def analyze_symbol(expr: Symbol, scope: Optional[Scope]) -> Code:
+    depth, index = resolve(scope, expr.value)
+    name = expr.value
+    up = attrgetter(".".join(["parent"] * depth)) if depth else None
+
+    if index is None and up is None:
+        def run(frame):
+            try:
+                return frame.lookup(expr)
+            except SchemeError:
+                trace(expr, frame)
+                raise
+    elif index is None:
+        def run(frame):
+            try:
+                target = enclosing(frame, depth, name) if SlotVars.extended else up(frame)
+                return (frame if target is None else target).lookup(expr)
+            except SchemeError:
+                trace(expr, frame)
+                raise
+    else:
+        def run(frame):
+            target = frame if up is None else enclosing(frame, depth, name) if SlotVars.extended else up(frame)
+            if target is not None:
+                value = target.vars.slots[index]
+                if value is not None:
+                    return value
+            try:
+                return frame.lookup(expr)
+            except SchemeError:
+                trace(expr, frame)
+                raise
+
+    return run
+
+
+def analyze_sequence(exprs: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    codes = [analyze(expr, False, scope) for expr in exprs[:-1]]
+    last = analyze(exprs[-1], tail, scope)
+    if not codes:
+        return last
+
+    def run(frame):
+        for code in codes:
+            code(frame)
+        return last(frame)
+
+    return run
+
+
+def analyze_application(expr: Pair, tail: bool, scope: Optional[Scope]) -> Code:
+    try:
+        operand_exprs = pair_to_list(expr.rest)
+    except OperandDeduceError:
+        return interpret(expr)
+    operator_code = analyze(expr.first, False, scope)
+    operand_codes = [analyze(operand, False, scope) for operand in operand_exprs]
+
+    def run(frame):
+        try:
+            operator = operator_code(frame)
+            if isinstance(operator, Applicable):
+                # like the interpreter, make the new frame before evaluating the operands, so frames are numbered alike
+                new_frame = new_frame_for(operator, frame) if isinstance(operator, ProcedureObject) else frame
+                operands = [code(frame) for code in operand_codes]
+                if tail:
+                    return TailCall(expr, operator, operands, new_frame, frame)
+                return call(operator, operands, new_frame)
+            elif isinstance(operator, MacroObject):
+                out = analyze(expand(operator, operand_exprs, frame), tail)(frame)
+                if isinstance(out, TailCall):
+                    out.contexts.append((expr, frame))
+                return out
+            elif isinstance(operator, Callable):
+                return complete(operator.execute(list(operand_exprs), frame, fake_obj))
+            elif isinstance(operator, Symbol):
+                raise CallableResolutionError(f"Unable to pass parameters into the Symbol '{operator}'")
+            else:
+                raise CallableResolutionError(f"Unable to pass parameters into: '{operator}'")
+        except Exception:
+            trace(expr, frame)
+            raise
+
+    return run
+
+
+def interpret(expr: Expression) -> Code:
+    def run(frame):
+        return evaluate_headless(expr, frame)
+
+    return run
+
+
+def call(operator: Applicable, operands: List[Expression], frame: Frame) -> Expression:
+    # frame is as described for TailCall.frame
+    # chain holds the tail calls made so far and the special forms they were returned through, as the
+    # interpreter keeps them for tracebacks: the first MAX_TRACEBACK_LENGTH - 1 and the latest.
+    # return_frames holds the frames given the value of the last call, as evaluate_headless gives it to them
+    chain = []
+    omitted = 0
+    return_frames = None
+    while True:
+        try:
+            if isinstance(operator, ProcedureObject):
+                out = body_code(operator)(bind(operator, operands, frame))
+                return_frames = add_return_frame(frame, return_frames)
+            elif isinstance(operator, BuiltIn):
+                out = operator.execute_evaluated(operands, frame)
+            else:
+                out = operator.execute(operands, frame, fake_obj, False)
+                if isinstance(out, Thunk):
+                    if out.return_frame is not None:
+                        return_frames = add_return_frame(out.return_frame, return_frames)
+                    out = analyze(out.expr, True)(out.frame)
+        except Exception:
+            log.logger.eval_stack[:0] = chain
+            log.logger.eval_omitted += omitted
+            raise
+        if not isinstance(out, TailCall):
+            assign_return(return_frames, out)
+            return out
+        for return_frame in reversed(out.return_frames):
+            return_frames = add_return_frame(return_frame, return_frames)
+        for context in reversed(out.contexts):
+            if len(chain) == MAX_TRACEBACK_LENGTH:
+                chain[-1] = context
+                omitted += 1
+            else:
+                chain.append(context)
+        operator, operands, frame = out.operator, out.operands, out.frame
+
+
+def complete(out: Expression) -> Expression:
+    if isinstance(out, Thunk):
+        return_frame = out.return_frame
+        out = analyze(out.expr)(out.frame)
+        if return_frame is not None:
+            return_frame.assign(log.return_symbol, out)
+    return out
+
+
+def compiled_body(procedure: ProcedureObject) -> CompiledBody:
+    body = procedure.compiled_body
+    if body is None:
+        # made by the interpreter, so nothing is known about the frame it was made in
+        scope = procedure_scope(procedure.params, procedure.var_param, procedure.body, None,
+                                not procedure.lexically_scoped)
+        body = procedure.compiled_body = CompiledBody(procedure.body, scope)
+    return body
+
+
+def body_code(procedure: ProcedureObject) -> Code:
+    body = compiled_body(procedure)
+    return body.code or body.compile()
+
+
+def new_frame_for(procedure: ProcedureObject, frame: Frame) -> Frame:
+    body = procedure.compiled_body or compiled_body(procedure)
+    return Frame(procedure.name, procedure.frame if procedure.lexically_scoped else frame, SlotVars(body.scope.layout))
+
+
+def procedure_scope(params: List[Symbol], var_param: Optional[Symbol], body: List[Expression],
+                    parent: Optional[Scope], dynamic: bool) -> Scope:
+    names = [param.value for param in params]
+    if var_param:
+        names.append(var_param.value)
+    return Scope(names, body, parent, dynamic)
+
+
+def bind(procedure: ProcedureObject, operands: List[Expression], new_frame: Frame) -> Frame:
+    if procedure.var_param:
+        verify_min_callable_length(procedure, len(procedure.params), len(operands))
+    else:
+        verify_exact_callable_length(procedure, len(procedure.params), len(operands))
+    for param, value in zip(procedure.params, operands):
+        new_frame.assign(param, value)
+    if procedure.var_param:
+        new_frame.assign(procedure.var_param, make_list(operands[len(procedure.params):]))
+    return new_frame
+
+
+def expand(macro: MacroObject, operands: List[Expression], frame: Frame) -> Expression:
+    new_frame = bind(macro, operands, new_frame_for(macro, frame))
+    out = body_code(macro)(new_frame)
+    if isinstance(out, TailCall):
+        tail_call = out
+        try:
+            out = call(tail_call.operator, tail_call.operands, tail_call.frame)
+        except Exception:
+            log.logger.eval_stack[:0] = reversed(tail_call.contexts)
+            raise
+        for return_frame in tail_call.return_frames:
+            return_frame.assign(log.return_symbol, out)
+    new_frame.assign(log.return_symbol, out)
+    return out
+
+
+def traced(expr: Expression, code: Code, tail: bool = False) -> Code:
+    if tail:
+        def run(frame):
+            try:
+                out = code(frame)
+            except Exception:
+                trace(expr, frame)
+                raise
+            if isinstance(out, TailCall):
+                out.contexts.append((expr, frame))
+            return out
+    else:
+        def run(frame):
+            try:
+                return code(frame)
+            except Exception:
+                trace(expr, frame)
+                raise
+
+    return run
+
+
+def trace(expr: Expression, frame: Frame):
+    # Called while an error unwinds, so outer expressions are reached last but belong at the bottom of the stack
+    log.logger.eval_stack.insert(0, (expr, frame))
+
+
+def analyze_procedure(builder: ProcedureBuilder, operands: List[Expression], scope: Optional[Scope],
+                      name: str = None) -> Code:
+    verify_min_callable_length(builder, 2, len(operands))
+    params, var_param = builder.parse_params(operands[0])
+    dynamic = not builder.procedure.lexically_scoped
+    body = CompiledBody(operands[1:], procedure_scope(params, var_param, operands[1:], scope, dynamic))
+    name_arg = (name,) if name else ()
+    procedure = builder.procedure
+
+    def run(frame):
+        out = procedure(params, var_param, body.exprs, frame, *name_arg)
+        out.compiled_body = body
+        return out
+
+    return run
+
+
+@analyzer("lambda")
+def analyze_lambda(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    return analyze_procedure(Lambda(), operands, scope)
+
+
+@analyzer("mu")
+def analyze_mu(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    return analyze_procedure(Mu(), operands, scope)
+
+
+@analyzer("define-macro")
+def analyze_define_macro(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    verify_min_callable_length(DefineMacro(), 2, len(operands))
+    target = operands[0]
+    if not isinstance(target, Pair) or not isinstance(target.first, Symbol):
+        raise OperandDeduceError(f"Expected a Pair, not {target}, as the first operand of define-macro.")
+    name = target.first
+    value = analyze_procedure(Macro(), [target.rest] + operands[1:], scope, name.value)
+
+    def run(frame):
+        frame.assign(name, value(frame))
+        return name
+
+    return run
+
+
+@analyzer("define")
+def analyze_define(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    verify_min_callable_length(Define(), 2, len(operands))
+    target = operands[0]
+    if isinstance(target, Symbol):
+        verify_exact_callable_length(Define(), 2, len(operands))
+        name = target
+        value = analyze(operands[1], False, scope)
+    elif isinstance(target, Pair) and isinstance(target.first, Symbol):
+        name = target.first
+        value = analyze_procedure(Lambda(), [target.rest] + operands[1:], scope, name.value)
+    else:
+        raise OperandDeduceError(f"Expected a Pair, not {target}, as the first operand of define.")
+
+    def run(frame):
+        frame.assign(name, value(frame))
+        return name
+
+    return run
+
+
+@analyzer("set!")
+def analyze_set(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    verify_exact_callable_length(Set(), 2, len(operands))
+    name = operands[0]
+    if not isinstance(name, Symbol):
+        raise OperandDeduceError(f"Expected a Symbol, not {name}, as the first operand of set!")
+    value = analyze(operands[1], False, scope)
+    depth, _ = resolve(scope, name.value)
+
+    def run(frame):
+        new_value = value(frame)
+        target = enclosing(frame, depth, name.value)
+        (frame if target is None else target).mutate(name, new_value)
+        return Undefined
+
+    return run
+
+
+@analyzer("begin")
+def analyze_begin(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    verify_min_callable_length(Begin(), 1, len(operands))
+    return analyze_sequence(operands, tail, scope)
+
+
+@analyzer("if")
+def analyze_if(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    verify_min_callable_length(If(), 2, len(operands))
+    if len(operands) > 3:
+        verify_exact_callable_length(If(), 3, len(operands))
+    predicate = analyze(operands[0], False, scope)
+    consequent = analyze(operands[1], tail, scope)
+
+    if len(operands) == 2:
+        def run(frame):
+            if predicate(frame) is SingletonFalse:
+                return Undefined
+            return consequent(frame)
+    else:
+        alternative = analyze(operands[2], tail, scope)
+
+        def run(frame):
+            if predicate(frame) is SingletonFalse:
+                return alternative(frame)
+            return consequent(frame)
+
+    return run
+
+
+@analyzer("quote")
+def analyze_quote(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    verify_exact_callable_length(Quote(), 1, len(operands))
+    return analyze_constant(operands[0])
+
+
+@analyzer("cond")
+def analyze_cond(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    verify_min_callable_length(Cond(), 1, len(operands))
+    clauses = []
+    for i, clause in enumerate(operands):
+        if not isinstance(clause, Pair):
+            raise OperandDeduceError(f"Unable to evaluate clause of cond, as {clause} is not a Pair.")
+        expanded = pair_to_list(clause)
+        if expanded[0] is else_symbol:
+            if i != len(operands) - 1 or len(expanded) < 2:
+                raise OperandDeduceError("Ill-formed else clause.")
+            predicate = None
+        else:
+            predicate = analyze(expanded[0], False, scope)
+        body = analyze_sequence(expanded[1:], tail, scope) if len(expanded) > 1 else None
+        clauses.append((predicate, body))
+
+    def run(frame):
+        for predicate, body in clauses:
+            if predicate is None:
+                return body(frame)
+            value = predicate(frame)
+            if value is not SingletonFalse:
+                return value if body is None else body(frame)
+        return Undefined
+
+    return run
+
+
+@analyzer("and")
+def analyze_and(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    if not operands:
+        return analyze_constant(SingletonTrue)
+    codes = [analyze(operand, False, scope) for operand in operands[:-1]]
+    last = analyze(operands[-1], tail, scope)
+
+    def run(frame):
+        for code in codes:
+            if code(frame) is SingletonFalse:
+                return SingletonFalse
+        return last(frame)
+
+    return run
+
+
+@analyzer("or")
+def analyze_or(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    if not operands:
+        return analyze_constant(SingletonFalse)
+    codes = [analyze(operand, False, scope) for operand in operands[:-1]]
+    last = analyze(operands[-1], tail, scope)
+
+    def run(frame):
+        for code in codes:
+            value = code(frame)
+            if value is not SingletonFalse:
+                return value
+        return last(frame)
+
+    return run
+
+
+def analyze_let(receiver: Callable, kind: str, operands: List[Expression], tail: bool, scope: Optional[Scope],
+                nest_frames: bool) -> Code:
+    verify_min_callable_length(receiver, 2, len(operands))
+    if not isinstance(operands[0], Pair) and operands[0] is not Nil:
+        raise OperandDeduceError(f"Expected first argument of {kind} to be a Pair, not {operands[0]}.")
+    names = []
+    values = []
+    name_set = set()
+    for binding in pair_to_list(operands[0]):
+        if not isinstance(binding, Pair):
+            raise OperandDeduceError(f"Expected binding to be a Pair, not {binding}.")
+        binding = pair_to_list(binding)
+        if len(binding) != 2 or not isinstance(binding[0], Symbol) or binding[0].value in name_set:
+            raise OperandDeduceError(f"Ill-formed binding in {kind}.")
+        name_set.add(binding[0].value)
+        names.append(binding[0])
+        values.append(binding[1])
+    # let* makes a frame per binding, each evaluating its value in the one before
+    scopes = []
+    if nest_frames and names:
+        for i, name in enumerate(names):
+            scopes.append(Scope([name.value], operands[1:] if i == len(names) - 1 else [], scopes[-1] if i else scope))
+        bindings = [(name, analyze(value, False, scopes[i - 1] if i else scope)) for i, (name, value)
+                    in enumerate(zip(names, values))]
+    else:
+        scopes.append(Scope([name.value for name in names], operands[1:], scope))
+        bindings = [(name, analyze(value, False, scope)) for name, value in zip(names, values)]
+    layouts = [new_scope.layout for new_scope in scopes]
+    body = analyze_sequence(operands[1:], tail, scopes[-1])
+    frame_name = f"anonymous {kind}"
+
+    def run(frame):
+        old_frame = frame
+        new_frame = Frame(frame_name, old_frame, SlotVars(layouts[0]))
+        for i, (name, value) in enumerate(bindings):
+            new_frame.assign(name, value(old_frame))
+            if nest_frames and i < len(bindings) - 1:
+                old_frame = new_frame
+                new_frame = Frame(frame_name, old_frame, SlotVars(layouts[i + 1]))
+        out = body(new_frame)
+        if isinstance(out, TailCall):
+            out.return_frames.append(new_frame)
+        else:
+            new_frame.assign(log.return_symbol, out)
+        return out
+
+    return run
+
+
+@analyzer("let")
+def analyze_plain_let(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    return analyze_let(Let(), "let", operands, tail, scope, False)
+
+
+@analyzer("let*")
+def analyze_let_star(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    return analyze_let(LetStar(), "let*", operands, tail, scope, True)
+
+
+@analyzer("case")
+def analyze_case(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    verify_min_callable_length(Case(), 2, len(operands))
+    key_code = analyze(operands[0], False, scope)
+    clauses = []
+    for i, clause in enumerate(operands[1:]):
+        if not isinstance(clause, Pair):
+            raise OperandDeduceError(f"Unable to evaluate clause of case, as {clause} is not a Pair.")
+        expanded = pair_to_list(clause)
+        if len(expanded) < 2:
+            raise OperandDeduceError(f"Case clause needs to have a length of at least two, received {clause}.")
+        if isinstance(expanded[0], Pair):
+            datums = expanded[0]
+        elif expanded[0] is else_symbol and i == len(operands) - 2:
+            datums = None
+        else:
+            raise OperandDeduceError(f"Case clause expected list, received {expanded[0]}")
+        clauses.append((datums, analyze_sequence(expanded[1:], tail, scope)))
+    memv = Memv()
+
+    def run(frame):
+        key = key_code(frame)
+        for datums, body in clauses:
+            if datums is None or memv.execute_evaluated([key, datums], frame) is not SingletonFalse:
+                return body(frame)
+        return Undefined
+
+    return run
+
+
+@analyzer("delay")
+def analyze_delay(expr: Pair, operands: List[Expression], tail: bool, scope: Optional[Scope]) -> Code:
+    verify_exact_callable_length(Delay(), 1, len(operands))
+    promised = operands[0]
+
+    def run(frame):
+        return Promise(promised, frame)
+
+    return run
@@ -1,4 +1,6 @@
-from typing import TYPE_CHECKING
+import threading
+from typing import TYPE_CHECKING, Dict, List
+from weakref import WeakValueDictionary
 
 from log_utils import get_id
 from scheme_exceptions import TypeMismatchError, ParseError
@@ -9,11 +11,15 @@ if TYPE_CHECKING:
 
 
 class Expression:
+    __slots__ = ("id",)
+
     def __init__(self):
         self.id = None
 
 
 class ValueHolder(Expression):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         super().__init__()
         self.value = value
@@ -23,23 +29,66 @@ class ValueHolder(Expression):
 
 
 class Symbol(ValueHolder):
-    pass
+    """
+    Symbols are interned: Symbol(name) always returns the same instance for a given name,
+    so they can be compared by identity. The table holds them weakly, so that the names read by
+    sessions that have expired are dropped once no code or frame refers to them.
+    """
+    __slots__ = ("__weakref__",)
+    table: 'WeakValueDictionary[str, Symbol]' = WeakValueDictionary()
+    lock = threading.Lock()  # sessions run in several threads, and a WeakValueDictionary is not updated atomically
+
+    def __new__(cls, value: str):
+        symbol = cls.table.get(value)
+        if symbol is None:
+            with cls.lock:
+                symbol = cls.table.get(value)
+                if symbol is None:
+                    symbol = cls.table[value] = super().__new__(cls)
+                    ValueHolder.__init__(symbol, value)
+        return symbol
+
+    def __init__(self, value: str):
+        pass  # already initialized by __new__
+
+
+SMALL_INTS = range(-128, 1024)
 
 
 class Number(ValueHolder):
-    def __init__(self, value, *, force_float=False):
-        super().__init__(value)
-        if value == round(value) and not force_float:
-            self.value = round(value)
-        else:
-            self.value = value
+    """
+    Exact integers in SMALL_INTS are flyweights, like SingletonTrue and SingletonFalse,
+    so that counters and list indices don't allocate a new Number for every result.
+    Integral results of float arithmetic are rounded first, so that they are shared too,
+    but numbers written with a decimal point are not shared, as they are inexact literals.
+    """
+    __slots__ = ()
+
+    def __new__(cls, value, *, force_float=False, shared=True):
+        if type(value) is not int and value == round(value) and not force_float:
+            value = round(value)
+        if shared and type(value) is int:
+            number = small_ints.get(value)
+            if number is not None:
+                return number
+        number = super().__new__(cls)
+        ValueHolder.__init__(number, value)
+        return number
+
+    def __init__(self, value, *, force_float=False, shared=True):
+        pass  # already initialized by __new__
 
     def __repr__(self):
         return super().__repr__()
 
 
+small_ints: Dict[int, Number] = {}
+small_ints.update((i, Number(i)) for i in SMALL_INTS)
+
 
 class Pair(Expression):
+    __slots__ = ("first", "rest")
+
     def __init__(self, first: Expression, rest: Expression):
         import log
         super().__init__()
@@ -65,11 +114,15 @@ class Pair(Expression):
 
 
 class NilType(Expression):
+    __slots__ = ()
+
     def __repr__(self):
         return "()"
 
 
 class UndefinedType(Expression):
+    __slots__ = ()
+
     def __repr__(self):
         from log import logger
         if logger.strict_mode:
@@ -78,6 +131,8 @@ class UndefinedType(Expression):
 
 
 class Boolean(ValueHolder):
+    __slots__ = ()
+
     def __repr__(self):
         if self.value:
             return "#t"
@@ -86,11 +141,15 @@ class Boolean(ValueHolder):
 
 
 class String(ValueHolder):
+    __slots__ = ()
+
     def __repr__(self):
         return "\"" + self.value.replace("\n", "\\n").replace("\"", "\\\"").replace("\'", "'") + "\""
 
 
 class Promise(Expression):
+    __slots__ = ("forced", "force_i", "expr", "frame", "targets")
+
     def __init__(self, expr: Expression, frame: 'Frame'):
         super().__init__()
         self.forced = False
@@ -133,7 +192,11 @@ Undefined = UndefinedType()
 # EECS 390 additions
 
 class Character(ValueHolder):
-    def __init__(self, value):
+    """Characters are flyweights: Character(token) returns the same instance for every token naming one character."""
+    __slots__ = ()
+    table: Dict[str, 'Character'] = {}
+
+    def __new__(cls, value: str):
         if value.lower() == "#\\space":
             value = " "
         elif value.lower() == "#\\newline":
@@ -142,7 +205,16 @@ class Character(ValueHolder):
             raise ParseError(f"Unexpected token: '{value}'")
         else:
             value = value[-1]
-        super().__init__(value)
+        character = cls.table.get(value)
+        if character is None:
+            character = super().__new__(cls)
+            ValueHolder.__init__(character, value)
+            # sessions run in several threads, and setdefault gives all that make the same one at once the first
+            character = cls.table.setdefault(value, character)
+        return character
+
+    def __init__(self, value: str):
+        pass  # already initialized by __new__
 
     def __repr__(self):
         if self.value == " ":
@@ -153,9 +225,23 @@ class Character(ValueHolder):
 
 
 class Vector(Expression):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         super().__init__()
         self.value = value
 
     def __repr__(self):
         return f"#({' '.join(repr(item) for item in self.value)})"
+
+
+class MultipleValues(Expression):
+    # the values returned together by values, other than a single one
+    __slots__ = ("values",)
+
+    def __init__(self, values: List[Expression]):
+        super().__init__()
+        self.values = values
+
+    def __repr__(self):
+        return " ".join(map(repr, self.values))
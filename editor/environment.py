@@ -1,7 +1,10 @@
 import math
+import threading
 from typing import List
 
 import execution
+import log
+import session
 from datamodel import Symbol, Expression, Number
 from evaluate_apply import Frame
 from primitives import SingleOperandPrimitive, BuiltIn
@@ -53,7 +56,28 @@ def get_special_form(name: str):
         return None
 
 
+builtins: Frame = None  # the frame of the builtins, which is built once and shared, see build_global_frame
+builtins_lock = threading.Lock()
+
+
 def build_global_frame():
+    """
+    Returns a new global frame to run code in. Its parent, the frame of the builtins, is only built the first
+    time, and is shared by the global frames of all sessions since, so it is never changed: set! of a builtin
+    binds it in the frame below instead, see Frame.mutate.
+    """
+    global builtins
+    with builtins_lock:
+        if builtins is None:
+            # in a session of its own, so that building it is not logged in the query that first needs it
+            with session.activate(session.Session()):
+                log.logger.f_delta = -1  # so that it is named Builtins
+                builtins = build_builtins_frame()
+    log.logger.frame_lookup[id(builtins)] = builtins.stored
+    return Frame("Global", builtins)
+
+
+def build_builtins_frame():
     import primitives
     primitives.load_primitives()
     frame = Frame("builtins")
@@ -79,4 +103,4 @@ def build_global_frame():
     with open("editor/builtins.scm") as file:
         execution.string_exec([" ".join(file.readlines())], lambda *x, **y: None, False, frame)
 
-    return Frame("Global", frame)
+    return frame
@@ -1,51 +1,68 @@
+import weakref
 from typing import Dict, List, Union, Optional
 
 import log
-from datamodel import Symbol, Expression, Number, Pair, Nil, Undefined, Boolean, String, Promise, Character, Vector
+import session
+from datamodel import Symbol, Expression, Number, Pair, Nil, Undefined, Boolean, String, Promise, Character, Vector, \
+    MultipleValues
 from helper import pair_to_list
 from scheme_exceptions import SymbolLookupError, CallableResolutionError, IrreversibleOperationError, OutOfMemoryError, OperandDeduceError
 
 
 RECURSION_LIMIT = 100000
 
+# the length a list of ReturnFrames first reaches before the frames that are gone are dropped from it
+RETURN_FRAMES_LIMIT = 64
+
 
 class Frame:
-    def __init__(self, name: str, parent: 'Frame' = None):
+    __slots__ = ("parent", "name", "vars", "id", "temp", "stored", "__weakref__")
+
+    def __init__(self, name: str, parent: 'Frame' = None, vars: 'Union[Dict[str, Expression], SlotVars]' = None):
         self.parent = parent
         self.name = name
-        self.vars: Dict[str, Expression] = {}
+        self.vars = {} if vars is None else vars
         self.id = "unknown"
-        self.temp = log.logger.fragile
-        log.logger.frame_create(self)
+        logger = log.logger
+        self.temp = logger.fragile
+        self.stored: log.StoredFrame = None  # keeps this frame in log.logger.frame_lookup while it is alive
+        logger.frame_create(self)
 
     def assign(self, varname: Symbol, varval: Expression):
-        if log.logger.fragile and not self.temp:
+        logger = log.logger
+        if logger.fragile and not self.temp:
             raise IrreversibleOperationError()
         if isinstance(varval, Thunk):
             assert varname == log.return_symbol
             varval.bind(self)
             return
         self.vars[varname.value] = varval
-        log.logger.frame_store(self, varname.value, varval)
+        logger.frame_store(self, varname.value, varval)
 
     def mutate(self, varname: Symbol, varval: Expression):
         if log.logger.fragile and not self.temp:
             raise IrreversibleOperationError()
         assert not isinstance(varval, Thunk)
-        if varname.value in self.vars:
-            self.vars[varname.value] = varval
-            log.logger.frame_store(self, varname.value, varval)
-        elif self.parent is None:
-            raise SymbolLookupError(f"Variable not found in current environment: '{varname}'")
-        else:
-            self.parent.mutate(varname, varval)
+        frame = self
+        while varname.value not in frame.vars:
+            below, frame = frame, frame.parent
+            if frame is None:
+                raise SymbolLookupError(f"Variable not found in current environment: '{varname}'")
+            if log.logger.fragile and not frame.temp:
+                raise IrreversibleOperationError()
+        if frame.parent is None and frame is not self:
+            # the builtins are shared by all global frames, see environment.build_global_frame
+            frame = below
+        frame.vars[varname.value] = varval
+        log.logger.frame_store(frame, varname.value, varval)
 
     def lookup(self, varname: Symbol):
-        if varname.value in self.vars:
-            return self.vars[varname.value]
-        if self.parent is None:
-            raise SymbolLookupError(f"Variable not found in current environment: '{varname}'")
-        return self.parent.lookup(varname)
+        frame = self
+        while frame is not None:
+            if varname.value in frame.vars:
+                return frame.vars[varname.value]
+            frame = frame.parent
+        raise SymbolLookupError(f"Variable not found in current environment: '{varname}'")
 
     def __hash__(self):
         return id(self)
@@ -54,7 +71,71 @@ class Frame:
         return repr(self.vars)
 
 
+class SlotVars:
+    """
+    Array-backed bindings of a frame, used by the compiled backend so that resolved variables
+    can be read by (depth, index). Names are mapped to slots by a layout shared by every frame
+    of the same lambda or let; names bound at runtime that are not in the layout (e.g. by eval
+    or a macro expansion) go to extras. Behaves like the dict Frame.vars usually is.
+    """
+    __slots__ = ("layout", "slots", "extras")
+
+    # set once any frame has had extras, after which compiled code checks for them
+    extended = False
+
+    def __init__(self, layout: Dict[str, int]):
+        self.layout = layout
+        self.slots: List[Optional[Expression]] = [None] * len(layout)
+        self.extras: Optional[Dict[str, Expression]] = None
+
+    def __contains__(self, name: str):
+        index = self.layout.get(name)
+        if index is not None:
+            return self.slots[index] is not None
+        return self.extras is not None and name in self.extras
+
+    def __getitem__(self, name: str):
+        index = self.layout.get(name)
+        if index is not None and self.slots[index] is not None:
+            return self.slots[index]
+        if self.extras is not None and name in self.extras:
+            return self.extras[name]
+        raise KeyError(name)
+
+    def __setitem__(self, name: str, value: Expression):
+        index = self.layout.get(name)
+        if index is not None:
+            self.slots[index] = value
+        else:
+            if self.extras is None:
+                self.extras = {}
+                SlotVars.extended = True
+            self.extras[name] = value
+
+    def items(self):
+        for name, index in self.layout.items():
+            if self.slots[index] is not None:
+                yield name, self.slots[index]
+        if self.extras is not None:
+            yield from self.extras.items()
+
+    def __iter__(self):
+        return (name for name, _ in self.items())
+
+    def __len__(self):
+        return sum(1 for _ in self.items())
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
 class Thunk:
+    """
+    An expression in tail position, passed back to the evaluate loop that will evaluate it.
+    return_frame is the frame of the procedure whose body it ends, if any, which is given its value.
+    """
+    __slots__ = ("expr", "frame", "log_stack", "gui_holder", "return_frame")
+
     def __init__(self, expr: Expression, frame: Frame, gui_holder: log.Holder, log_stack: bool):
         self.expr = expr
         self.frame = frame
@@ -65,18 +146,54 @@ class Thunk:
     def __repr__(self):
         return "thunk"
 
-    def evaluate(self, expr: Expression):
-        if self.return_frame is not None:
-            self.return_frame.assign(log.return_symbol, expr)
-
     def bind(self, return_frame: Frame):
         self.return_frame = return_frame
 
 
+class ReturnFrames:
+    """
+    The frames given the value of a chain of tail calls once it returns, innermost first, in a list that is
+    never modified, so that the continuations of the iterative backend that share it can be resumed more than once.
+    Frames are held weakly, since one that nothing else refers to can no longer be shown, and those that are gone
+    are dropped as the list grows, so that a chain of tail calls still runs in constant space.
+    """
+    __slots__ = ("frame", "rest", "length", "limit")
+
+    def __init__(self, frame: 'weakref.ref[Frame]', rest: Optional['ReturnFrames'], limit: int = RETURN_FRAMES_LIMIT):
+        self.frame = frame
+        self.rest = rest
+        self.length = 1 if rest is None else rest.length + 1
+        self.limit = limit if rest is None else rest.limit
+
+
+def add_return_frame(frame: Frame, frames: Optional[ReturnFrames]) -> ReturnFrames:
+    if frames is not None and frames.length >= frames.limit:
+        live = []
+        while frames is not None:
+            if frames.frame() is not None:
+                live.append(frames.frame)
+            frames = frames.rest
+        for ref in reversed(live):
+            frames = ReturnFrames(ref, frames, max(2 * len(live), RETURN_FRAMES_LIMIT))
+    return ReturnFrames(weakref.ref(frame), frames)
+
+
+def assign_return(frames: Optional[ReturnFrames], value: Expression):
+    while frames is not None:
+        frame = frames.frame()
+        if frame is not None:
+            frame.assign(log.return_symbol, value)
+        frames = frames.rest
+
+
 def evaluate(expr: Expression, frame: Frame, gui_holder: log.Holder,
              tail_context: bool = False, *, log_stack: bool=True) -> Union[Expression, Thunk]:
+    if gui_holder is log.fake_obj:
+        return evaluate_headless(expr, frame, tail_context, log_stack=log_stack)
+
+    logger = log.logger
     depth = 0
-    thunks = []
+    return_frames = []
     holders = []
 
     while True:
@@ -86,7 +203,7 @@ def evaluate(expr: Expression, frame: Frame, gui_holder: log.Holder,
         visual_expression = gui_holder.expression
 
         if log_stack:
-            log.logger.eval_stack.append(f"{repr(expr)} [frame = {frame.id}]")
+            logger.eval_stack.append((expr, frame))
             depth += 1
 
         holders.append(gui_holder)
@@ -104,7 +221,7 @@ def evaluate(expr: Expression, frame: Frame, gui_holder: log.Holder,
         elif isinstance(expr, Pair):
             if tail_context:
                 if log_stack:
-                    log.logger.eval_stack.pop()
+                    logger.eval_stack.pop()
                 return Thunk(expr, frame, gui_holder, log_stack)
             else:
                 gui_holder.evaluate()
@@ -118,10 +235,10 @@ def evaluate(expr: Expression, frame: Frame, gui_holder: log.Holder,
                 out = apply(operator, operands, frame, gui_holder)
                 if isinstance(out, Thunk):
                     expr, frame = out.expr, out.frame
-                    thunks.append(out)
+                    return_frames.append(out.return_frame)
                     if out.gui_holder.state != log.HolderState.EVALUATING:
                         out.gui_holder.evaluate()
-                    if log.logger.show_thunks:
+                    if logger.show_thunks:
                         gui_holder = out.gui_holder
                     else:
                         gui_holder.expression.display_value = out.gui_holder.expression.display_value
@@ -131,18 +248,21 @@ def evaluate(expr: Expression, frame: Frame, gui_holder: log.Holder,
                 ret = out
         elif isinstance(expr, Vector):
             raise OperandDeduceError(f"Cannot evaluate vector object: {expr}.")
+        elif isinstance(expr, MultipleValues):
+            raise OperandDeduceError(f"Expected a single value, not {expr}.")
         elif expr is Nil or expr is Undefined:
             ret = expr
         else:
             raise Exception("Internal error. Please report to maintainer!")
 
         for _ in range(depth):
-            log.logger.eval_stack.pop()
+            logger.eval_stack.pop()
 
-        for thunk, holder in zip(reversed(thunks), reversed(holders)):
+        for return_frame, holder in zip(reversed(return_frames), reversed(holders)):
             holder.expression.value = ret
             holder.complete()
-            thunk.evaluate(ret)
+            if return_frame is not None:
+                return_frame.assign(log.return_symbol, ret)
 
         holders[0].expression.value = ret
         holders[0].complete()
@@ -150,8 +270,83 @@ def evaluate(expr: Expression, frame: Frame, gui_holder: log.Holder,
         return ret
 
 
+def evaluate_headless(expr: Expression, frame: Frame,
+                      tail_context: bool = False, *, log_stack: bool=True) -> Union[Expression, Thunk]:
+    """
+    Same semantics as evaluate, but without building or announcing anything for the substitution tree.
+    Used when the root holder is log.fake_obj, i.e. in headless mode or past what the trace policy expands.
+    Tail calls run in constant space: the eval stack keeps the expressions evaluated by this call that a
+    traceback would print, counting the others in logger.eval_omitted, and tail calls are passed back
+    in the tail_thunk of the session.
+    """
+    logger = log.logger
+    depth = 0
+    omitted = 0
+    return_frames = []
+
+    while True:
+        if depth > RECURSION_LIMIT:
+            raise OutOfMemoryError("Debugger ran out of memory due to excessively deep recursion.")
+
+        if log_stack:
+            if depth and len(logger.eval_stack) >= log.MAX_TRACEBACK_LENGTH:
+                # the previous expression of this call would be neither among the first entries printed nor the last
+                logger.eval_stack[-1] = (expr, frame)
+                logger.eval_omitted += 1
+                omitted += 1
+            else:
+                logger.eval_stack.append((expr, frame))
+                depth += 1
+
+        if isinstance(expr, Symbol):
+            ret = frame.lookup(expr)
+        elif isinstance(expr, Pair):
+            if tail_context:
+                if log_stack:
+                    logger.eval_stack.pop()
+                tail_thunk = session.current().tail_thunk
+                tail_thunk.expr, tail_thunk.frame, tail_thunk.log_stack = expr, frame, log_stack
+                tail_thunk.return_frame = None
+                return tail_thunk
+            operator = expr.first
+            import environment
+            if isinstance(operator, Symbol) and environment.get_special_form(operator.value):
+                operator = environment.get_special_form(operator.value)
+            else:
+                operator = evaluate_headless(operator, frame)
+            operands = pair_to_list(expr.rest)
+            out = apply(operator, operands, frame, log.fake_obj)
+            if isinstance(out, Thunk):
+                expr, frame = out.expr, out.frame
+                if out.return_frame is not None:
+                    return_frames.append(out.return_frame)
+                continue
+            ret = out
+        elif isinstance(expr, Vector):
+            raise OperandDeduceError(f"Cannot evaluate vector object: {expr}.")
+        elif isinstance(expr, MultipleValues):
+            raise OperandDeduceError(f"Expected a single value, not {expr}.")
+        elif isinstance(expr, (Number, Callable, Boolean, String, Promise, Character)) \
+                or expr is Nil or expr is Undefined:
+            ret = expr
+        else:
+            raise Exception("Internal error. Please report to maintainer!")
+
+        for _ in range(depth):
+            logger.eval_stack.pop()
+        logger.eval_omitted -= omitted
+
+        for return_frame in reversed(return_frames):
+            return_frame.assign(log.return_symbol, ret)
+
+        return ret
+
+
 def apply(operator: Expression, operands: List[Expression], frame: Frame, gui_holder: log.Holder):
     if isinstance(operator, Callable):
+        profile = log.logger.profile
+        if profile is not None:
+            return profile.call(operator, operator.execute, operands, frame, gui_holder)
         return operator.execute(operands, frame, gui_holder)
     elif isinstance(operator, Symbol):
         raise CallableResolutionError(f"Unable to pass parameters into the Symbol '{operator}'")
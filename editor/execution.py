@@ -1,36 +1,39 @@
 import json
 
+import session
 from datamodel import Undefined, Pair
 from evaluate_apply import evaluate
 from graphics import Canvas
 from helper import pair_to_list
-from log import Holder, Root
+from log import Holder, fake_obj, MAX_TRACEBACK_LENGTH
 from execution_parser import get_expression
 from lexer import TokenBuffer
 from runtime_limiter import TimeLimitException
 from scheme_exceptions import SchemeError, ParseError
 
-MAX_TRACEBACK_LENGTH = 20
 MAX_AUTODRAW_LENGTH = 50
 
 
-def string_exec(strings, out, visualize_tail_calls, global_frame=None):
+BACKENDS = ("visual", "headless", "compiled", "iterative")
+
+
+def string_exec(strings, out, visualize_tail_calls, global_frame=None, backend="visual"):
+    # "headless", "compiled" and "iterative" evaluate without building a substitution tree,
+    # using the interpreter, the compiler, or the interpreter with an explicit continuation stack
     import log
+    from compiler import analyze
+    from iterative import evaluate_iterative
 
     empty = False
 
     if global_frame is None:
         empty = True
         from environment import build_global_frame
-        log.logger.f_delta -= 1
         global_frame = build_global_frame()
-        log.logger.active_frames.pop(0)  # clear builtin frame
-        log.logger.f_delta += 1
         log.logger.global_frame = log.logger.frame_lookup[id(global_frame)]
         log.logger.graphics_lookup[id(global_frame)] = Canvas()
 
-    log.logger.export_states = []
-    log.logger.roots = []
+    log.logger.reset_tree()
     log.logger.frame_updates = []
     log.logger._out = []
     log.logger.visualize_tail_calls(visualize_tail_calls)
@@ -46,30 +49,33 @@ def string_exec(strings, out, visualize_tail_calls, global_frame=None):
                     continue
                 empty = False
                 log.logger.new_expr()
-                holder = Holder(expr, None)
-                Root.setroot(holder)
-                res = evaluate(expr, global_frame, holder)
+                holder = Holder(expr, None) if backend == "visual" else fake_obj
+                session.current().root = holder
+                if backend == "compiled":
+                    res = analyze(expr)(global_frame)
+                elif backend == "iterative":
+                    res = evaluate_iterative(expr, global_frame)
+                else:
+                    res = evaluate(expr, global_frame, holder)
                 if res is not Undefined:
                     out(res)
                 if not log.logger.fragile and log.logger.autodraw:
-                    try:
-                        log.logger.raw_out("AUTODRAW" +
-                                           json.dumps([log.logger.i, log.logger.heap.record(res)]) + "\n")
-                    except RecursionError:
-                        pass
+                    log.logger.raw_out("AUTODRAW" + json.dumps([log.logger.i, log.logger.heap.record(res)]) + "\n")
         except (SchemeError, ZeroDivisionError, RecursionError, ValueError) as e:
             if isinstance(e, ParseError):
                 log.logger.new_expr()
                 raise
             if not log.logger.fragile:
                 log.logger.raw_out("Traceback (most recent call last)\n")
-                for j, expr in enumerate(log.logger.eval_stack[:MAX_TRACEBACK_LENGTH - 1]):
-                    log.logger.raw_out(str(j).ljust(3) + " " + expr + "\n")
-                truncated = len(log.logger.eval_stack) - MAX_TRACEBACK_LENGTH
-                if len(log.logger.eval_stack) > MAX_TRACEBACK_LENGTH:
+                for j, entry in enumerate(log.logger.eval_stack[:MAX_TRACEBACK_LENGTH - 1]):
+                    log.logger.raw_out(str(j).ljust(3) + " " + render_stack_entry(*entry) + "\n")
+                length = len(log.logger.eval_stack) + log.logger.eval_omitted
+                truncated = length - MAX_TRACEBACK_LENGTH
+                if length > MAX_TRACEBACK_LENGTH:
                     log.logger.raw_out(f"[{truncated} lines omitted from traceback]\n")
                     log.logger.raw_out(
-                        str(len(log.logger.eval_stack) - 1).ljust(3) + " " + log.logger.eval_stack[-1] + "\n"
+                        str(length - 1).ljust(3) + " " +
+                        render_stack_entry(*log.logger.eval_stack[-1]) + "\n"
                     )
             log.logger.out(e)
         except TimeLimitException:
@@ -79,7 +85,11 @@ def string_exec(strings, out, visualize_tail_calls, global_frame=None):
 
     if empty:
         log.logger.new_expr()
-        holder = Holder(Undefined, None)
-        Root.setroot(holder)
+        holder = Holder(Undefined, None) if backend == "visual" else fake_obj
+        session.current().root = holder
         evaluate(Undefined, global_frame, holder)
         log.logger.new_expr()
+
+
+def render_stack_entry(expr, frame):
+    return f"{repr(expr)} [frame = {frame.id}]"
@@ -1,9 +1,9 @@
 from typing import Union
 
+import log
 from datamodel import Expression, Symbol, Number, Nil, SingletonTrue, SingletonFalse, String, Character, Vector
 from helper import make_list
 from lexer import TokenBuffer, SPECIALS
-from log import logger
 from scheme_exceptions import ParseError
 
 
@@ -62,7 +62,7 @@ def get_expression(buffer: TokenBuffer) -> Union[Expression, None]:
     elif token == "`":
         return make_list([Symbol("quasiquote"), get_expression(buffer)])
     elif token == ".":
-        if logger.dotted:
+        if log.logger.dotted:
             raise ParseError(f"Unexpected token: '{token}'")
         else:
             return make_list([Symbol("variadic"), get_expression(buffer)])
@@ -74,7 +74,7 @@ def get_expression(buffer: TokenBuffer) -> Union[Expression, None]:
         try:
             return Number(int(token.value))
         except ValueError:
-            return Number(float(token.value))
+            return Number(float(token.value), shared=False)
     elif token == "#t" or token.value.lower() == "true":
         return SingletonTrue
     elif token == "#f" or token.value.lower() == "false":
@@ -117,7 +117,7 @@ def get_rest_of_list(buffer: TokenBuffer, end_paren: str, is_vector: bool) -> Ex
         if next == end_paren:
             buffer.pop_next_token()
             break
-        elif logger.dotted and next == ".":
+        elif log.logger.dotted and next == ".":
             if is_vector:
                 raise ParseError("Dot may not occur in a vector.")
             if not out:
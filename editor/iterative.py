@@ -0,0 +1,904 @@
+from typing import List, Optional, Tuple
+
+import log
+import session
+from datamodel import Expression, Symbol, Pair, Nil, Undefined, Promise, Number, Boolean, String, Character, \
+    Vector, SingletonTrue, SingletonFalse, NilType, MultipleValues
+from environment import get_special_form
+from evaluate_apply import Frame, Thunk, Callable, Applicable, ReturnFrames, add_return_frame, assign_return
+from helper import pair_to_list, make_list, verify_exact_callable_length, verify_min_callable_length
+from lists import Memv
+from log import fake_obj, MAX_TRACEBACK_LENGTH
+from primitives import BuiltIn
+from scheme_exceptions import OperandDeduceError, CallableResolutionError, OutOfMemoryError, SchemeError, \
+    IrreversibleOperationError, TypeMismatchError, UnsupportedOperationError
+from special_forms import ProcedureObject, MacroObject, Define, Set, Begin, If, Cond, Let, LetStar, Case, \
+    Quasiquote, Eval, Apply, Force, begin_symbol, else_symbol, quasiquote_symbol, unquote_symbol, \
+    unquote_splicing_symbol, CallCC, CallWithValues, DynamicWind, ContinuationObject, ContinuationInvoked, \
+    make_values
+
+# Non-visual evaluator that keeps pending work in an explicit stack of continuation records instead of
+# on the Python stack, so the depth of non-tail recursion is limited by STACK_BUDGET rather than by Python.
+# The state of the machine is either an expression to evaluate in a frame, or a value to hand to the
+# innermost record, which decides what to do next. Records are never modified once made, so that a chain
+# of them can be kept and resumed more than once.
+# Special forms and builtins that evaluate expressions are run by the machine, as are call/cc and the
+# procedures that work with continuations. The others are run by the interpreter, which is only a limit
+# for those that evaluate code themselves: map, load, load-all, begin-noexcept and expect. Recursion
+# through them is still bounded by Python's stack, and fails with RecursionError once that runs out.
+# call/cc captures the current record, so capture takes constant time and the continuation stays valid
+# after call/cc returns.
+
+# Memory the continuation stack may use before evaluation fails with OutOfMemoryError
+STACK_BUDGET = 256 * 2 ** 20
+# Rough size of one record, including the evaluated operands it holds
+RECORD_SIZE = 200
+
+# Either (expression, frame, k) to evaluate the expression, or (value, None, k) to return the value to k
+State = Tuple[Expression, Optional[Frame], Optional['Continuation']]
+
+
+class Continuation:
+    """A pending step of an evaluation, linked to the record to return to once it is done."""
+    __slots__ = ("next", "depth", "wind")
+
+    def __init__(self, next: Optional['Continuation']):
+        self.next = next
+        self.depth = 1 if next is None else next.depth + 1
+        # the innermost dynamic-wind whose thunk this record is part of
+        self.wind = None if next is None else next.wind
+        if self.depth * RECORD_SIZE > STACK_BUDGET:
+            raise OutOfMemoryError("Debugger ran out of memory due to excessively deep recursion.")
+
+    def resume(self, value: Expression) -> State:
+        raise NotImplementedError()
+
+    def context(self) -> Optional[Tuple[Expression, Frame]]:
+        # the expression and frame shown for this record in tracebacks, if any
+        return None
+
+
+def evaluate_iterative(expr: Expression, frame: Frame, k: Optional[Continuation] = None) -> Expression:
+    value, record = expr, None
+    depth, omitted = len(log.logger.eval_stack), log.logger.eval_omitted
+    current = session.current()
+    running, current.machine_running = current.machine_running, True
+    try:
+        while True:
+            try:
+                while True:
+                    record = None
+                    if frame is None:
+                        if k is None:
+                            return value
+                        record = k
+                        value, frame, k = record.resume(value)
+                    elif isinstance(value, Symbol):
+                        value, frame = frame.lookup(value), None
+                    elif isinstance(value, Pair):
+                        value, frame, k = start(value, frame, k)
+                    elif isinstance(value, Vector):
+                        raise OperandDeduceError(f"Cannot evaluate vector object: {value}.")
+                    elif isinstance(value, MultipleValues):
+                        raise OperandDeduceError(f"Expected a single value, not {value}.")
+                    elif isinstance(value, (Number, Callable, Boolean, String, Promise, Character)) \
+                            or value is Nil or value is Undefined:
+                        frame = None
+                    else:
+                        raise Exception("Internal error. Please report to maintainer!")
+            except ContinuationInvoked as invoked:
+                # a continuation was called by a procedure the interpreter ran
+                del log.logger.eval_stack[depth:]
+                log.logger.eval_omitted = omitted
+                continuation = invoked.continuation
+                value, frame, k = throw(Pair(continuation, Nil), continuation, invoked.value, k)
+    except Exception:
+        if record is not None:
+            trace([], record)
+        else:
+            trace([(value, frame)], k)
+        raise
+    finally:
+        current.machine_running = running
+
+
+def trace(contexts: List[Optional[Tuple[Expression, Frame]]], k: Optional[Continuation]):
+    # Called while an error unwinds, so entries added by the interpreter for inner expressions are already there
+    while k is not None:
+        if isinstance(k, Tail):
+            contexts.extend(reversed(k.entries))
+            log.logger.eval_omitted += k.omitted
+        else:
+            contexts.append(k.context())
+        k = k.next
+    log.logger.eval_stack[:0] = reversed([context for context in contexts if context])
+
+
+def start(expr: Pair, frame: Frame, k: Optional[Continuation]) -> State:
+    operator = expr.first
+    operands = pair_to_list(expr.rest)
+    if isinstance(operator, Symbol):
+        special_form = special_forms.get(operator.value)
+        if special_form is not None:
+            return special_form(expr, operands, frame, k)
+        form = get_special_form(operator.value)
+        if form is not None:
+            return complete(form.execute(operands, frame, fake_obj), k)
+        try:
+            operator = frame.lookup(operator)
+        except SchemeError:
+            # evaluate the operator as usual, so the error is traced like any other
+            return operator, frame, EvalOperator(expr, frame, operands, k)
+        return call(expr, frame, operator, operands, k)
+    return operator, frame, EvalOperator(expr, frame, operands, k)
+
+
+def complete(out: Expression, k: Optional[Continuation]) -> State:
+    # out is what the interpreter returned, which may be a Thunk for an expression in tail position
+    if isinstance(out, Thunk):
+        if out.return_frame is not None:
+            k = returning(out.return_frame, k)
+        return out.expr, out.frame, k
+    return out, None, k
+
+
+def tail(expr: Pair, frame: Frame, k: Optional[Continuation],
+         return_frame: Optional[Frame] = None) -> Optional[Continuation]:
+    # adds the expression to the chain of tail evaluations k is part of, without growing the stack, and
+    # return_frame, if given, to the frames given the value of the chain
+    frames = k.frames if isinstance(k, Tail) else None
+    if return_frame is not None:
+        frames = add_return_frame(return_frame, frames)
+    if not isinstance(k, Tail):
+        return Tail(((expr, frame),), 0, frames, k)
+    if len(k.entries) == MAX_TRACEBACK_LENGTH:
+        # the last entry would be neither among the first entries printed in a traceback nor the last
+        return Tail(k.entries[:-1] + ((expr, frame),), k.omitted + 1, frames, k.next)
+    return Tail(k.entries + ((expr, frame),), k.omitted, frames, k.next)
+
+
+def returning(return_frame: Frame, k: Optional[Continuation]) -> 'Tail':
+    # like tail, for a frame whose body the interpreter returned without an expression for tracebacks
+    if not isinstance(k, Tail):
+        return Tail((), 0, add_return_frame(return_frame, None), k)
+    return Tail(k.entries, k.omitted, add_return_frame(return_frame, k.frames), k.next)
+
+
+def call(expr: Pair, frame: Frame, operator: Expression, operands: List[Expression],
+         k: Optional[Continuation]) -> State:
+    if isinstance(operator, Applicable):
+        # like the interpreter, make the new frame before evaluating the operands, so frames are numbered alike
+        new_frame = new_frame_for(operator, frame) if isinstance(operator, ProcedureObject) else None
+        return evaluate_operands(expr, frame, operator, new_frame, operands, [], k)
+    elif isinstance(operator, MacroObject):
+        new_frame = new_frame_for(operator, frame)
+        return apply_procedure(operator, operands, new_frame, Expand(expr, frame, new_frame, k))
+    elif isinstance(operator, Callable):
+        return complete(operator.execute(operands, frame, fake_obj), k)
+    elif isinstance(operator, Symbol):
+        raise CallableResolutionError(f"Unable to pass parameters into the Symbol '{operator}'")
+    else:
+        raise CallableResolutionError(f"Unable to pass parameters into: '{operator}'")
+
+
+def evaluate_operands(expr: Pair, frame: Frame, operator: Applicable, new_frame: Optional[Frame],
+                      operands: List[Expression], values: List[Expression], k: Optional[Continuation]) -> State:
+    # values holds the operands evaluated so far; symbols and constants are evaluated without making a record
+    for i in range(len(values), len(operands)):
+        operand = operands[i]
+        if isinstance(operand, Pair) or isinstance(operand, Vector):
+            return operand, frame, EvalOperands(expr, frame, operator, new_frame, operands, tuple(values), k)
+        if isinstance(operand, Symbol):
+            try:
+                operand = frame.lookup(operand)
+            except SchemeError:
+                return operand, frame, EvalOperands(expr, frame, operator, new_frame, operands, tuple(values), k)
+        values.append(operand)
+    return apply_evaluated(expr, frame, operator, new_frame, values, k)
+
+
+def apply_evaluated(expr: Pair, frame: Frame, operator: Expression, new_frame: Optional[Frame],
+                    values: List[Expression], k: Optional[Continuation]) -> State:
+    if isinstance(operator, ProcedureObject):
+        if new_frame is None or new_frame.vars:
+            # a frame that already has bindings was used by an earlier return to this continuation
+            new_frame = new_frame_for(operator, frame)
+        return apply_procedure(operator, values, new_frame, tail(expr, frame, k, new_frame))
+    if isinstance(operator, BuiltIn):
+        return operator.execute_evaluated(values, frame), None, k
+    control = controls.get(type(operator))
+    if control is not None:
+        return control(expr, frame, operator, values, k)
+    if not isinstance(operator, Applicable):
+        raise OperandDeduceError(f"Unable to call {operator}.")
+    return complete(operator.execute(values, frame, fake_obj, False), k)
+
+
+def new_frame_for(procedure: ProcedureObject, frame: Frame) -> Frame:
+    return Frame(procedure.name, procedure.frame if procedure.lexically_scoped else frame)
+
+
+def apply_procedure(procedure: ProcedureObject, operands: List[Expression], new_frame: Frame,
+                    k: Optional[Continuation]) -> State:
+    if procedure.var_param:
+        verify_min_callable_length(procedure, len(procedure.params), len(operands))
+    else:
+        verify_exact_callable_length(procedure, len(procedure.params), len(operands))
+    for param, value in zip(procedure.params, operands):
+        new_frame.assign(param, value)
+    if procedure.var_param:
+        new_frame.assign(procedure.var_param, make_list(operands[len(procedure.params):]))
+    return evaluate_sequence(procedure.body, new_frame, k, None, True)
+
+
+def evaluate_sequence(exprs: List[Expression], frame: Frame, k: Optional[Continuation],
+                      form: Optional[Pair] = None, body: bool = False) -> State:
+    if len(exprs) > 1:
+        k = Sequence(exprs, 1, frame, form, body, k)
+    return exprs[0], frame, k
+
+
+class EvalOperator(Continuation):
+    __slots__ = ("expr", "frame", "operands")
+
+    def __init__(self, expr: Pair, frame: Frame, operands: List[Expression], next: Optional[Continuation]):
+        super().__init__(next)
+        self.expr = expr
+        self.frame = frame
+        self.operands = operands
+
+    def resume(self, value):
+        return call(self.expr, self.frame, value, self.operands, self.next)
+
+    def context(self):
+        return self.expr, self.frame
+
+
+class EvalOperands(Continuation):
+    __slots__ = ("expr", "frame", "operator", "new_frame", "operands", "values")
+
+    def __init__(self, expr: Pair, frame: Frame, operator: Applicable, new_frame: Optional[Frame],
+                 operands: List[Expression], values: Tuple[Expression, ...], next: Optional[Continuation]):
+        super().__init__(next)
+        self.expr = expr
+        self.frame = frame
+        self.operator = operator
+        self.new_frame = new_frame
+        self.operands = operands
+        self.values = values
+
+    def resume(self, value):
+        values = list(self.values)
+        values.append(value)
+        return evaluate_operands(self.expr, self.frame, self.operator, self.new_frame, self.operands, values,
+                                 self.next)
+
+    def context(self):
+        return self.expr, self.frame
+
+
+class Tail(Continuation):
+    # the expressions of a chain of tail evaluations shown in tracebacks, as the interpreter keeps them:
+    # the first MAX_TRACEBACK_LENGTH - 1 and the latest, with the number of those left out in between,
+    # and the frames of the procedures and lets in the chain, which are given its value
+    __slots__ = ("entries", "omitted", "frames")
+
+    def __init__(self, entries: Tuple[Tuple[Expression, Frame], ...], omitted: int, frames: Optional[ReturnFrames],
+                 next: Optional[Continuation]):
+        super().__init__(next)
+        self.entries = entries
+        self.omitted = omitted
+        self.frames = frames
+
+    def resume(self, value):
+        assign_return(self.frames, value)
+        return value, None, self.next
+
+
+class Expand(Continuation):
+    # evaluates the expansion of a macro in the frame it was called from, once the macro's frame is given it
+    __slots__ = ("expr", "frame", "new_frame")
+
+    def __init__(self, expr: Pair, frame: Frame, new_frame: Frame, next: Optional[Continuation]):
+        super().__init__(next)
+        self.expr = expr
+        self.frame = frame
+        self.new_frame = new_frame
+
+    def resume(self, value):
+        self.new_frame.assign(log.return_symbol, value)
+        return value, self.frame, tail(self.expr, self.frame, self.next)
+
+    def context(self):
+        return self.expr, self.frame
+
+
+class Sequence(Continuation):
+    # form is the begin form being evaluated, if any, and body is set for the body of a procedure
+    __slots__ = ("exprs", "index", "frame", "form", "body")
+
+    def __init__(self, exprs: List[Expression], index: int, frame: Frame, form: Optional[Pair], body: bool,
+                 next: Optional[Continuation]):
+        super().__init__(next)
+        self.exprs = exprs
+        self.index = index
+        self.frame = frame
+        self.form = form
+        self.body = body
+
+    def resume(self, value):
+        k = self.next
+        if self.index < len(self.exprs) - 1:
+            k = Sequence(self.exprs, self.index + 1, self.frame, self.form, self.body, k)
+        elif self.form is not None:
+            k = tail(self.form, self.frame, k)
+        elif self.body:
+            k = tail(make_list([begin_symbol] + self.exprs), self.frame, k)
+        return self.exprs[self.index], self.frame, k
+
+    def context(self):
+        if self.body:
+            # the interpreter runs procedure bodies with more than one expression as a begin form
+            return make_list([begin_symbol] + self.exprs), self.frame
+        if self.form is not None:
+            return self.form, self.frame
+
+
+class SpecialForm(Continuation):
+    # a special form waiting for the value of one of its operands
+    __slots__ = ("expr", "frame")
+
+    def __init__(self, expr: Pair, frame: Frame, next: Optional[Continuation]):
+        super().__init__(next)
+        self.expr = expr
+        self.frame = frame
+
+    def context(self):
+        return self.expr, self.frame
+
+
+special_forms = {}
+
+
+def special_form(name):
+    def decorator(func):
+        special_forms[name] = func
+        return func
+
+    return decorator
+
+
+@special_form("begin")
+def start_begin(expr: Pair, operands: List[Expression], frame: Frame, k: Optional[Continuation]) -> State:
+    verify_min_callable_length(Begin(), 1, len(operands))
+    return evaluate_sequence(operands, frame, k, expr)
+
+
+class IfTest(SpecialForm):
+    __slots__ = ("operands",)
+
+    def __init__(self, expr: Pair, frame: Frame, operands: List[Expression], next: Optional[Continuation]):
+        super().__init__(expr, frame, next)
+        self.operands = operands
+
+    def resume(self, value):
+        if value is SingletonFalse:
+            if len(self.operands) == 2:
+                return Undefined, None, self.next
+            return self.operands[2], self.frame, tail(self.expr, self.frame, self.next)
+        return self.operands[1], self.frame, tail(self.expr, self.frame, self.next)
+
+
+@special_form("if")
+def start_if(expr: Pair, operands: List[Expression], frame: Frame, k: Optional[Continuation]) -> State:
+    verify_min_callable_length(If(), 2, len(operands))
+    if len(operands) > 3:
+        verify_exact_callable_length(If(), 3, len(operands))
+    return operands[0], frame, IfTest(expr, frame, operands, k)
+
+
+class DefineValue(SpecialForm):
+    __slots__ = ("name",)
+
+    def __init__(self, expr: Pair, frame: Frame, name: Symbol, next: Optional[Continuation]):
+        super().__init__(expr, frame, next)
+        self.name = name
+
+    def resume(self, value):
+        self.frame.assign(self.name, value)
+        return self.name, None, self.next
+
+
+@special_form("define")
+def start_define(expr: Pair, operands: List[Expression], frame: Frame, k: Optional[Continuation]) -> State:
+    verify_min_callable_length(Define(), 2, len(operands))
+    if isinstance(operands[0], Symbol):
+        verify_exact_callable_length(Define(), 2, len(operands))
+        return operands[1], frame, DefineValue(expr, frame, operands[0], k)
+    # defining a procedure evaluates nothing
+    return Define().execute(operands, frame, fake_obj), None, k
+
+
+class SetValue(SpecialForm):
+    __slots__ = ("name",)
+
+    def __init__(self, expr: Pair, frame: Frame, name: Symbol, next: Optional[Continuation]):
+        super().__init__(expr, frame, next)
+        self.name = name
+
+    def resume(self, value):
+        self.frame.mutate(self.name, value)
+        return Undefined, None, self.next
+
+
+@special_form("set!")
+def start_set(expr: Pair, operands: List[Expression], frame: Frame, k: Optional[Continuation]) -> State:
+    verify_exact_callable_length(Set(), 2, len(operands))
+    name = operands[0]
+    if not isinstance(name, Symbol):
+        raise OperandDeduceError(f"Expected a Symbol, not {name}, as the first operand of set!")
+    return operands[1], frame, SetValue(expr, frame, name, k)
+
+
+class CondTest(SpecialForm):
+    __slots__ = ("operands", "index")
+
+    def __init__(self, expr: Pair, frame: Frame, operands: List[Expression], index: int,
+                 next: Optional[Continuation]):
+        super().__init__(expr, frame, next)
+        self.operands = operands
+        self.index = index
+
+    def resume(self, value):
+        if value is SingletonFalse:
+            return cond_clause(self.expr, self.operands, self.index + 1, self.frame, self.next)
+        expanded = pair_to_list(self.operands[self.index])
+        if len(expanded) == 1:
+            return value, None, self.next
+        return evaluate_sequence(expanded[1:], self.frame, tail(self.expr, self.frame, self.next))
+
+
+def cond_clause(expr: Pair, operands: List[Expression], index: int, frame: Frame, k: Optional[Continuation]) -> State:
+    if index == len(operands):
+        return Undefined, None, k
+    clause = operands[index]
+    if not isinstance(clause, Pair):
+        raise OperandDeduceError(f"Unable to evaluate clause of cond, as {clause} is not a Pair.")
+    expanded = pair_to_list(clause)
+    if expanded[0] is not else_symbol:
+        return expanded[0], frame, CondTest(expr, frame, operands, index, k)
+    elif index != len(operands) - 1:
+        raise OperandDeduceError(f"Else clause can only be the last clause of cond.")
+    elif len(expanded) < 2:
+        raise OperandDeduceError(f"Else clause needs to have an expression.")
+    return evaluate_sequence(expanded[1:], frame, tail(expr, frame, k))
+
+
+@special_form("cond")
+def start_cond(expr: Pair, operands: List[Expression], frame: Frame, k: Optional[Continuation]) -> State:
+    verify_min_callable_length(Cond(), 1, len(operands))
+    return cond_clause(expr, operands, 0, frame, k)
+
+
+class AndTest(SpecialForm):
+    __slots__ = ("operands", "index")
+
+    def __init__(self, expr: Pair, frame: Frame, operands: List[Expression], index: int,
+                 next: Optional[Continuation]):
+        super().__init__(expr, frame, next)
+        self.operands = operands
+        self.index = index
+
+    def resume(self, value):
+        if value is SingletonFalse:
+            return SingletonFalse, None, self.next
+        return evaluate_junct(self.expr, self.operands, self.index + 1, self.frame, self.next, AndTest)
+
+
+class OrTest(AndTest):
+    __slots__ = ()
+
+    def resume(self, value):
+        if value is not SingletonFalse:
+            return value, None, self.next
+        return evaluate_junct(self.expr, self.operands, self.index + 1, self.frame, self.next, OrTest)
+
+
+def evaluate_junct(expr: Pair, operands: List[Expression], index: int, frame: Frame, k: Optional[Continuation],
+                   test: type) -> State:
+    if index == len(operands) - 1:
+        return operands[index], frame, tail(expr, frame, k)
+    return operands[index], frame, test(expr, frame, operands, index, k)
+
+
+@special_form("and")
+def start_and(expr: Pair, operands: List[Expression], frame: Frame, k: Optional[Continuation]) -> State:
+    if not operands:
+        return SingletonTrue, None, k
+    return evaluate_junct(expr, operands, 0, frame, k, AndTest)
+
+
+@special_form("or")
+def start_or(expr: Pair, operands: List[Expression], frame: Frame, k: Optional[Continuation]) -> State:
+    if not operands:
+        return SingletonFalse, None, k
+    return evaluate_junct(expr, operands, 0, frame, k, OrTest)
+
+
+class LetBinding(SpecialForm):
+    # values holds the values of the bindings before this one that are not bound yet: a let binds them all
+    # at once, after the last one, and a let* binds each before the next, which is evaluated in its frame
+    __slots__ = ("kind", "operands", "bindings", "index", "values", "old_frame", "new_frame")
+
+    def __init__(self, expr: Pair, frame: Frame, kind: str, operands: List[Expression], bindings: List[Expression],
+                 index: int, values: Tuple[Expression, ...], old_frame: Frame, new_frame: Frame,
+                 next: Optional[Continuation]):
+        super().__init__(expr, frame, next)
+        self.kind = kind
+        self.operands = operands
+        self.bindings = bindings
+        self.index = index
+        self.values = values
+        self.old_frame = old_frame
+        self.new_frame = new_frame
+
+    def resume(self, value):
+        values = self.values + (value,)
+        old_frame, new_frame = self.old_frame, self.new_frame
+        if self.kind == "let*" or self.index == len(self.bindings) - 1:
+            new_frame = bind_let(self.kind, self.bindings[self.index + 1 - len(values):], values,
+                                 old_frame, new_frame)
+            values = ()
+            if self.kind == "let*" and self.index < len(self.bindings) - 1:
+                old_frame = new_frame
+                new_frame = Frame(f"anonymous {self.kind}", old_frame)
+        return let_binding(self.expr, self.frame, self.kind, self.operands, self.bindings, self.index + 1,
+                           values, old_frame, new_frame, self.next)
+
+
+def bind_let(kind: str, bindings: List[Pair], values: Tuple[Expression, ...], old_frame: Frame,
+             new_frame: Frame) -> Frame:
+    # like apply_evaluated, the frame is made in advance, so frames are numbered as in the interpreter,
+    # but a frame that an earlier return to the same record already bound is replaced by a fresh one
+    if new_frame.vars:
+        new_frame = Frame(f"anonymous {kind}", old_frame)
+    for binding, value in zip(bindings, values):
+        new_frame.assign(binding.first, value)
+    return new_frame
+
+
+def let_binding(expr: Pair, frame: Frame, kind: str, operands: List[Expression], bindings: List[Expression],
+                index: int, values: Tuple[Expression, ...], old_frame: Frame, new_frame: Frame,
+                k: Optional[Continuation]) -> State:
+    if index == len(bindings):
+        return evaluate_sequence(operands[1:], new_frame, tail(expr, frame, k, new_frame))
+    binding = bindings[index]
+    if not isinstance(binding, Pair):
+        raise OperandDeduceError(f"Expected binding to be a Pair, not {binding}.")
+    binding = pair_to_list(binding)
+    if len(binding) != 2:
+        raise OperandDeduceError(f"Expected binding to be of length 2, not {len(binding)}.")
+    name, value = binding
+    if not isinstance(name, Symbol):
+        raise OperandDeduceError(f"Expected first element of binding to be a Symbol, not {name}.")
+    if any(earlier.first is name for earlier in bindings[:index]):
+        raise OperandDeduceError(f"Duplicate binding name in {kind}: {name}.")
+    return value, old_frame, LetBinding(expr, frame, kind, operands, bindings, index, values, old_frame, new_frame,
+                                        k)
+
+
+def start_let(receiver: Callable, kind: str, expr: Pair, operands: List[Expression], frame: Frame,
+              k: Optional[Continuation]) -> State:
+    verify_min_callable_length(receiver, 2, len(operands))
+    bindings = operands[0]
+    if not isinstance(bindings, Pair) and bindings is not Nil:
+        raise OperandDeduceError(f"Expected first argument of {kind} to be a Pair, not {bindings}.")
+    new_frame = Frame(f"anonymous {kind}", frame)
+    return let_binding(expr, frame, kind, operands, pair_to_list(bindings), 0, (), frame, new_frame, k)
+
+
+@special_form("let")
+def start_plain_let(expr: Pair, operands: List[Expression], frame: Frame, k: Optional[Continuation]) -> State:
+    return start_let(Let(), "let", expr, operands, frame, k)
+
+
+@special_form("let*")
+def start_let_star(expr: Pair, operands: List[Expression], frame: Frame, k: Optional[Continuation]) -> State:
+    return start_let(LetStar(), "let*", expr, operands, frame, k)
+
+
+class CaseKey(SpecialForm):
+    __slots__ = ("operands",)
+
+    def __init__(self, expr: Pair, frame: Frame, operands: List[Expression], next: Optional[Continuation]):
+        super().__init__(expr, frame, next)
+        self.operands = operands
+
+    def resume(self, value):
+        for case_i, case in enumerate(self.operands[1:]):
+            if not isinstance(case, Pair):
+                raise OperandDeduceError(f"Unable to evaluate clause of case, as {case} is not a Pair.")
+            expanded = pair_to_list(case)
+            eval_condition = SingletonTrue
+            if expanded[0] is not else_symbol and isinstance(expanded[0], Pair):
+                eval_condition = Memv().execute_evaluated([value, expanded[0]], self.frame)
+            elif expanded[0] is not else_symbol:
+                raise OperandDeduceError(f"Case clause expected list, received {expanded[0]}")
+            elif case_i != len(self.operands) - 2:  # exclude key from count
+                raise OperandDeduceError(f"Else clause can only be the last clause of case.")
+            if len(expanded) < 2:
+                raise OperandDeduceError(f"Case clause needs to have a length of at least two, received {case}.")
+            if expanded[0] is else_symbol or eval_condition is not SingletonFalse:
+                return evaluate_sequence(expanded[1:], self.frame, tail(self.expr, self.frame, self.next))
+        return Undefined, None, self.next
+
+
+@special_form("case")
+def start_case(expr: Pair, operands: List[Expression], frame: Frame, k: Optional[Continuation]) -> State:
+    verify_min_callable_length(Case(), 2, len(operands))
+    return operands[0], frame, CaseKey(expr, frame, operands, k)
+
+
+def collect_unquoted(template: Expression, splicing: bool, out: list):
+    """
+    Adds to out the expressions unquoted in template, as (expression, splicing) pairs in the order that
+    Quasiquote.quasiquote_evaluate evaluates them, followed by the error it would raise next, if any.
+    Returns False once it has added an error.
+    """
+    if not isinstance(template, Pair):
+        return True
+    if template.first is unquote_symbol or template.first is unquote_splicing_symbol:
+        if template.first is unquote_splicing_symbol and not splicing:
+            out.append(OperandDeduceError("Unquote-splicing must be in list template."))
+            return False
+        try:
+            verify_exact_callable_length(template.first, 1, len(pair_to_list(template)) - 1)
+        except SchemeError as e:
+            out.append(e)
+            return False
+        out.append((template.rest.first, splicing))
+        return True
+    if template.first is quasiquote_symbol:
+        return True
+    if Quasiquote.is_well_formed(template):
+        return all(collect_unquoted(element, isinstance(element, Pair) and element.first is unquote_splicing_symbol,
+                                    out) for element in pair_to_list(template))
+    if not log.logger.dotted:
+        out.append(OperandDeduceError(f"{template} is an ill-formed quasiquotation."))
+        return False
+    return collect_unquoted(template.first, False, out) and collect_unquoted(template.rest, False, out)
+
+
+def fill_template(template: Expression, values) -> Expression:
+    # the value of template, given an iterator over the values of the expressions unquoted in it, in order
+    if not isinstance(template, Pair) or template.first is quasiquote_symbol:
+        return template
+    if template.first is unquote_symbol or template.first is unquote_splicing_symbol:
+        return next(values)
+    if Quasiquote.is_well_formed(template):
+        out = []
+        for element in pair_to_list(template):
+            if isinstance(element, Pair) and element.first is unquote_splicing_symbol:
+                out.extend(pair_to_list(fill_template(element, values)))
+            else:
+                out.append(fill_template(element, values))
+        return make_list(out)
+    return Pair(fill_template(template.first, values), fill_template(template.rest, values))
+
+
+class QuasiquoteValue(SpecialForm):
+    __slots__ = ("unquoted", "values")
+
+    def __init__(self, expr: Pair, frame: Frame, unquoted: list, values: Tuple[Expression, ...],
+                 next: Optional[Continuation]):
+        super().__init__(expr, frame, next)
+        self.unquoted = unquoted
+        self.values = values
+
+    def resume(self, value):
+        if self.unquoted[len(self.values)][1] and not isinstance(value, (Pair, NilType)):
+            raise TypeMismatchError(f"Can only splice lists, not {value}.")
+        return evaluate_unquoted(self.expr, self.frame, self.unquoted, self.values + (value,), self.next)
+
+
+def evaluate_unquoted(expr: Pair, frame: Frame, unquoted: list, values: Tuple[Expression, ...],
+                      k: Optional[Continuation]) -> State:
+    if len(values) < len(unquoted):
+        if isinstance(unquoted[len(values)], SchemeError):
+            raise unquoted[len(values)]
+        return unquoted[len(values)][0], frame, QuasiquoteValue(expr, frame, unquoted, values, k)
+    return fill_template(pair_to_list(expr.rest)[0], iter(values)), None, k
+
+
+@special_form("quasiquote")
+def start_quasiquote(expr: Pair, operands: List[Expression], frame: Frame, k: Optional[Continuation]) -> State:
+    verify_exact_callable_length(Quasiquote(), 1, len(operands))
+    out = []
+    collect_unquoted(operands[0], False, out)
+    return evaluate_unquoted(expr, frame, out, (), k)
+
+
+controls = {}
+
+
+def control(cls):
+    def decorator(func):
+        controls[cls] = func
+        return func
+
+    return decorator
+
+
+class Return(Continuation):
+    __slots__ = ("value",)
+
+    def __init__(self, value: Expression, next: Optional[Continuation]):
+        super().__init__(next)
+        self.value = value
+
+    def resume(self, value):
+        return self.value, None, self.next
+
+
+@control(CallCC)
+def call_cc(expr: Pair, frame: Frame, operator: CallCC, values: List[Expression], k: Optional[Continuation]) -> State:
+    verify_exact_callable_length(operator, 1, len(values))
+    return apply_evaluated(expr, frame, values[0], None, [ContinuationObject(frame, k, True)], k)
+
+
+@control(ContinuationObject)
+def resume_continuation(expr: Pair, frame: Frame, continuation: ContinuationObject, values: List[Expression],
+                        k: Optional[Continuation]) -> State:
+    if not continuation.reentrant:
+        return complete(continuation.execute(values, frame, fake_obj, False), k)
+    return throw(expr, continuation, make_values(values), k)
+
+
+def winds(k: Optional[Continuation]) -> List['WindBody']:
+    out = []
+    wind = k and k.wind
+    while wind is not None:
+        out.append(wind)
+        wind = wind.next and wind.next.wind
+    return out
+
+
+def throw(expr: Pair, continuation: ContinuationObject, value: Expression, k: Optional[Continuation]) -> State:
+    # calls the after thunks of the dynamic-winds being left, then the before thunks of those being entered
+    leaving, entering = winds(k), winds(continuation.k)
+    shared = set(leaving) & set(entering)
+    thunks = [wind.after for wind in leaving if wind not in shared] + \
+             [wind.before for wind in reversed(entering) if wind not in shared]
+    return rewind(expr, continuation.frame, thunks, 0, value, continuation.k)
+
+
+def rewind(expr: Pair, frame: Frame, thunks: List[Expression], index: int, value: Expression,
+           k: Optional[Continuation]) -> State:
+    if index == len(thunks):
+        return value, None, k
+    return apply_evaluated(expr, frame, thunks[index], None, [], Rewind(expr, frame, thunks, index + 1, value, k))
+
+
+class Rewind(Continuation):
+    __slots__ = ("expr", "frame", "thunks", "index", "value")
+
+    def __init__(self, expr: Pair, frame: Frame, thunks: List[Expression], index: int, value: Expression,
+                 next: Optional[Continuation]):
+        super().__init__(next)
+        self.expr = expr
+        self.frame = frame
+        self.thunks = thunks
+        self.index = index
+        self.value = value
+
+    def resume(self, value):
+        return rewind(self.expr, self.frame, self.thunks, self.index, self.value, self.next)
+
+
+class ConsumeValues(SpecialForm):
+    __slots__ = ("consumer",)
+
+    def __init__(self, expr: Pair, frame: Frame, consumer: Expression, next: Optional[Continuation]):
+        super().__init__(expr, frame, next)
+        self.consumer = consumer
+
+    def resume(self, value):
+        values = value.values if isinstance(value, MultipleValues) else [value]
+        return apply_evaluated(self.expr, self.frame, self.consumer, None, list(values), self.next)
+
+
+@control(CallWithValues)
+def call_with_values(expr: Pair, frame: Frame, operator: CallWithValues, values: List[Expression],
+                     k: Optional[Continuation]) -> State:
+    verify_exact_callable_length(operator, 2, len(values))
+    producer, consumer = values
+    return apply_evaluated(expr, frame, producer, None, [], ConsumeValues(expr, frame, consumer, k))
+
+
+class WindBefore(SpecialForm):
+    __slots__ = ("before", "thunk", "after")
+
+    def __init__(self, expr: Pair, frame: Frame, before: Expression, thunk: Expression, after: Expression,
+                 next: Optional[Continuation]):
+        super().__init__(expr, frame, next)
+        self.before = before
+        self.thunk = thunk
+        self.after = after
+
+    def resume(self, value):
+        body = WindBody(self.expr, self.frame, self.before, self.after, self.next)
+        return apply_evaluated(self.expr, self.frame, self.thunk, None, [], body)
+
+
+class WindBody(SpecialForm):
+    __slots__ = ("before", "after")
+
+    def __init__(self, expr: Pair, frame: Frame, before: Expression, after: Expression,
+                 next: Optional[Continuation]):
+        super().__init__(expr, frame, next)
+        self.before = before
+        self.after = after
+        self.wind = self
+
+    def resume(self, value):
+        return apply_evaluated(self.expr, self.frame, self.after, None, [], Return(value, self.next))
+
+
+@control(DynamicWind)
+def dynamic_wind(expr: Pair, frame: Frame, operator: DynamicWind, values: List[Expression],
+                 k: Optional[Continuation]) -> State:
+    verify_exact_callable_length(operator, 3, len(values))
+    before, thunk, after = values
+    return apply_evaluated(expr, frame, before, None, [], WindBefore(expr, frame, before, thunk, after, k))
+
+
+@control(Eval)
+def eval_expression(expr: Pair, frame: Frame, operator: Eval, values: List[Expression],
+                    k: Optional[Continuation]) -> State:
+    if len(values) == 2:
+        raise UnsupportedOperationError("the standard eval procedure; it implements "
+                                        "a non-standard version that takes in just "
+                                        "an expression without an environment")
+    verify_exact_callable_length(operator, 1, len(values))
+    return values[0], frame, tail(expr, frame, k)
+
+
+@control(Apply)
+def apply_list(expr: Pair, frame: Frame, operator: Apply, values: List[Expression],
+               k: Optional[Continuation]) -> State:
+    verify_min_callable_length(operator, 2, len(values))
+    func, args_mid, last_arg = values[0], values[1:-1], values[-1]
+    if not isinstance(func, Applicable):
+        raise OperandDeduceError(f"Unable to apply {func}.")
+    if not isinstance(last_arg, Pair) and last_arg is not Nil:
+        raise OperandDeduceError(f"Expected last argument of apply to be a list, not {last_arg}.")
+    return apply_evaluated(expr, frame, func, None, args_mid + pair_to_list(last_arg), k)
+
+
+class ForceValue(SpecialForm):
+    __slots__ = ("promise",)
+
+    def __init__(self, expr: Pair, frame: Frame, promise: Promise, next: Optional[Continuation]):
+        super().__init__(expr, frame, next)
+        self.promise = promise
+
+    def resume(self, value):
+        if not log.logger.dotted and not isinstance(value, (Pair, NilType)):
+            raise TypeMismatchError(
+                f"Unable to force a Promise evaluating to {self.promise.expr}, expected another Pair or Nil")
+        self.promise.expr = value
+        self.promise.force()
+        return value, None, self.next
+
+
+@control(Force)
+def force(expr: Pair, frame: Frame, operator: Force, values: List[Expression], k: Optional[Continuation]) -> State:
+    verify_exact_callable_length(operator, 1, len(values))
+    promise = values[0]
+    if not isinstance(promise, Promise):
+        raise OperandDeduceError(f"Force expected a Promise, received {promise}")
+    if promise.forced:
+        return promise.expr, None, k
+    if log.logger.fragile:
+        raise IrreversibleOperationError()
+    return promise.expr, promise.frame, ForceValue(expr, frame, promise, k)
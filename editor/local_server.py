@@ -4,6 +4,7 @@ from _socket import timeout
 from http import server
 import io
 import json
+import queue
 import socketserver
 import subprocess
 import sys
@@ -16,24 +17,36 @@ from urllib.request import Request, urlopen
 
 import execution
 import log
+import profiler
+import session
+import static_files
+import wire
 from documentation import search
 from execution_parser import strip_comments
 from file_manager import get_scm_files, save, read_file, new_file
 from formatter import prettify
 from persistence import save_config, load_config
+from worker_pool import WorkerPool, WorkerExited
 from runtime_limiter import TimeLimitException, OperationCanceledException, scheme_limiter
 from scheme_exceptions import SchemeError, ParseError, TerminatedError
 
 PORT = 8012
 
+EXPIRED_MESSAGE = "This session has expired, click Run to start a new one."
+
 main_files = []
 
 state = {}
 
+sessions = {}  # the interpreter session of each client, by the id that it sends, see client_session
+sessions_lock = threading.Lock()
 
-class Handler(server.BaseHTTPRequestHandler):
-    cancellation_event = threading.Event()  # Shared across all instances, because the threading mixin creates a new instance every time...
+pool: WorkerPool = None  # if set, the worker processes that run the code of clients, see start
+
+assets = static_files.AssetCache("editor/static")
 
+
+class Handler(server.BaseHTTPRequestHandler):
     def do_POST(self):
         content_length = int(self.headers['Content-Length'])
         raw_data = self.rfile.read(content_length)
@@ -43,124 +56,242 @@ class Handler(server.BaseHTTPRequestHandler):
         return result
 
     def handle_post_thread(self, data, path):
+        if path == "/process_stream":
+            return self.stream_process(data)
+
+        content_type, body = respond(path, data, self.headers["Accept"])
         self.send_response(HTTPStatus.OK)
-        self.send_header("Content-type", "application/JSON")
+        self.send_header("Content-type", content_type)
         self.end_headers()
+        self.wfile.write(body)
 
-        if "code[]" not in data:
-            data["code[]"] = [""]
-
-        if path == "/cancel":
-            self.cancellation_event.set()
-
-        if path == "/process2":
-            self.cancellation_event.clear()  # Make sure we don't have lingering cancellation requests from before
-            code = data["code[]"]
-            curr_i = int(data["curr_i"][0])
-            curr_f = int(data["curr_f"][0])
-            global_frame_id = int(data["globalFrameID"][0])
-            visualize_tail_calls = data["tailViz"][0] == "true"
-            self.wfile.write(bytes(handle(code, curr_i, curr_f, global_frame_id, visualize_tail_calls,
-                                          cancellation_event=self.cancellation_event),
-                                   "utf-8"))
-
-        elif path == "/save":
-            code = data["code[]"]
-            filename = data["filename"][0]
-            do_save = data["do_save"][0] == "true"
-            if do_save:
-                save(code, filename)
-            self.wfile.write(bytes(json.dumps({"result": "success", "stripped": strip_comments(code)}), "utf-8"))
-
-        elif path == "/instant":
-            code = data["code[]"]
-            global_frame_id = int(data["globalFrameID"][0])
-            self.wfile.write(bytes(instant(code, global_frame_id), "utf-8"))
-
-        elif path == "/reformat":
-            code = data["code[]"]
-            javastyle = data["javastyle"][0] == "true"
-            self.wfile.write(bytes(json.dumps({"result": "success", "formatted": prettify(code, javastyle)}), "utf-8"))
-
-        elif path == "/list_files":
-            self.wfile.write(bytes(json.dumps(get_scm_files()), "utf-8"))
-
-        elif path == "/read_file":
-            filename = data["filename"][0]
-            self.wfile.write(bytes(json.dumps(read_file(filename)), "utf-8"))
-
-        elif path == "/new_file":
-            filename = data["filename"][0]
-            self.wfile.write(bytes(json.dumps({"success": new_file(filename)}), "utf-8"))
-
-        elif path == "/save_state":
-            global state
-            for key, val in json.loads(data["state"][0]).items():
-                if key == "states":
-                    if "states" not in state:
-                        state["states"] = val
-                    else:
-                        merge(state["states"], val)
-                else:
-                    state[key] = val
-            if "settings" in state:
-                save_config("settings", state["settings"])
-
-        elif path == "/load_state":
-            if "states" not in state:
-                self.wfile.write(b"fail")
-            else:
-                self.wfile.write(bytes(json.dumps(state), "utf-8"))
-
-        elif path == "/load_settings":
-            try:
-                if "settings" not in state:
-                    state["settings"] = {}
-                for key, val in load_config("settings").items():
-                    state["settings"][key] = val
-            except FileNotFoundError:
-                self.wfile.write(b"fail")
-            else:
-                self.wfile.write(bytes(json.dumps(state["settings"]), "utf-8"))
-
-
-        elif path == "/documentation":
-            query = data.get("query", [""])[0]
-            self.wfile.write(bytes(json.dumps(search(query)), "utf-8"))
-
-        elif path == "/kill":
+        if path == "/kill":
             # This is (only) fine because we're in a different thread than the actual server
             self.server.shutdown()
             self.server.socket.close()
 
-    def do_GET(self):
+    def stream_process(self, data):
+        # a /process2 whose output is sent while the code runs, as newline-delimited JSON or a stream of MessagePack
+        wire_format = wire.negotiate(self.headers["Accept"])
+        self.protocol_version = "HTTP/1.1"  # for chunked transfer encoding
         self.send_response(HTTPStatus.OK)
-        path = "editor/static/" + urllib.parse.unquote(self.path)[1:]
+        self.send_header("Content-type", STREAM_CONTENT_TYPES[wire_format])
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Connection", "close")
+        self.end_headers()
 
-        if "scripts" in path and not path.endswith(".js"):
-            path += ".js"
+        # chunks are written by another thread, so that the interpreter never waits for the client
+        chunks = queue.Queue()
 
-        if path.endswith(".css"):
-            self.send_header("Content-type", "text/css")
-        elif path.endswith(".js"):
-            self.send_header("Content-type", "application/javascript")
-        self.end_headers()
-        if path == "editor/static/":
-            path = "editor/static/index.html"
+        def write_chunks():
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    return
+                line = encode_chunk(chunk, wire_format)
+                try:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                except OSError:  # the client went away
+                    dispatch(session_id(data), "cancel")
+                    return
+
+        writer = threading.Thread(target=write_chunks)
+        writer.start()
         try:
-            with open(path, "rb") as f:  # lol better make sure that port is closed
-                self.wfile.write(f.read()
-                                 .replace(b"<START_DATA>",
-                                          bytes(repr(json.dumps({"files": main_files})),
-                                                "utf-8")))
-        except Exception as e:
-            print(e)
-            # raise
+            args, kwargs = stream_args(data)
+            dispatch(session_id(data), "run_stream", *args, write=chunks.put, **kwargs)
+        finally:
+            chunks.put(None)
+            writer.join()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        status, headers, body = static_file(urllib.parse.unquote(self.path), self.headers)
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
 
     def log_message(self, *args, **kwargs):
         pass
 
 
+STREAM_CONTENT_TYPES = {"json": "application/x-ndjson", "msgpack": wire.CONTENT_TYPES["msgpack"]}
+
+
+def session_id(data):
+    # the id of the session of the client that sent data, see client_session
+    return data.get("sessionId", [None])[0]
+
+
+def dispatch(session_id, name, *args, **kwargs):
+    # calls the function name of this module in the session session_id,
+    # in the worker process that holds it if the code of clients runs in a pool of them
+    if pool is not None:
+        try:
+            return pool.call(session_id, name, *args, **kwargs)
+        except WorkerExited as e:
+            return worker_exited(name, str(e), kwargs.get("write"))
+    # each request is handled in a thread of its own, which runs the code of the client in its session
+    with session.activate(client_session(session_id)):
+        return globals()[name](*args, **kwargs)
+
+
+def worker_exited(name, message, write=None):
+    # what the function name answers if the worker process running it exits, as it answers for an expired session
+    if name == "run":
+        return {"success": False, "out": [message]}
+    if name == "run_stream":
+        write({"done": True, "success": False, "out": message})
+    elif name in ("subtree", "instant"):
+        return json.dumps({"success": False, "out": [message]})
+
+
+def respond(path, data, accept=None):
+    """
+    Returns the content type and the body of the response to a POST of data to path, for any path but
+    /process_stream, which is answered as the code runs. accept is the Accept header of the request.
+    """
+    # only the responses to runs can be sent in other formats, see wire.negotiate
+    wire_format = wire.negotiate(accept) if path == "/process2" else "json"
+    out = b""
+
+    if "code[]" not in data:
+        data["code[]"] = [""]
+
+    if path == "/cancel":
+        dispatch(session_id(data), "cancel")
+
+    if path == "/process2":
+        code = data["code[]"]
+        curr_i = int(data["curr_i"][0])
+        curr_f = int(data["curr_f"][0])
+        global_frame_id = int(data["globalFrameID"][0])
+        visualize_tail_calls = data["tailViz"][0] == "true"
+        backend = data.get("backend", ["visual"])[0]
+        tree_format = data.get("treeFormat", ["states"])[0]
+        trace = json.loads(data.get("trace", ["{}"])[0])
+        tree_depth = int(data["treeDepth"][0]) if "treeDepth" in data else None
+        profile = data.get("profile", ["false"])[0] == "true"
+        result = dispatch(session_id(data), "run", code, curr_i, curr_f, global_frame_id, visualize_tail_calls,
+                          backend=backend, tree_format=tree_format, trace=trace, tree_depth=tree_depth,
+                          profile=profile)
+        out = wire.encode(result, wire_format)
+
+    elif path == "/save":
+        code = data["code[]"]
+        filename = data["filename"][0]
+        do_save = data["do_save"][0] == "true"
+        if do_save:
+            save(code, filename)
+        out = bytes(json.dumps({"result": "success", "stripped": strip_comments(code)}), "utf-8")
+
+    elif path == "/subtree":
+        out = bytes(dispatch(session_id(data), "subtree",
+                             int(data["globalFrameID"][0]),
+                             int(data["node"][0]),
+                             int(data["start"][0]),
+                             int(data["end"][0]),
+                             int(data["depth"][0])), "utf-8")
+
+    elif path == "/instant":
+        code = data["code[]"]
+        global_frame_id = int(data["globalFrameID"][0])
+        out = bytes(dispatch(session_id(data), "instant", code, global_frame_id), "utf-8")
+
+    elif path == "/reformat":
+        code = data["code[]"]
+        javastyle = data["javastyle"][0] == "true"
+        out = bytes(json.dumps({"result": "success", "formatted": prettify(code, javastyle)}), "utf-8")
+
+    elif path == "/list_files":
+        out = bytes(json.dumps(get_scm_files()), "utf-8")
+
+    elif path == "/read_file":
+        filename = data["filename"][0]
+        out = bytes(json.dumps(read_file(filename)), "utf-8")
+
+    elif path == "/new_file":
+        filename = data["filename"][0]
+        out = bytes(json.dumps({"success": new_file(filename)}), "utf-8")
+
+    elif path == "/save_state":
+        global state
+        new_state = json.loads(data["state"][0])
+        for key, val in new_state.items():
+            if key == "states":
+                if "states" not in state:
+                    state["states"] = val
+                else:
+                    merge(state["states"], val)
+            else:
+                state[key] = val
+        if "settings" in state:
+            save_config("settings", state["settings"])
+        # the state saved is shared by all clients, but each sends all of its own states
+        dispatch(session_id(data), "release_frames", new_state)
+
+    elif path == "/load_state":
+        if "states" not in state:
+            out = b"fail"
+        else:
+            out = bytes(json.dumps(state), "utf-8")
+
+    elif path == "/load_settings":
+        try:
+            if "settings" not in state:
+                state["settings"] = {}
+            for key, val in load_config("settings").items():
+                state["settings"][key] = val
+        except FileNotFoundError:
+            out = b"fail"
+        else:
+            out = bytes(json.dumps(state["settings"]), "utf-8")
+
+    elif path == "/documentation":
+        query = data.get("query", [""])[0]
+        out = bytes(json.dumps(search(query)), "utf-8")
+
+    return wire.CONTENT_TYPES[wire_format], out
+
+
+def stream_args(data):
+    # the arguments of run_stream, but for write, for a /process_stream of data
+    return ((data.get("code[]", [""]),
+             int(data["curr_i"][0]),
+             int(data["curr_f"][0]),
+             int(data["globalFrameID"][0]),
+             data["tailViz"][0] == "true"),
+            {"backend": data.get("backend", ["visual"])[0],
+             "trace": json.loads(data.get("trace", ["{}"])[0]),
+             "tree_depth": int(data["treeDepth"][0]) if "treeDepth" in data else None,
+             "profile": data.get("profile", ["false"])[0] == "true"})
+
+
+def encode_chunk(chunk, wire_format):
+    # a chunk of a /process_stream, as a line of JSON or as MessagePack
+    return wire.encode(chunk, wire_format) + (b"\n" if wire_format == "json" else b"")
+
+
+def static_file(path, headers):
+    # the status, headers and body of the response to a GET of path, given the headers of the request
+    path = path.split("?", 1)[0][1:]
+
+    if "scripts" in path and not path.endswith(".js"):
+        path += ".js"
+
+    if path == "":
+        path = "index.html"
+    substitutions = None
+    if path == "index.html":  # the only template, which gets the files that the editor was started with
+        substitutions = {b"<START_DATA>": bytes(repr(json.dumps({"files": main_files})), "utf-8")}
+    asset = assets.get(path, substitutions)
+    if asset is None:
+        return HTTPStatus.NOT_FOUND, [("Content-Length", "0")], b""
+    return static_files.respond(asset, headers)
+
+
 def merge(states, new_states):
     for i, new_state in enumerate(new_states):
         if i == len(states):
@@ -195,27 +326,189 @@ def cancelable_subprocess_call(cancellation_event, *args, **kwargs):
     return buffered.getvalue()
 
 
-def handle(code, curr_i, curr_f, global_frame_id, visualize_tail_calls, cancellation_event):
+def client_session(session_id):
+    # clients that do not send an id, such as those from before sessions, share the default session
+    if session_id is None:
+        return session.default
+    now = time.monotonic()
+    with sessions_lock:
+        client = sessions.get(session_id)
+        if client is None:
+            expire_sessions(now)
+            client = sessions[session_id] = session.Session()
+            # with the options that the editor was started with, see __main__
+            client.logger.dotted = session.default.logger.dotted
+            client.logger.spill_dir = session.default.logger.spill_dir
+        client.last_used = now
+        return client
+
+
+def expire_sessions(now):
+    # drops the sessions not used for SESSION_TTL, and with them their frames and traces, unless code runs in them.
+    # Their clients are told that their frames expired, as for frames released by release_frames.
+    for key, idle in list(sessions.items()):
+        if now - idle.last_used > session.SESSION_TTL and not idle.lock.locked():
+            del sessions[key]
+
+
+def retained_frame(global_frame_id):
+    frame = log.logger.retained.get(global_frame_id)
+    return frame and frame[0]
+
+
+def release_frames(state):
+    # the client saves its state after every run, which acknowledges the global frames it still holds. They are
+    # released at once, or by the code running in the session when it is done, so that the save does not wait for it
+    held = {state["globalFrameID"] for state in state.get("states", []) if "globalFrameID" in state}
+    generation = max((state.get("generation", -1) for state in state.get("states", [])), default=-1)
+    current = session.current()
+    current.pending_release = held, generation
+    if current.lock.acquire(blocking=False):
+        try:
+            release_pending(current)
+        finally:
+            current.lock.release()
+
+
+def release_pending(current):
+    # called with the lock of the session held. Each save sends all the states of the client, so only the last
+    # one needs to be applied
+    pending, current.pending_release = current.pending_release, None
+    if pending is not None:
+        current.logger.release_frames(*pending)
+
+
+def run(code, curr_i, curr_f, global_frame_id, visualize_tail_calls, **kwargs):
+    # handle, in the current session, once the query running in it is done
+    current = session.current()
+    with current.lock:
+        current.cancellation_event.clear()  # Make sure we don't have lingering cancellation requests from before
+        try:
+            return handle(code, curr_i, curr_f, global_frame_id, visualize_tail_calls, current.cancellation_event,
+                          **kwargs)
+        finally:
+            release_pending(current)
+
+
+def run_stream(code, curr_i, curr_f, global_frame_id, visualize_tail_calls, write, **kwargs):
+    # likewise for handle_stream
+    current = session.current()
+    with current.lock:
+        current.cancellation_event.clear()
+        try:
+            handle_stream(code, curr_i, curr_f, global_frame_id, visualize_tail_calls, current.cancellation_event,
+                          write, **kwargs)
+        finally:
+            release_pending(current)
+
+
+def cancel():
+    session.current().cancellation_event.set()
+
+
+def handle(code, curr_i, curr_f, global_frame_id, visualize_tail_calls, cancellation_event, backend="visual",
+           tree_format="states", trace=None, tree_depth=None, profile=False):
+    # trace holds the name and parameters of the trace policy, see log.make_policy,
+    # tree_depth the depth of the substitution tree to send, see log.Logger.lazy_tree,
+    # and profile whether to send a profile of the calls made, see profiler.Profile
+    if backend not in execution.BACKENDS:
+        return {"success": False, "out": [f"Unknown backend: {backend}"]}
+
+    try:
+        log.logger.policy = log.make_policy(**(trace or {}))
+    except ValueError as e:
+        return {"success": False, "out": [str(e)]}
+
+    global_frame = retained_frame(global_frame_id)
+    if global_frame_id != -1 and global_frame is None:
+        return {"success": False, "out": [EXPIRED_MESSAGE]}
 
     try:
-        global_frame = log.logger.frame_lookup.get(global_frame_id, None)
         log.logger.new_query(global_frame, curr_i, curr_f)
+        log.logger.tree_depth = tree_depth
+        log.logger.profile = profiler.Profile() if profile else None
         scheme_limiter(cancellation_event,
                        execution.string_exec,
                        code, log.logger.out,
                        visualize_tail_calls,
-                       global_frame.base if global_frame_id != -1 else None)
+                       global_frame.base if global_frame_id != -1 else None,
+                       backend)
     except OperationCanceledException:
-        return json.dumps({"success": False, "out": [str("operation was canceled")]})
+        return {"success": False, "out": [str("operation was canceled")]}
     except ParseError as e:
-        return json.dumps({"success": False, "out": [str(e)]})
+        return {"success": False, "out": [str(e)]}
 
-    out = log.logger.export()
-    return json.dumps(out)
+    return log.logger.export(tree_format)
+
+
+def handle_stream(code, curr_i, curr_f, global_frame_id, visualize_tail_calls, cancellation_event, write,
+                  backend="visual", trace=None, tree_depth=None, profile=False):
+    # like handle, but passes write the chunks of Logger.export_changes as they are made, the last with "done" set
+    if backend not in execution.BACKENDS:
+        write({"done": True, "success": False, "out": f"Unknown backend: {backend}"})
+        return
+
+    try:
+        log.logger.policy = log.make_policy(**(trace or {}))
+    except ValueError as e:
+        write({"done": True, "success": False, "out": str(e)})
+        return
+
+    global_frame = retained_frame(global_frame_id)
+    if global_frame_id != -1 and global_frame is None:
+        write({"done": True, "success": False, "out": EXPIRED_MESSAGE})
+        return
+
+    log.logger.new_query(global_frame, curr_i, curr_f)
+    log.logger.tree_depth = tree_depth
+    log.logger.profile = profiler.Profile() if profile else None
+    log.logger.stream_to(write)
+    try:
+        scheme_limiter(cancellation_event,
+                       execution.string_exec,
+                       code, log.logger.out,
+                       visualize_tail_calls,
+                       global_frame.base if global_frame_id != -1 else None,
+                       backend)
+    except OperationCanceledException:
+        write({"done": True, "success": False, "out": "operation was canceled"})
+    except ParseError as e:
+        write({"done": True, "success": False, "out": str(e)})
+    else:
+        log.logger.flush(done=True,
+                         success=True,
+                         graphics_open=log.logger.graphics_open,
+                         graphics=log.logger.get_canvas().export(),
+                         globalFrameID=id(log.logger.active_frames[0].base) if log.logger.active_frames else -1,
+                         generation=log.logger.generation,
+                         **({"profile": log.logger.profile.export()} if profile else {}))
+    finally:
+        log.logger.stream = None
+
+
+def subtree(global_frame_id, node, start, end, depth):
+    # the part of the substitution tree of a run that was left out of its response, see log.TraceStore
+    store = log.logger.trace_stores.get(global_frame_id)
+    if store is None:
+        return json.dumps({"success": False, "out": [EXPIRED_MESSAGE]})
+    return json.dumps({"success": True, "tree": store.subtree(node, start, end, depth)})
 
 
 def instant(code, global_frame_id):
-    global_frame = log.logger.frame_lookup[global_frame_id]
+    current = session.current()
+    # previews are dropped while the session runs other code, rather than waiting for it
+    if not current.lock.acquire(blocking=False):
+        return json.dumps({"success": False})
+    try:
+        return preview(code, global_frame_id)
+    finally:
+        current.lock.release()
+
+
+def preview(code, global_frame_id):
+    global_frame = retained_frame(global_frame_id)
+    if global_frame is None:
+        return json.dumps({"success": False})
     log.logger.new_query(global_frame)
     try:
         log.logger.preview_mode(True)
@@ -251,7 +544,9 @@ class ThreadedHTTPServer(socketserver.ThreadingMixIn, server.HTTPServer):
     daemon_threads = True
 
 
-def start(file_args, port, open_browser):
+def start(file_args, port, open_browser, workers=0, asynchronous=False):
+    # workers is the number of processes to run the code of clients in, or 0 to run it in the server's threads,
+    # and asynchronous whether to serve on asyncio, see async_server.Server, rather than in a thread per request
     global main_files
     main_files = file_args
     global PORT
@@ -269,7 +564,11 @@ def start(file_args, port, open_browser):
             pass
 
         try:
-            httpd = ThreadedHTTPServer(("127.0.0.1", port), Handler)
+            if asynchronous:
+                import async_server
+                httpd = async_server.Server(("127.0.0.1", port))
+            else:
+                httpd = ThreadedHTTPServer(("127.0.0.1", port), Handler)
         except OSError as e:
             print(f"Port {port} is currently in use, trying a different port...")
         else:
@@ -285,6 +584,10 @@ def start(file_args, port, open_browser):
             print("\033[0m", end="")
         return
 
+    if workers:
+        global pool
+        pool = WorkerPool(workers, {"dotted": log.logger.dotted, "spill_dir": log.logger.spill_dir})
+
     print(url)
 
     if open_browser:
@@ -1,16 +1,33 @@
+import sys
+import time
+import types
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
 from enum import Enum
-from typing import List, Union, Dict, Tuple, TYPE_CHECKING
+from typing import Callable, List, Union, Dict, Set, Tuple, TYPE_CHECKING
 
-from datamodel import Expression, ValueHolder, Pair, Nil, Symbol, Undefined, Promise, NilType, UndefinedType, Vector
+from datamodel import Expression, ValueHolder, Pair, Nil, Symbol, Undefined, Promise, NilType, UndefinedType, Vector, \
+    MultipleValues
 import evaluate_apply
+import session
+import spill
 from helper import pair_to_list
 from log_utils import get_id
 from scheme_exceptions import OperandDeduceError
 
 if TYPE_CHECKING:
     import graphics
+    import profiler
 
-OP_LIMIT = 25000
+OP_LIMIT = 25000  # operations recorded by the default trace policy
+TRACE_BUDGET = 64 * 2 ** 20  # default size in bytes of the trace kept for a query
+CHANGE_SIZE = 96  # approximate size in bytes of a tree change or binding, besides its strings
+STREAM_INTERVAL = 0.1  # seconds between the chunks sent to a stream
+SPILL_RECORDS = 4096  # step records of an expression kept in memory before they are spilled, if spilling
+SPILLED_TREE_DEPTH = 4  # depth of the tree sent when spilling, unless the client asks for another
+MAX_TRACEBACK_LENGTH = 20  # entries of the eval stack printed in a traceback, see Logger.eval_omitted
 
 
 class HolderState(Enum):
@@ -20,13 +37,27 @@ class HolderState(Enum):
     APPLYING = 4
 
 
+# the order the client also uses to decode transition types in the exported tree
+TRANSITION_TYPES = [state.name for state in HolderState]
+
+
 class FakeObj:
+    """
+    Stand-in for a Holder or VisualExpression that swallows all bookkeeping.
+    Used once the trace policy stops expanding expressions, and as the root holder in headless mode.
+    """
     def __getattr__(self, item):
         return fake_obj
 
+    def __setattr__(self, key, value):
+        pass
+
     def __getitem__(self, item):
         return fake_obj
 
+    def __setitem__(self, key, value):
+        pass
+
     def __call__(self, *args, **kwargs):
         return fake_obj
 
@@ -35,6 +66,8 @@ fake_obj = FakeObj()
 
 
 class VisualExpression:
+    __slots__ = ("display_value", "base_expr", "value", "children", "id")
+
     def __init__(self, base_expr: Expression = None, true_base_expr: Expression = None):
         self.display_value = base_expr
         self.base_expr = base_expr if true_base_expr is None else true_base_expr
@@ -42,7 +75,8 @@ class VisualExpression:
         self.children: List[Holder] = []
         self.id = get_id()
 
-        if logger.op_count >= OP_LIMIT:
+        logger = session.current().logger
+        if not logger.policy.expands(logger):
             self.children = fake_obj
             return
 
@@ -51,6 +85,7 @@ class VisualExpression:
         if isinstance(base_expr, ValueHolder) \
                 or isinstance(base_expr, evaluate_apply.Callable) \
                 or isinstance(base_expr, Promise) \
+                or isinstance(base_expr, MultipleValues) \
                 or base_expr == Nil \
                 or base_expr == Undefined:
             self.value = base_expr
@@ -68,10 +103,10 @@ class VisualExpression:
         self.value = None
         self.children = [Holder(expression, self) for expression in expressions]
         if expressions and isinstance(expressions[0], VisualExpression):
+            logger = session.current().logger
             if self.id in logger.node_cache:
-                if logger.node_cache[self.id].transitions:
-                    curr_transition = HolderState[logger.node_cache[self.id].transitions[-1][-1]]
-                else:
+                curr_transition = logger.node_cache[self.id].transition
+                if curr_transition is None:
                     return self
                 logger.node_cache[self.id].modify(self, curr_transition)
         return self
@@ -83,6 +118,8 @@ class VisualExpression:
 
 
 class Holder:
+    __slots__ = ("expression", "state", "parent")
+
     def __init__(self, expr: Expression, parent: VisualExpression):
         self.expression: VisualExpression = VisualExpression(expr) if isinstance(expr, Expression) else expr
         self.state = HolderState.UNEVALUATED
@@ -90,32 +127,31 @@ class Holder:
 
     def evaluate(self):
         self.state = HolderState.EVALUATING
-        announce("Evaluating", self, Root.root)
+        current = session.current()
+        current.announce("Evaluating", self, current.root)
 
     def apply(self):
         self.state = HolderState.APPLYING
-        announce("Applying", self, Root.root)
+        current = session.current()
+        current.announce("Applying", self, current.root)
 
     def complete(self):
         self.state = HolderState.EVALUATED
-        announce("Completed", self, Root.root)
+        current = session.current()
+        current.announce("Completed", self, current.root)
+        # a completed expression is shown by its value alone, so its subtree is no longer needed
+        if self.expression.children is not fake_obj:
+            for child in self.expression.children:
+                current.logger.node_cache.pop(child.expression.id, None)
+            self.expression.children = []
 
     def __repr__(self):
         return repr(self.expression)
 
 
-class Root:
-    root: Holder
-    set: bool = False
-
-    @classmethod
-    def setroot(cls, root: Holder):
-        cls.root = root
-
-
 def limited(f):
     def g(*args, **kwargs):
-        if not logger.log_op() and not kwargs.get("force", False):
+        if not session.local.session.logger.log_op() and not kwargs.get("force", False):
             return
         if "force" in kwargs:
             del kwargs["force"]
@@ -123,6 +159,188 @@ def limited(f):
     return g
 
 
+def change_size(change: list) -> int:
+    value = change[-1]
+    if isinstance(value, str):
+        return CHANGE_SIZE + len(value)
+    if isinstance(value, list):
+        return CHANGE_SIZE + 8 * len(value)
+    return CHANGE_SIZE
+
+
+class TracePolicy:
+    """
+    Decides which operations of a query are recorded, and how the changes to the substitution tree are kept.
+    This policy records everything, until the kept trace reaches budget bytes. Past the budget, nothing is
+    recorded and new expressions are evaluated headlessly, as they were once OP_LIMIT was hit.
+    """
+    def __init__(self, budget: int = TRACE_BUDGET):
+        self.budget = budget
+
+    def records(self, logger: 'Logger') -> bool:
+        return logger.trace_bytes < self.budget
+
+    def expands(self, logger: 'Logger') -> bool:
+        # whether a new expression is added to the substitution tree with its subexpressions
+        return self.records(logger)
+
+    def change(self, logger: 'Logger', change: list):
+        logger.add_change(logger.i, change)
+
+    def end_expr(self, logger: 'Logger'):
+        # called before the expression record of each expression is added to logger.tree
+        pass
+
+    def reset(self):
+        pass
+
+
+class FirstAndLast(TracePolicy):
+    """
+    Records the first operations of a query, then keeps only the last steps of each expression.
+    Older steps are folded into a snapshot of the latest change to each field of each node, which is
+    exported as a single step before the last ones, so the steps in between show no changes.
+    With last = 0, nothing is recorded after the first operations, like the old OP_LIMIT cutoff.
+    """
+    def __init__(self, first: int = OP_LIMIT, last: int = 0, budget: int = TRACE_BUDGET):
+        super().__init__(budget)
+        self.first = first
+        self.last = last
+        self.reset()
+
+    def reset(self):
+        self.ring = deque()  # the last steps, as step records
+        self.snapshot: Dict[Tuple[int, str], list] = {}  # the latest change to each field of each node before them
+        self.snapshot_i = None
+        self.pruned_size = 0
+
+    def records(self, logger):
+        return (logger.op_count < self.first or self.last > 0) and logger.trace_bytes < self.budget
+
+    def change(self, logger, change):
+        if logger.op_count < self.first:
+            logger.add_change(logger.i, change)
+            return
+        if not self.ring or self.ring[-1][0] != logger.i:
+            self.ring.append([logger.i])
+        self.ring[-1].append(change)
+        logger.trace_bytes += change_size(change)
+        while len(self.ring) > self.last or logger.trace_bytes >= self.budget and len(self.ring) > 1:
+            self.fold(logger)
+
+    def fold(self, logger):
+        record = self.ring.popleft()
+        self.snapshot_i = record[0]
+        for change in record[1:]:
+            key = change[0], change[1]
+            if key in self.snapshot:
+                logger.trace_bytes -= change_size(self.snapshot[key])
+            self.snapshot[key] = change
+        if len(self.snapshot) > 2 * self.pruned_size + 1024:
+            self.prune(logger)
+
+    def prune(self, logger):
+        # drops the nodes that are no longer in the tree, unless the last steps change them
+        children = {node: change[2] for (node, field), change in self.snapshot.items() if field == "c"}
+        roots = [int(session.current().root.expression.id)]
+        for record in self.ring:
+            for change in record[1:]:
+                roots.append(change[0])
+                if change[1] == "c":
+                    roots.extend(change[2])
+        drop_unreachable(logger, self.snapshot, reachable(roots, children))
+        self.pruned_size = len(self.snapshot)
+
+    def end_expr(self, logger):
+        if self.snapshot:
+            logger.tree.append([self.snapshot_i, *self.snapshot.values()])
+        logger.tree.extend(self.ring)
+        self.reset()
+
+
+class TopLevels(TracePolicy):
+    """
+    Expands only the expressions evaluated in the first depth levels of the evaluation stack.
+    Deeper ones are evaluated headlessly, and appear in the tree only with their values.
+    """
+    def __init__(self, depth: int = 20, budget: int = TRACE_BUDGET):
+        super().__init__(budget)
+        self.depth = depth
+
+    def expands(self, logger):
+        return len(logger.eval_stack) + logger.eval_omitted <= self.depth and self.records(logger)
+
+
+class EveryNth(TracePolicy):
+    """
+    Keeps the tree at every nth step: the changes made between two of those steps are merged into a
+    single step, holding the latest change to each field of each node.
+    """
+    def __init__(self, n: int = 10, budget: int = TRACE_BUDGET):
+        super().__init__(budget)
+        self.n = n
+        self.reset()
+
+    def reset(self):
+        self.pending: Dict[Tuple[int, str], list] = {}  # the latest change to each field of each node
+        self.pending_i = None
+        self.children: Dict[int, list] = {}  # the children of each node in the tree at the last step kept
+
+    def change(self, logger, change):
+        if self.pending and logger.i // self.n != self.pending_i // self.n:
+            self.keep_step(logger)
+        key = change[0], change[1]
+        if key in self.pending:
+            logger.trace_bytes -= change_size(self.pending[key])
+        self.pending[key] = change
+        self.pending_i = logger.i
+        logger.trace_bytes += change_size(change)
+
+    def keep_step(self, logger):
+        # nodes made and completed since the last step kept are never seen, so their changes are dropped
+        self.children.update((node, change[2]) for (node, field), change in self.pending.items() if field == "c")
+        live = reachable([int(session.current().root.expression.id)], self.children)
+        drop_unreachable(logger, self.pending, live)
+        self.children = {node: children for node, children in self.children.items() if node in live}
+        logger.tree.append([self.pending_i, *self.pending.values()])
+        self.pending = {}
+
+    def end_expr(self, logger):
+        if self.pending:
+            self.keep_step(logger)
+        self.reset()
+
+
+def reachable(roots: List[int], children: Dict[int, list]) -> set:
+    out = set()
+    stack = list(roots)
+    while stack:
+        node = stack.pop()
+        if node not in out:
+            out.add(node)
+            stack.extend(children.get(node, ()))
+    return out
+
+
+def drop_unreachable(logger: 'Logger', changes: Dict[Tuple[int, str], list], live: set):
+    for key in [key for key in changes if key[0] not in live]:
+        logger.trace_bytes -= change_size(changes.pop(key))
+        # so that the node is sent in full if it is ever shown again
+        logger.node_cache.pop(str(key[0]), None)
+
+
+TRACE_POLICIES = {"all": TracePolicy, "first": FirstAndLast, "depth": TopLevels, "sample": EveryNth}
+
+
+def make_policy(policy: str = "first", **params) -> TracePolicy:
+    if policy not in TRACE_POLICIES:
+        raise ValueError(f"Unknown trace policy: {policy}")
+    try:
+        return TRACE_POLICIES[policy](**params)
+    except TypeError as e:
+        raise ValueError(f"Invalid parameters for trace policy {policy}: {e}")
+
+
 class Logger:
     def __init__(self):
         self._out = [[]]  # text printed to console
@@ -131,7 +349,11 @@ class Logger:
         self.start = 0  # the step of the current expr
 
         self.f_delta = 0  # the index of the first frame to generate
-        self.frame_lookup: Dict[int, StoredFrame] = {}  # lookup of all previous frames TODO: use weakrefs or something
+        # lookup of all previous frames whose Frame is still alive, which keeps its StoredFrame alive in turn
+        self.frame_lookup: Dict[int, StoredFrame] = weakref.WeakValueDictionary()
+        # the global frames that the client may still run code in, with the query that last returned each
+        self.retained: Dict[int, Tuple[StoredFrame, int]] = {}
+        self.generation = 0  # the number of queries so far
         self.active_frames: List[StoredFrame] = []  # new frames to be added to the js frame store
         self.frame_updates = []  # when the env diagram is updated
         self.global_frame: StoredFrame = None
@@ -145,10 +367,23 @@ class Logger:
         self.show_thunks = True
 
         self.node_cache: Dict[str, Node] = {}  # a cache of visual expressions
-        self.export_states = []  # all the nodes generated in the current evaluation, in exported form
-        self.roots = []  # the root node of each expr we are currently evaluating
-
-        self.eval_stack = []  # the eval stack for use in tracebacks
+        # changes to the substitution tree in the current evaluation, in the format described by tree_change
+        self.tree = []
+        self.tree_strings: Dict[str, int] = {}  # index of each string already sent in self.tree
+        self.tree_start = 0  # where the records of the current expr start in self.tree
+        self.tree_depth: int = None  # if set, only nodes this close to the root of their expression are exported
+        self.trace_stores: Dict[int, TraceStore] = {}  # the whole trees of the expressions run in each global frame
+        self.tree_stored = 0  # the number of records at the start of self.tree that are in a trace store already
+        self.spill_dir: str = None  # if set, trace stores and heap records are kept in files there, see spill_to
+        # the repr of each pair and vector shown in the current query, with the object, so that its id stays unique
+        self.reprs: Dict[int, Tuple[Expression, str]] = {}
+
+        # the eval stack for use in tracebacks, as (expression, frame) pairs rendered only if an error is printed
+        self.eval_stack: List[Tuple[Expression, 'evaluate_apply.Frame']] = []
+        # the number of entries left out of the eval stack to keep chains of tail calls in constant space.
+        # A traceback prints only the first MAX_TRACEBACK_LENGTH - 1 entries and the last one, so the
+        # evaluators leave out entries that would be past the first ones and not the last when printed.
+        self.eval_omitted = 0
 
         self.heap: Heap = Heap()  # heap of all non-atomic objects
 
@@ -156,30 +391,168 @@ class Logger:
         self.graphics_open = False
 
         self.op_count = 0
+        self.policy: TracePolicy = FirstAndLast()
+        self.trace_bytes = 0  # approximate size of the trace recorded by the current query
+
+        self.profile: 'profiler.Profile' = None  # if set, profiles the calls of the current query
+        self.stream: Callable[[dict], None] = None  # gets the changes of the current query as they are made
+        self.stream_time = 0  # when the next chunk is due
+        self.new_frames: List[StoredFrame] = []  # frames created since the last chunk
+        self.stream_bindings: Dict[int, int] = {}  # number of bindings already sent of each frame
+        self.changed_frames: Dict[int, StoredFrame] = {}  # frames bound since the last chunk
 
     def new_expr(self):
         self._out.append([])
-        if Root.set and self.start != self.i:
-            self.export_states.append((self.start, self.i, {i: v.export() for i, v in self.node_cache.items()}))
-            self.roots.append(Root.root.expression.id)
+        self.policy.end_expr(self)
+        current = session.current()
+        if current.root_set and self.start != self.i:
+            self.tree.append(["expr", self.start, self.i, int(current.root.expression.id)])
+        elif len(self.tree) != self.tree_start:
+            self.tree.append(["expr", self.start, self.i, None])
+        self.tree_start = len(self.tree)
         self.start = self.i
         self.node_cache = {}
-        Root.set = True
+        current.root_set = True
         self.eval_stack = []
+        self.eval_omitted = 0
 
     def new_query(self, global_frame: 'StoredFrame'=None, curr_i=0, curr_f=0):
+        self.generation += 1
         self.node_cache = {}
         self.i = curr_i
         self.f_delta = curr_f
         self.start = curr_i
         self._out = []
         self.active_frames = []
-        self.roots = []
-        self.export_states = []
+        self.reset_tree()
         self.frame_updates = []
         self.global_frame = global_frame
         self.graphics_open = False
         self.op_count = 0
+        self.trace_bytes = 0
+        self.stream = None
+        self.new_frames = []
+        self.changed_frames = {}
+        self.reprs = {}
+        self.tree_depth = None
+        self.profile = None
+
+    def reset_tree(self):
+        self.tree = []
+        self.tree_strings = {}
+        self.tree_start = 0
+        self.tree_stored = 0
+        self.policy.reset()
+
+    def tree_change(self, node_id: str, field: str, value):
+        """
+        Records a change to a node of the substitution tree at the current step, as the policy keeps it.
+        The tree is a list of records in the order they were made. A step record
+        [i, [node, field, value], ...] holds the changes made at step i, where field is
+            "t": the node's transition type, as an index into TRANSITION_TYPES
+            "s": its string, or "p": the string of its parent expression, which encode_tree replaces by
+                 the index of the same string among those already sent, if any
+            "c": its children, which replace any children set earlier in the same step.
+        An expression record ["expr", start, end, root] ends the nodes of one expression, which ran
+        from step start to end, or discards them if root is None.
+        """
+        self.policy.change(self, [int(node_id), field, value])
+
+    def add_change(self, i: int, change: list):
+        if not self.tree or self.tree[-1][0] != i:
+            if self.spill_dir is not None and self.global_frame is not None \
+                    and len(self.tree) - self.tree_start >= SPILL_RECORDS:
+                self.spill_tree()
+            self.tree.append([i])
+        self.tree[-1].append(change)
+        self.trace_bytes += change_size(change)
+
+    def encode_tree(self, tree: list) -> list:
+        out = []
+        for record in tree:
+            if record[0] != "expr":
+                record = [record[0], *(self.encode_change(change) for change in record[1:])]
+            out.append(record)
+        return out
+
+    def encode_change(self, change: list) -> list:
+        node_id, field, value = change
+        if field == "s" or field == "p":
+            index = self.tree_strings.get(value)
+            if index is None:
+                self.tree_strings[value] = len(self.tree_strings)
+            else:
+                return [node_id, field, index]
+        return change
+
+    def spill_to(self, directory: str):
+        """
+        Keeps the trees of long runs in files in directory rather than in memory. The records of an expression
+        are moved to the trace store of its global frame while it runs, so the tree is always sent lazily,
+        as if the client had asked for a tree depth.
+        """
+        self.spill_dir = directory
+
+    def lazy_depth(self) -> int:
+        if self.tree_depth is None and self.spill_dir is not None:
+            return SPILLED_TREE_DEPTH
+        return self.tree_depth
+
+    def trace_store(self) -> 'TraceStore':
+        key = id(self.global_frame.base)
+        if key not in self.trace_stores:
+            self.trace_stores[key] = TraceStore() if self.spill_dir is None else TraceFile(self.spill_dir)
+        return self.trace_stores[key]
+
+    def spill_tree(self):
+        # called before a new step is recorded, so the records of the current expression so far are complete
+        store = self.trace_store()
+        for record in self.tree[self.tree_start:]:
+            store.add(record)
+            self.trace_bytes -= sum(change_size(change) for change in record[1:])
+        del self.tree[self.tree_start:]
+
+    def lazy_tree(self, tree: list) -> list:
+        """
+        Adds the records of the expressions that end in tree to the trace store of the global frame, and returns
+        them with only the nodes at most lazy_depth() below each root, for the client to fetch the rest from the
+        store when it shows them. Records after the last expression record are returned as they are.
+        """
+        depth = self.lazy_depth()
+        if depth is None or self.global_frame is None:
+            return tree
+        store = self.trace_store()
+        out = []
+        start = 0
+        for end, record in enumerate(tree):
+            if record[0] != "expr":
+                continue
+            _, first, last, root = record
+            if root is not None:
+                if end >= self.tree_stored:
+                    for step in tree[start:end]:
+                        store.add(step)
+                out.extend(store.subtree(root, first, last, depth))
+            out.append(record)
+            start = end + 1
+        self.tree_stored = max(self.tree_stored, start)
+        return out + tree[start:]
+
+    def expr_str(self, expr: Expression, to_str: Callable[[Expression], str] = str) -> str:
+        """
+        Returns to_str(expr), which is computed only once per query for a pair or vector, since its repr
+        walks the whole structure, and the same code and values are shown again at every step that shows them.
+        """
+        if not isinstance(expr, (Pair, Vector)):
+            return to_str(expr)
+        cached = self.reprs.get(id(expr))
+        if cached is None:
+            cached = self.reprs[id(expr)] = expr, repr(expr)
+        return cached[1]
+
+    def forget_reprs(self):
+        # called when a pair or vector is mutated, which changes the repr of everything that contains it
+        self.reprs = {}
 
     def get_canvas(self) -> 'graphics.Canvas':
         self.graphics_open = True
@@ -196,11 +569,36 @@ class Logger:
         self.new_node(local.expression, local.state)
         self.i += 1
 
-    def export(self):
+    def retain_global_frame(self):
+        if self.global_frame is not None:
+            self.retained[id(self.global_frame.base)] = self.global_frame, self.generation
+
+    def release_frames(self, held: set, generation: int):
+        """
+        Stops retaining the global frames that the client no longer holds, according to state it saved after
+        receiving the results of query generation. Frames that only they could reach are then freed, and so
+        are their bindings, once Python collects their Frames.
+        """
+        released = [key for key, (frame, returned) in self.retained.items()
+                    if key not in held and returned <= generation and frame is not self.global_frame]
+        for key in released:
+            del self.retained[key]
+            self.graphics_lookup.pop(key, None)
+            self.trace_stores.pop(key, None)
+        if released:
+            # objects that are still alive are recorded again, the next time they are bound
+            self.heap = Heap()
+
+    def export(self, tree_format="states"):
+        self.retain_global_frame()
+        if tree_format == "delta":
+            tree = {"tree": self.encode_tree(self.lazy_tree(self.tree))}
+        else:
+            roots, states = states_from_tree(self.lazy_tree(self.tree))
+            tree = {"roots": roots, "states": states}
         return {
             "success": True,
-            "roots": self.roots,
-            "states": self.export_states,
+            **tree,
             "out": ["".join(["".join(x) for x in self._out])],
             "active_frames": [id(f.base) for f in self.active_frames],
             "frame_lookup": {id(f.base): self.frame_lookup[id(f.base)].export()
@@ -209,8 +607,71 @@ class Logger:
             "graphics": self.get_canvas().export(),
             "globalFrameID": id(self.active_frames[0].base) if self.active_frames else -1,
             "heap": self.heap.export(),
-            "frameUpdates": sorted(set(self.frame_updates))
+            "frameUpdates": sorted(set(self.frame_updates)),
+            "generation": self.generation,
+            **({"profile": self.profile.export()} if self.profile is not None else {}),
+        }
+
+    def stream_to(self, write: Callable[[dict], None]):
+        """
+        Sends the changes made by the rest of the query to write, in chunks made by export_changes,
+        at most every STREAM_INTERVAL seconds while it runs. The caller sends the last chunk with flush.
+        """
+        self.stream = write
+        self.stream_time = time.monotonic() + STREAM_INTERVAL
+        self.stream_bindings = {}
+
+    def poll_stream(self):
+        if time.monotonic() > self.stream_time:
+            self.flush()
+
+    def flush(self, **extra):
+        self.stream({**self.export_changes(), **extra})
+        self.stream_time = time.monotonic() + STREAM_INTERVAL
+
+    def export_changes(self):
+        """
+        Exports what changed since the last chunk in the format of export("delta"), except that "out"
+        is a string and frames hold only the bindings made since they were last sent.
+        The exported changes are dropped, so that the memory used does not grow with the length of the trace.
+        """
+        self.retain_global_frame()
+        frames = {id(f.base): f for f in self.new_frames}
+        frames.update(self.changed_frames)
+        if self.global_frame is not None and id(self.global_frame.base) not in self.stream_bindings:
+            frames[id(self.global_frame.base)] = self.global_frame
+        sent_records = len(self.tree)
+        if self.lazy_depth() is not None:
+            # the depths of the nodes of an expression are only known once it ends
+            sent_records = next((k + 1 for k in reversed(range(len(self.tree))) if self.tree[k][0] == "expr"), 0)
+        frame_lookup = {}
+        sent = {}
+        for key, frame in frames.items():
+            data = frame.export()
+            if data is None:  # the builtins frame, which is never drawn
+                continue
+            data["bindings"] = frame.bindings[self.stream_bindings.get(key, 0):]
+            frame_lookup[key] = data
+            sent[key] = len(frame.bindings)
+        out = {
+            "tree": self.encode_tree(self.lazy_tree(self.tree[:sent_records])),
+            "out": "".join(["".join(x) for x in self._out]),
+            "active_frames": [id(f.base) for f in self.new_frames if id(f.base) in frame_lookup],
+            "frame_lookup": frame_lookup,
+            "frameUpdates": sorted(set(self.frame_updates)),
         }
+        # nothing is dropped until the chunk is complete, in case a RecursionError interrupts it
+        out["heap"] = self.heap.export()
+        self.stream_bindings.update(sent)
+        # tree_start stays relative to the records not yet sent, so new_expr still sees the sent ones
+        self.tree_start -= sent_records
+        self.tree_stored = max(0, self.tree_stored - sent_records)
+        self.tree = self.tree[sent_records:]
+        self._out = []
+        self.new_frames = []
+        self.changed_frames = {}
+        self.frame_updates = []
+        return out
 
     def out(self, val, end="\n"):
         self.raw_out(repr(val) + end)
@@ -220,12 +681,16 @@ class Logger:
             self._out[-1].append(val)
         else:
             self._out = [[val]]
+        if self.stream is not None:
+            self.poll_stream()
 
     @limited
     def frame_create(self, frame: 'evaluate_apply.Frame'):
         self.frame_lookup[id(frame)] = stored = StoredFrame(len(self.active_frames), frame)
         self.active_frames.append(stored)
+        self.new_frames.append(stored)
         frame.id = stored.name
+        frame.stored = stored
 
     @limited
     def frame_store(self, frame: 'evaluate_apply.Frame', name: str, value: Expression):
@@ -241,54 +706,177 @@ class Logger:
     def log_op(self):
         self.op_count += 1
         # print(self.op_count)
-        return self.op_count < OP_LIMIT
+        if self.stream is not None:
+            self.poll_stream()
+        return self.policy.records(self)
 
 
 class Node:
+    # keeps the latest state of a node, whose changes go to logger.tree
+    __slots__ = ("transition", "str", "base_str", "id")
+
     def __init__(self, expr: VisualExpression, transition_type: HolderState):
-        self.transitions = []
-        self.str = []
-        self.base_str = []
-        self.children = []
+        self.transition: HolderState = None
+        self.str = None
+        self.base_str = None
         self.id = expr.id
         self.modify(expr, transition_type)
 
     @limited
     def modify(self, expr: VisualExpression, transition_type: HolderState):
-        if not self.transitions or self.transitions[-1][1] != transition_type.name:
-            self.transitions.append((logger.i, transition_type.name))
-        if not self.str or self.str[-1][1] != repr(expr):
-            self.str.append((logger.i, repr(expr)))
-
-        while self.children and self.children[-1][0] == logger.i:
-            self.children.pop()
-
-        if expr.value is None:
-            self.children.append(
-                (logger.i,
-                 [logger.new_node(child.expression, child.state) for child in expr.children]))
+        logger = session.current().logger
+        if self.transition is not transition_type:
+            self.transition = transition_type
+            logger.tree_change(self.id, "t", TRANSITION_TYPES.index(transition_type.name))
+        new_str = logger.expr_str(expr.display_value if expr.value is None else expr.value)
+        if self.str != new_str:
+            self.str = new_str
+            logger.tree_change(self.id, "s", new_str)
+
+        if expr.value is None and expr.children is not fake_obj:  # an unexpanded expression shows no children
+            children = [int(logger.new_node(child.expression, child.state)) for child in expr.children]
         else:
-            self.children.append((logger.i, []))
-
-        new_base_str = repr(expr.base_expr)
+            children = []
+        logger.tree_change(self.id, "c", children)
 
-        if not self.base_str or self.base_str[-1][1] != new_base_str:
-            self.base_str.append((logger.i, new_base_str))
+        new_base_str = logger.expr_str(expr.base_expr, repr)
+        if self.base_str != new_base_str:
+            self.base_str = new_base_str
+            logger.tree_change(self.id, "p", new_base_str)
 
         return self.id
 
-    def export(self):
-        return {
-            "transitions": self.transitions,
-            "strs": self.str,
-            "parent_strs": self.base_str,
-            "children": [(i, [x for x in y]) for i, y in self.children]
-        }
+
+def states_from_tree(tree: list) -> Tuple[list, list]:
+    """
+    Rebuilds the roots and states that the substitution tree used to be exported as from the
+    records of Logger.tree: for each expression, its root node and (start, end, nodes), where
+    nodes maps each node to the steps at which its transition type, strings and children changed.
+    """
+    roots, states = [], []
+    strings = []
+    nodes = {}
+
+    def node(node_id):
+        node_id = str(node_id)
+        if node_id not in nodes:
+            nodes[node_id] = {"transitions": [], "strs": [], "parent_strs": [], "children": []}
+        return nodes[node_id]
+
+    for record in tree:
+        if record[0] == "expr":
+            _, start, end, root = record
+            if root is not None:
+                states.append((start, end, nodes))
+                roots.append(str(root))
+            nodes = {}
+            continue
+        i = record[0]
+        for node_id, field, value in record[1:]:
+            data = node(node_id)
+            if field == "t":
+                data["transitions"].append((i, TRANSITION_TYPES[value]))
+            elif field == "c":
+                while data["children"] and data["children"][-1][0] == i:
+                    data["children"].pop()
+                data["children"].append((i, [str(child) for child in value]))
+                for child in value:
+                    node(child)
+            else:
+                if isinstance(value, int):
+                    value = strings[value]
+                else:
+                    strings.append(value)
+                data["strs" if field == "s" else "parent_strs"].append((i, value))
+    return roots, states
+
+
+class TraceStore:
+    """
+    The substitution tree records of the expressions run in a global frame, by node, from which the client
+    fetches the subtrees that Logger.lazy_tree left out.
+    """
+
+    def __init__(self):
+        self.changes: Dict[int, List[list]] = {}  # the [i, field, value] changes of each node, in order
+
+    def add(self, record: list):
+        for node_id, field, value in record[1:]:
+            self.changes.setdefault(node_id, []).append([record[0], field, value])
+
+    def node_changes(self, node_id: int, start: int, end: int) -> List[list]:
+        return [change for change in self.changes.get(node_id, []) if start <= change[0] <= end]
+
+    def subtree(self, root: int, start: int, end: int, depth: int) -> list:
+        """
+        Returns the step records, as described by Logger.tree_change but with strings that are not encoded,
+        of root and the nodes at most depth below it, from step start to end.
+        The children of the deepest nodes are listed, but their own records are left out.
+        """
+        changes = []
+        level = [root]
+        seen = {root}
+        for d in range(depth + 1):
+            below = []
+            for node_id in level:
+                for i, field, value in self.node_changes(node_id, start, end):
+                    changes.append((i, node_id, field, value))
+                    if field == "c" and d < depth:
+                        for child in value:
+                            if child not in seen:
+                                seen.add(child)
+                                below.append(child)
+            level = below
+        # a stable sort, which keeps the changes of each node in order within a step
+        changes.sort(key=lambda change: change[0])
+        records = []
+        for i, node_id, field, value in changes:
+            if not records or records[-1][0] != i:
+                records.append([i])
+            records[-1].append([node_id, field, value])
+        return records
+
+
+class TraceFile(TraceStore):
+    """
+    A trace store that keeps the step records in a spill.RecordFile. Only an index is kept in memory: the steps
+    that change each node, in the order they were added, which is the order of the steps, and the offsets of
+    their records.
+    """
+
+    def __init__(self, directory: str = None):
+        super().__init__()
+        self.records = spill.RecordFile(directory)
+        self.steps: Dict[int, array] = {}
+        self.offsets: Dict[int, array] = {}
+
+    def add(self, record: list):
+        offset = self.records.append(record)
+        for node_id, field, value in record[1:]:
+            if node_id not in self.steps:
+                self.steps[node_id] = array("q")
+                self.offsets[node_id] = array("q")
+            elif self.offsets[node_id][-1] == offset:
+                continue
+            self.steps[node_id].append(record[0])
+            self.offsets[node_id].append(offset)
+
+    def node_changes(self, node_id: int, start: int, end: int) -> List[list]:
+        if node_id not in self.steps:
+            return []
+        steps = self.steps[node_id]
+        out = []
+        for offset in self.offsets[node_id][bisect_left(steps, start):bisect_right(steps, end)]:
+            record = self.records.read(offset)
+            out.extend([record[0], field, value] for changed, field, value in record[1:] if changed == node_id)
+        return out
 
 
 class StoredFrame:
+    __slots__ = ("name", "label", "parent", "bindings", "base", "return_value", "__weakref__")
+
     def __init__(self, i, base: 'evaluate_apply.Frame'):
-        i += logger.f_delta
+        i += session.current().logger.f_delta
         if i == -1:
             name = "Builtins"
         elif i == 0:
@@ -304,17 +892,22 @@ class StoredFrame:
 
     @limited
     def bind(self, name: str, value: Expression):
+        logger = session.current().logger
         value_key = logger.heap.record(value)
-        data = (logger.i, (name, str(value)), value_key)
+        data = (logger.i, (name, logger.expr_str(value)), value_key)
         self.bindings.append(data)
+        logger.trace_bytes += CHANGE_SIZE + len(data[1][1])
         self.add_index(logger.i)
+        logger.changed_frames[id(self.base)] = self
 
     @staticmethod
     def add_index(i):
+        logger = session.current().logger
         if not logger.frame_updates or logger.frame_updates[-1] != i:
             logger.frame_updates.append(i)
 
     def export(self):
+        logger = session.current().logger
         if id(self.parent) not in logger.frame_lookup:
             return None
         return {"name": self.name,
@@ -328,47 +921,115 @@ class Heap:
     HeapObject = Union[List['HeapObject'], HeapKey]
 
     def __init__(self):
-        self.prev: Dict[str, Heap.HeapObject] = {}
+        self.prev: Dict[str, Heap.HeapObject] = {}  # the records of promises already exported, which forcing changes
+        self.sent: Set[str] = set()  # the keys of the other records already exported, which are never read again
         self.curr: Dict[str, Heap.HeapObject] = {}
 
     def export(self):
         out = self.curr
-        self.prev.update(self.curr)
+        for id, val in out.items():
+            if val and val[0] == "promise":
+                self.prev[id] = val
+            else:
+                self.sent.add(id)
         self.curr = {}
         return out
 
+    def recorded(self, id: str) -> bool:
+        return id in self.curr or id in self.prev or id in self.sent
+
     @limited
     def modify(self, id):
         if id in self.prev:
             self.curr[id] = self.prev[id]
+        logger = session.current().logger
         logger.frame_updates.append(logger.i)
 
-    def record(self, expr: Expression) -> 'Heap.HeapKey':
+    def key(self, expr: Expression) -> 'Heap.HeapKey':
+        """
+        Returns the key of expr if it is an atom or has been recorded already, and None otherwise.
+        """
         if isinstance(expr, evaluate_apply.Thunk):
             return False, "thunk"
-        if expr.id is None:
-            expr.id = get_id()
-        if expr.id not in self.prev and expr.id not in self.curr:
-            if isinstance(expr, ValueHolder):
-                return False, repr(expr)
-            elif isinstance(expr, Pair):
-                val = [self.record(expr.first), self.record(expr.rest)]
-            elif isinstance(expr, Promise):
-                val = expr.bind()
-            elif isinstance(expr, NilType):
-                return False, "nil"
-            elif isinstance(expr, UndefinedType):
-                return False, "undefined"
-            elif isinstance(expr, Vector):
-                val = [self.record(item) for item in expr.value]
-            else:
-                # assume the repr method is good enough
-                val = [(False, repr(expr))]
-            self.curr[expr.id] = val
-        return True, expr.id
+        if isinstance(expr, ValueHolder):
+            return False, repr(expr)
+        if isinstance(expr, NilType):
+            return False, "nil"
+        if isinstance(expr, UndefinedType):
+            return False, "undefined"
+        if expr.id is not None and self.recorded(expr.id):
+            return True, expr.id
+        return None
+
+    def record(self, expr: Expression) -> 'Heap.HeapKey':
+        """
+        Records expr and everything that it refers to, children first, using a stack rather than recursion.
+        Each object is stored under its own id, so objects that are equal but not eq? are told apart.
+        """
+        key = self.key(expr)
+        if key is not None:
+            return key
+        root = expr
+        stack = [(expr, False)]
+        visiting = set()  # the ids of the objects on the stack, which are only reached again through a cycle
+        while stack:
+            expr, ready = stack.pop()
+            if ready:
+                visiting.remove(expr.id)
+                self.store(expr)
+                continue
+            if self.key(expr) is not None or expr.id in visiting:
+                continue
+            if expr.id is None:
+                expr.id = get_id()
+            visiting.add(expr.id)
+            stack.append((expr, True))
+            stack.extend((child, False) for child in reversed(self.children(expr)))
+        return True, root.id
+
+    @staticmethod
+    def children(expr: Expression) -> List[Expression]:
+        if isinstance(expr, Pair):
+            return [expr.first, expr.rest]
+        if isinstance(expr, Vector):
+            return expr.value
+        if isinstance(expr, Promise) and expr.forced:
+            return [expr.expr]
+        return []
+
+    def store(self, expr: Expression):
+        if isinstance(expr, (Pair, Vector)):
+            # the children are recorded already, or are on the way to expr in a cycle
+            val = [self.key(child) or (True, child.id) for child in self.children(expr)]
+        elif isinstance(expr, Promise):
+            val = expr.bind()
+        else:
+            # assume the repr method is good enough
+            val = [(False, repr(expr))]
+        self.curr[expr.id] = val
 
 
 return_symbol = Symbol("Return Value")
 
-logger = Logger()
-announce = logger.log
+
+class LogModule(types.ModuleType):
+    # log.logger and log.announce are those of the session that the current thread runs in, see session.py
+
+    @property
+    def logger(self) -> Logger:
+        return session.local.session.logger
+
+    @logger.setter
+    def logger(self, logger: Logger):
+        session.current().logger = logger
+
+    @property
+    def announce(self) -> Callable[[str, Holder, Holder], None]:
+        return session.current().announce
+
+    @announce.setter
+    def announce(self, announce: Callable[[str, Holder, Holder], None]):
+        session.current().announce = announce
+
+
+sys.modules[__name__].__class__ = LogModule
@@ -1,7 +1,7 @@
-counter = 0
+import session
 
 
 def get_id():
-    global counter
-    counter += 1
-    return str(counter)
+    current = session.current()
+    current.counter += 1
+    return str(current.counter)
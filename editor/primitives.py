@@ -1,5 +1,6 @@
 from typing import List
 
+import log
 from helper import verify_exact_callable_length
 from log import Holder
 
@@ -10,6 +11,10 @@ from scheme_exceptions import UnsupportedOperationError
 
 class BuiltIn(Applicable):
     def execute(self, operands: List[Expression], frame: Frame, gui_holder: Holder, eval_operands=True) -> Expression:
+        profile = log.logger.profile
+        if profile is not None and not profile.calling(self):
+            # builtins that other builtins and special forms call directly, rather than through apply
+            return profile.call(self, self.execute, operands, frame, gui_holder, eval_operands)
         if eval_operands:
             operands = evaluate_all(operands, frame, gui_holder.expression.children[1:])
         gui_holder.expression.set_entries([])
@@ -0,0 +1,78 @@
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import environment
+import primitives
+from evaluate_apply import Callable
+
+
+class Profile:
+    """
+    Counts the calls of each special form, builtin and procedure while a query runs, with their cumulative and
+    self time and the memory blocks that they allocated. Special forms and builtins are keyed by the names they
+    are defined under, and other procedures by their names.
+    A call lasts until the procedure returns, so it includes evaluating its operands, but not the tail call that
+    it may return as a thunk, which counts towards its caller.
+    Allocations are the net number of blocks allocated, from sys.getallocatedblocks, so objects freed before a
+    call returns do not count.
+    """
+
+    def __init__(self):
+        # [calls, cumulative time, self time, self blocks] of each key
+        self.stats: Dict[Tuple[str, str], list] = {}
+        self.stack: List[list] = []  # [operator, time, blocks] of each call running, with those of its callees
+        self.running: Dict[Tuple[str, str], int] = {}  # calls of each key running, so recursion counts once
+        self.names: Dict[type, Tuple[str, str]] = {}  # the key of each special form and builtin class
+
+    def key(self, operator: Callable) -> Tuple[str, str]:
+        if not self.names:
+            # the builtins are only loaded along with the first global frame
+            for kind, defined in [("builtin", environment.defdict), ("special form", environment.special_forms)]:
+                for name, cls in defined.items():
+                    self.names.setdefault(cls, (kind, name))
+        key = self.names.get(type(operator))
+        if key is not None:
+            return key
+        kind = "builtin" if isinstance(operator, primitives.BuiltIn) else "procedure"
+        return kind, getattr(operator, "name", repr(operator))
+
+    def calling(self, operator: Callable) -> bool:
+        return bool(self.stack) and self.stack[-1][0] is operator
+
+    def call(self, operator: Callable, execute, *args):
+        key = self.key(operator)
+        self.stack.append([operator, 0, 0])
+        self.running[key] = self.running.get(key, 0) + 1
+        start = time.perf_counter()
+        blocks = sys.getallocatedblocks()
+        try:
+            return execute(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            allocated = sys.getallocatedblocks() - blocks
+            _, callee_time, callee_blocks = self.stack.pop()
+            self.running[key] -= 1
+            stats = self.stats.setdefault(key, [0, 0, 0, 0])
+            stats[0] += 1
+            if not self.running[key]:
+                stats[1] += elapsed
+            stats[2] += elapsed - callee_time
+            stats[3] += allocated - callee_blocks
+            if self.stack:
+                self.stack[-1][1] += elapsed
+                self.stack[-1][2] += allocated
+
+    def export(self) -> List[dict]:
+        rows = [{"kind": kind, "name": name, "calls": calls, "time": cumulative, "self": own, "blocks": blocks}
+                for (kind, name), (calls, cumulative, own, blocks) in self.stats.items()]
+        return sorted(rows, key=lambda row: row["self"], reverse=True)
+
+
+def report(rows: List[dict], limit: int = None) -> str:
+    # the rows of Profile.export as a table, with times in milliseconds
+    lines = [f"{'calls':>9} {'time':>10} {'self':>10} {'blocks':>9}  name"]
+    for row in rows[:limit]:
+        lines.append(f"{row['calls']:9} {row['time'] * 1000:10.2f} {row['self'] * 1000:10.2f} {row['blocks']:9}  "
+                     f"{row['name']} ({row['kind']})")
+    return "\n".join(lines)
@@ -0,0 +1,59 @@
+import threading
+import time
+from contextlib import contextmanager
+
+SESSION_TTL = 60 * 60  # seconds after its last request that the session of a client is dropped
+
+
+class Session:
+    """
+    The state of the interpreter for one client, so that the server can evaluate code for several clients at
+    once, each in its own thread. Code runs in the session that its thread activated, or in a default one.
+    """
+
+    def __init__(self):
+        import evaluate_apply
+        import log
+        self.logger = log.Logger()
+        self.announce = self.logger.log  # called by each Holder as its state changes
+        self.root: log.Holder = None  # the holder of the top-level expression being evaluated
+        self.root_set = False  # whether an expression has been evaluated yet
+        self.counter = 0  # the last id given out by log_utils.get_id
+        # without a substitution tree to attach them to, tail calls are passed back in this one record, which
+        # the evaluate loop reads as soon as it gets it back
+        self.tail_thunk = evaluate_apply.Thunk(None, None, log.fake_obj, True)
+        # whether iterative.evaluate_iterative is running, see special_forms.ContinuationObject
+        self.machine_running = False
+        self.cancellation_event = threading.Event()  # set to cancel the code running in the session
+        self.lock = threading.Lock()  # held while code runs in the session, which only runs one query at a time
+        # the global frames held by the client and the generation of its states, which it saved while code ran,
+        # see local_server.release_frames
+        self.pending_release = None
+        self.last_used = time.monotonic()  # when a request of the client last used the session
+
+
+class Local(threading.local):
+    def __init__(self):
+        global default
+        if default is None:
+            default = Session()
+        self.session = default  # the session that the thread runs in
+
+
+default = None  # type: Session
+local = Local()
+
+
+def current() -> Session:
+    return local.session
+
+
+@contextmanager
+def activate(session: Session):
+    # runs the code in the with block of the current thread in session
+    previous = current()
+    local.session = session
+    try:
+        yield session
+    finally:
+        local.session = previous
@@ -1,20 +1,30 @@
-from typing import List, Optional, Type
+from typing import List, Optional, Type, Tuple
 
 import log
+import session
 from arithmetic import IsEqual
-from datamodel import Expression, Symbol, Pair, SingletonTrue, SingletonFalse, Nil, Undefined, Promise, NilType, String
+from datamodel import Expression, Symbol, Pair, SingletonTrue, SingletonFalse, Nil, Undefined, Promise, NilType, String, \
+    MultipleValues
 from environment import global_attr
 from environment import special_form
-from evaluate_apply import Frame, evaluate, Callable, evaluate_all, Applicable
+from evaluate_apply import Frame, evaluate, Callable, evaluate_all, Applicable, Thunk
 from execution_parser import get_expression
 from helper import pair_to_list, verify_exact_callable_length, verify_min_callable_length, \
     make_list, dotted_pair_to_list
 from lexer import TokenBuffer
 from lists import Memv
-from log import Holder, VisualExpression, return_symbol, logger
+from log import Holder, VisualExpression, return_symbol, fake_obj
+from primitives import BuiltIn
 from scheme_exceptions import OperandDeduceError, IrreversibleOperationError, LoadError, SchemeError, TypeMismatchError, \
     CallableResolutionError, UnsupportedOperationError
 
+begin_symbol = Symbol("begin")
+else_symbol = Symbol("else")
+quasiquote_symbol = Symbol("quasiquote")
+unquote_symbol = Symbol("unquote")
+unquote_splicing_symbol = Symbol("unquote-splicing")
+variadic_symbol = Symbol("variadic")
+
 
 class ProcedureObject(Callable):
     evaluates_operands: bool
@@ -33,6 +43,7 @@ class ProcedureObject(Callable):
         self.body = body
         self.frame = frame
         self.name = name if name is not None else f"[{self.name}]"
+        self.compiled_body = None  # filled in lazily by the compiler backend
 
     def execute(self, operands: List[Expression], frame: Frame, gui_holder: Holder, eval_operands=True):
         new_frame = Frame(self.name, self.frame if self.lexically_scoped else frame)
@@ -46,7 +57,7 @@ class ProcedureObject(Callable):
             verify_exact_callable_length(self, len(self.params), len(operands))
 
         if len(self.body) > 1:
-            body = [Pair(Symbol("begin"), make_list(self.body))]
+            body = [Pair(begin_symbol, make_list(self.body))]
         else:
             body = self.body
 
@@ -57,8 +68,9 @@ class ProcedureObject(Callable):
             new_frame.assign(self.var_param, make_list(operands[len(self.params):]))
 
         out = None
-        gui_holder.expression.set_entries(
-            [VisualExpression(expr, gui_holder.expression.display_value) for expr in body])
+        if gui_holder is not fake_obj:
+            gui_holder.expression.set_entries(
+                [VisualExpression(expr, gui_holder.expression.display_value) for expr in body])
 
         gui_holder.apply()
 
@@ -72,14 +84,15 @@ class ProcedureObject(Callable):
         new_frame.assign(return_symbol, out)
 
         if not self.evaluates_operands:
-            gui_holder.expression.set_entries([VisualExpression(out, gui_holder.expression.display_value)])
+            if gui_holder is not fake_obj:
+                gui_holder.expression.set_entries([VisualExpression(out, gui_holder.expression.display_value)])
             out = evaluate(out, frame, gui_holder.expression.children[i], True)
 
         return out
 
     def __repr__(self):
         if self.var_param is not None:
-            if logger.dotted:
+            if log.logger.dotted:
                 varparams = " . " + self.var_param.value
             else:
                 varparams = " (variadic " + self.var_param.value + ")"
@@ -117,30 +130,32 @@ class ProcedureBuilder(Callable):
 
     def execute(self, operands: List[Expression], frame: Frame, gui_holder: Holder, name: str = None):
         verify_min_callable_length(self, 2, len(operands))
-        params = operands[0]
-        if not logger.dotted and not isinstance(params, (Pair, NilType)):
+        params, var_param = self.parse_params(operands[0])
+        name_arg = (name,) if name else ()
+        return self.procedure(params, var_param, operands[1:], frame, *name_arg)
+
+    def parse_params(self, params: Expression) -> Tuple[List[Symbol], Optional[Symbol]]:
+        if not log.logger.dotted and not isinstance(params, (Pair, NilType)):
             raise OperandDeduceError(f"Expected Pair as parameter list, received {params}.")
         params, var_param = dotted_pair_to_list(params)
         param_set = set()
         for i, param in enumerate(params):
-            if (logger.dotted or i != len(params) - 1) and not isinstance(param, Symbol):
+            if (log.logger.dotted or i != len(params) - 1) and not isinstance(param, Symbol):
                 raise OperandDeduceError(f"Expected Symbol in parameter list, received {param}.")
             if isinstance(param, Pair):
                 param_vals = pair_to_list(param)
                 if len(param_vals) != 2 or \
-                        not isinstance(param_vals[0], Symbol) or \
-                        not isinstance(param_vals[1], Symbol) or \
-                        param_vals[0].value != "variadic":
+                        param_vals[0] is not variadic_symbol or \
+                        not isinstance(param_vals[1], Symbol):
                     raise OperandDeduceError(f"Each member of a parameter list must be a Symbol or a variadic "
                                              f"parameter, not {param}.")
                 param = var_param = param_vals[1]
                 params.pop()
-            if param.value in param_set:
+            if param in param_set:
                 raise OperandDeduceError(f"Duplicate name in parameter list: {param}.")
-            param_set.add(param.value)
+            param_set.add(param)
 
-        name_arg = (name,) if name else ()
-        return self.procedure(params, var_param, operands[1:], frame, *name_arg)
+        return params, var_param
 
 
 @special_form("lambda")
@@ -247,7 +262,8 @@ class Eval(Applicable):
             operand = evaluate(operands[0], frame, gui_holder.expression.children[1])
         else:
             operand = operands[0]
-        gui_holder.expression.set_entries([VisualExpression(operand, gui_holder.expression.display_value)])
+        if gui_holder is not fake_obj:
+            gui_holder.expression.set_entries([VisualExpression(operand, gui_holder.expression.display_value)])
         gui_holder.apply()
         return evaluate(operand, frame, gui_holder.expression.children[0], True)
 
@@ -264,8 +280,10 @@ class Apply(Applicable):
         if not isinstance(last_arg, Pair) and last_arg is not Nil:
             raise OperandDeduceError(f"Expected last argument of apply to be a list, not {last_arg}.")
         args = args_mid + pair_to_list(last_arg)
-        gui_holder.expression.set_entries([VisualExpression(Pair(func, make_list(args)), gui_holder.expression.display_value)])
-        gui_holder.expression.children[0].expression.children = []
+        if gui_holder is not fake_obj:
+            gui_holder.expression.set_entries(
+                [VisualExpression(Pair(func, make_list(args)), gui_holder.expression.display_value)])
+            gui_holder.expression.children[0].expression.children = []
         gui_holder.apply()
         return func.execute(args, frame, gui_holder.expression.children[0], False)
 
@@ -280,13 +298,13 @@ class Cond(Callable):
             expanded = pair_to_list(cond)
             cond_holder = gui_holder.expression.children[cond_i + 1]
             eval_condition = SingletonTrue
-            if not isinstance(expanded[0], Symbol) or expanded[0].value != "else":
+            if expanded[0] is not else_symbol:
                 eval_condition = evaluate(expanded[0], frame, cond_holder.expression.children[0])
             elif cond_i != len(operands) - 1:
                 raise OperandDeduceError(f"Else clause can only be the last clause of cond.")
             elif len(expanded) < 2:
                 raise OperandDeduceError(f"Else clause needs to have an expression.")
-            if (isinstance(expanded[0], Symbol) and expanded[0].value == "else") \
+            if expanded[0] is else_symbol \
                     or eval_condition is not SingletonFalse:
                 out = eval_condition
                 for i, expr in enumerate(expanded[1:]):
@@ -388,26 +406,29 @@ class Quasiquote(Callable):
         verify_exact_callable_length(self, 1, len(operands))
         return Quasiquote.quasiquote_evaluate(operands[0], frame, gui_holder.expression.children[1])
 
+    @staticmethod
+    def is_well_formed(expr: Expression) -> bool:
+        # whether expr is a list whose elements are all quasiquoted on their own
+        if not isinstance(expr, Pair):
+            return False
+        try:
+            lst = pair_to_list(expr)
+        except OperandDeduceError:
+            return False
+        return not any(map(
+            lambda x: x is unquote_symbol or x is quasiquote_symbol or x is unquote_splicing_symbol, lst))
+
     @classmethod
     def quasiquote_evaluate(cls, expr: Expression, frame: Frame, gui_holder: Holder, splicing=False):
-        is_well_formed = False
-
-        if isinstance(expr, Pair):
-            try:
-                lst = pair_to_list(expr)
-            except OperandDeduceError:
-                pass
-            else:
-                is_well_formed = not any(map(
-                    lambda x: isinstance(x, Symbol) and x.value in ["unquote", "quasiquote", "unquote-splicing"], lst))
+        is_well_formed = Quasiquote.is_well_formed(expr)
 
         visual_expression = gui_holder.expression
         if not is_well_formed:
             visual_expression.children[2:] = []
 
         if isinstance(expr, Pair):
-            if isinstance(expr.first, Symbol) and expr.first.value in ("unquote", "unquote-splicing"):
-                if expr.first.value == "unquote-splicing" and not splicing:
+            if expr.first is unquote_symbol or expr.first is unquote_splicing_symbol:
+                if expr.first is unquote_splicing_symbol and not splicing:
                     raise OperandDeduceError("Unquote-splicing must be in list template.")
                 gui_holder.evaluate()
                 verify_exact_callable_length(expr.first, 1, len(pair_to_list(expr)) - 1)
@@ -415,7 +436,7 @@ class Quasiquote(Callable):
                 visual_expression.value = out
                 gui_holder.complete()
                 return out
-            elif isinstance(expr.first, Symbol) and expr.first.value == "quasiquote":
+            elif expr.first is quasiquote_symbol:
                 visual_expression.value = expr
                 gui_holder.complete()
                 return expr
@@ -423,8 +444,7 @@ class Quasiquote(Callable):
                 if is_well_formed:
                     out = []
                     for sub_expr, holder in zip(pair_to_list(expr), visual_expression.children):
-                        splicing = isinstance(sub_expr, Pair) and isinstance(sub_expr.first, Symbol) \
-                                and sub_expr.first.value == "unquote-splicing"
+                        splicing = isinstance(sub_expr, Pair) and sub_expr.first is unquote_splicing_symbol
                         evaluated = Quasiquote.quasiquote_evaluate(sub_expr, frame, holder, splicing)
                         if splicing:
                             if not isinstance(evaluated, (Pair, NilType)):
@@ -434,7 +454,7 @@ class Quasiquote(Callable):
                             out.append(evaluated)
                     out = make_list(out)
                 else:
-                    if not logger.dotted:
+                    if not log.logger.dotted:
                         raise OperandDeduceError(f"{expr} is an ill-formed quasiquotation.")
                     out = Pair(Quasiquote.quasiquote_evaluate(expr.first, frame, visual_expression.children[0]),
                                Quasiquote.quasiquote_evaluate(expr.rest, frame, visual_expression.children[1]))
@@ -455,14 +475,15 @@ class Load(Applicable):
             operands = evaluate_all(operands, frame, gui_holder.expression.children[1:])
         if not isinstance(operands[0], Symbol):
             raise OperandDeduceError(f"Load expected a Symbol, received {operands[0]}.")
-        if logger.fragile:
+        if log.logger.fragile:
             raise IrreversibleOperationError()
         try:
             with open(f"{operands[0].value}.scm") as file:
                 code = "(begin-noexcept" + "\n".join(file.readlines()) + "\n)"
                 buffer = TokenBuffer([code])
                 expr = get_expression(buffer)
-                gui_holder.expression.set_entries([VisualExpression(expr, gui_holder.expression.display_value)])
+                if gui_holder is not fake_obj:
+                    gui_holder.expression.set_entries([VisualExpression(expr, gui_holder.expression.display_value)])
                 gui_holder.apply()
                 return evaluate(expr, frame, gui_holder.expression.children[0], True)
         except OSError as e:
@@ -477,7 +498,7 @@ class LoadAll(Applicable):
             operands = evaluate_all(operands, frame, gui_holder.expression.children[1:])
         if not isinstance(operands[0], String):
             raise OperandDeduceError(f"Load expected a String, received {operands[0]}.")
-        if logger.fragile:
+        if log.logger.fragile:
             raise IrreversibleOperationError()
         from os import listdir
         from os.path import join
@@ -502,7 +523,7 @@ class BeginNoExcept(Callable):
             try:
                 out = evaluate(operand, frame, holder, i == len(operands) - 1)
             except (SchemeError, RecursionError, ValueError, ZeroDivisionError) as e:
-                logger.raw_out("LoadError: " + str(e) + "\n")
+                log.logger.raw_out("LoadError: " + str(e) + "\n")
         return out
 
 
@@ -524,12 +545,13 @@ class Force(Applicable):
             raise OperandDeduceError(f"Force expected a Promise, received {operand}")
         if operand.forced:
             return operand.expr
-        if logger.fragile:
+        if log.logger.fragile:
             raise IrreversibleOperationError()
-        gui_holder.expression.set_entries([VisualExpression(operand.expr, gui_holder.expression.display_value)])
+        if gui_holder is not fake_obj:
+            gui_holder.expression.set_entries([VisualExpression(operand.expr, gui_holder.expression.display_value)])
         gui_holder.apply()
         evaluated = evaluate(operand.expr, operand.frame, gui_holder.expression.children[0])
-        if not logger.dotted and not isinstance(evaluated, (Pair, NilType)):
+        if not log.logger.dotted and not isinstance(evaluated, (Pair, NilType)):
             raise TypeMismatchError(
                 f"Unable to force a Promise evaluating to {operand.expr}, expected another Pair or Nil")
         operand.expr = evaluated
@@ -578,16 +600,15 @@ class Case(Callable):
             expanded = pair_to_list(case)
             case_holder = gui_holder.expression.children[case_i + 2]  # skip key
             eval_condition = SingletonTrue
-            if (not isinstance(expanded[0], Symbol) or expanded[0].value != "else") \
-                   and isinstance(expanded[0], Pair):
+            if expanded[0] is not else_symbol and isinstance(expanded[0], Pair):
                 eval_condition = Memv().execute_evaluated([key, expanded[0]], frame)
-            elif not isinstance(expanded[0], Symbol) or expanded[0].value != "else":
+            elif expanded[0] is not else_symbol:
                 raise OperandDeduceError(f"Case clause expected list, received {expanded[0]}")
             elif case_i != len(operands) - 2:  # exclude key from count
                 raise OperandDeduceError(f"Else clause can only be the last clause of case.")
             if len(expanded) < 2:
                 raise OperandDeduceError(f"Case clause needs to have a length of at least two, received {case}.")
-            if (isinstance(expanded[0], Symbol) and expanded[0].value == "else") \
+            if expanded[0] is else_symbol \
                     or eval_condition is not SingletonFalse:
                 out = eval_condition
                 for i, expr in enumerate(expanded[1:]):
@@ -636,25 +657,122 @@ class ForEach(UnsupportedCallable):
     pass  # unimplemented
 
 
+def make_values(values: List[Expression]) -> Expression:
+    if len(values) == 1:
+        return values[0]
+    return MultipleValues(values)
+
+
+class ContinuationInvoked(Exception):
+    # unwinds the Python stack to whoever can resume the continuation
+    def __init__(self, continuation: 'ContinuationObject', value: Expression):
+        super().__init__()
+        self.continuation = continuation
+        self.value = value
+
+
+class ContinuationObject(Applicable):
+    """
+    A continuation captured by call/cc. The iterative backend captures its continuation stack as k, so
+    the continuation can be resumed at any time. The other backends keep theirs on the Python stack, so
+    their continuations can only be used to escape from the call/cc while it is active.
+    """
+
+    def __init__(self, frame: Frame, k=None, reentrant: bool = False):
+        super().__init__()
+        self.frame = frame
+        self.k = k
+        self.reentrant = reentrant
+        self.active = True
+
+    def execute(self, operands: List[Expression], frame: Frame, gui_holder: Holder, eval_operands=True):
+        if eval_operands:
+            operands = evaluate_all(operands, frame, gui_holder.expression.children[1:])
+        if not (session.current().machine_running if self.reentrant else self.active):
+            raise UnsupportedOperationError("resuming a continuation after its call/cc has returned, "
+                                            "except in the iterative backend")
+        raise ContinuationInvoked(self, make_values(operands))
+
+    def __repr__(self):
+        return "#[continuation]"
+
+
+def call_procedure(procedure: Expression, operands: List[Expression], frame: Frame, gui_holder: Holder):
+    # calls procedure for its value, rather than for a Thunk
+    if not isinstance(procedure, Applicable):
+        raise OperandDeduceError(f"Unable to call {procedure}.")
+    out = procedure.execute(operands, frame, gui_holder, False)
+    if isinstance(out, Thunk):
+        return_frame = out.return_frame
+        value = evaluate(out.expr, out.frame, out.gui_holder, log_stack=out.log_stack)
+        if return_frame is not None:
+            return_frame.assign(return_symbol, value)
+        return value
+    return out
+
+
 @global_attr("call-with-current-continuation")
 @global_attr("call/cc")
-class CallCC(UnsupportedCallable):
-    pass  # unimplemented
+class CallCC(Applicable):
+    def execute(self, operands: List[Expression], frame: Frame, gui_holder: Holder, eval_operands=True):
+        verify_exact_callable_length(self, 1, len(operands))
+        if eval_operands:
+            operands = evaluate_all(operands, frame, gui_holder.expression.children[1:])
+        continuation = ContinuationObject(frame)
+        depth, omitted = len(log.logger.eval_stack), log.logger.eval_omitted
+        gui_holder.expression.set_entries([])
+        gui_holder.apply()
+        try:
+            return call_procedure(operands[0], [continuation], frame, gui_holder)
+        except ContinuationInvoked as invoked:
+            if invoked.continuation is not continuation:
+                raise
+            del log.logger.eval_stack[depth:]
+            log.logger.eval_omitted = omitted
+            return invoked.value
+        finally:
+            continuation.active = False
 
 
 @global_attr("values")
-class Values(UnsupportedCallable):
-    pass  # unimplemented
+class Values(BuiltIn):
+    def execute_evaluated(self, operands: List[Expression], frame: Frame) -> Expression:
+        return make_values(operands)
 
 
 @global_attr("call-with-values")
-class CallWithValues(UnsupportedCallable):
-    pass  # unimplemented
+class CallWithValues(Applicable):
+    def execute(self, operands: List[Expression], frame: Frame, gui_holder: Holder, eval_operands=True):
+        verify_exact_callable_length(self, 2, len(operands))
+        if eval_operands:
+            operands = evaluate_all(operands, frame, gui_holder.expression.children[1:])
+        producer, consumer = operands
+        if not isinstance(consumer, Applicable):
+            raise OperandDeduceError(f"Unable to call {consumer}.")
+        gui_holder.expression.set_entries([])
+        gui_holder.apply()
+        values = call_procedure(producer, [], frame, gui_holder)
+        values = values.values if isinstance(values, MultipleValues) else [values]
+        return consumer.execute(list(values), frame, gui_holder, False)
 
 
 @global_attr("dynamic-wind")
-class DynamicWind(UnsupportedCallable):
-    pass  # unimplemented
+class DynamicWind(Applicable):
+    def execute(self, operands: List[Expression], frame: Frame, gui_holder: Holder, eval_operands=True):
+        verify_exact_callable_length(self, 3, len(operands))
+        if eval_operands:
+            operands = evaluate_all(operands, frame, gui_holder.expression.children[1:])
+        before, thunk, after = operands
+        gui_holder.expression.set_entries([])
+        gui_holder.apply()
+        call_procedure(before, [], frame, gui_holder)
+        try:
+            out = call_procedure(thunk, [], frame, gui_holder)
+        except ContinuationInvoked:
+            call_procedure(after, [], frame, gui_holder)
+            raise
+        call_procedure(after, [], frame, gui_holder)
+        return out
 
 
 @global_attr("scheme-report-environment")
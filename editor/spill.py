@@ -0,0 +1,41 @@
+import json
+import mmap
+import tempfile
+
+BUFFER_SIZE = 2 ** 20  # bytes of records kept in memory before they are written to the file
+
+
+class RecordFile:
+    """
+    An append-only file of records in JSON, one per line, which are read back through mmap by the offsets
+    that append returns. The file has no name, so it is deleted once it is closed or collected.
+    """
+
+    def __init__(self, directory: str = None):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.written = 0  # bytes written to the file
+        self.buffer = bytearray()  # records appended since then
+        self.view: mmap.mmap = None
+        self.mapped = 0  # bytes of the file that view maps
+
+    def append(self, obj) -> int:
+        offset = self.written + len(self.buffer)
+        self.buffer += json.dumps(obj).encode("utf-8") + b"\n"
+        if len(self.buffer) > BUFFER_SIZE:
+            self.write()
+        return offset
+
+    def read(self, offset: int):
+        if offset >= self.mapped:
+            self.write()
+            if self.view is not None:
+                self.view.close()
+            self.view = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mapped = self.written
+        return json.loads(self.view[offset:self.view.find(b"\n", offset)])
+
+    def write(self):
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.written += len(self.buffer)
+        self.buffer = bytearray()
@@ -1,5 +1,6 @@
 
 import {begin_slow, end_slow} from "./event_handler";
+import {session_id} from "./session";
 
 export {register_cancel_button, terminable_command}
 
@@ -13,7 +14,7 @@ function register_cancel_button(btn) {
     button.on("click", function() {
         console.log("on click");
         if (has_command) {
-            $.post("./cancel", {});
+            $.post("./cancel", {sessionId: session_id});
             has_command = false;
             command_description = undefined;
         }
@@ -5,6 +5,8 @@ import {make, request_reset, request_update} from "./event_handler";
 import {terminable_command} from "./canceller";
 import {registerEditor, removeEditor, notify_changed} from "./test_results";
 import {doTailViz, javastyle} from "./settings";
+import {decode_tree, make_tree_decoder, tree_depth_param} from "./tree_records";
+import {process_stream} from "./process_stream";
 
 export {register};
 
@@ -230,22 +232,36 @@ function register(layout) {
         async function run(noOutput) {
             let code = [editor.getValue()];
 
+            function run_progress(chunk, data) {
+                // show output as it is printed, before the rest of the run is ready
+                if (noOutput || !chunk.out) {
+                    return;
+                }
+                states[componentState.id].out = data.out[0];
+                states[componentState.id].heap = data.heap;
+                open("output", componentState.id);
+                request_update();
+            }
+
             async function run_done(data) {
-                data = $.parseJSON(data);
                 if (data.success) {
-                    states[componentState.id].states = data.states;
+                    let expr_states = [];
+                    let roots = [];
+                    decode_tree(make_tree_decoder(), data.tree, expr_states, roots);
+                    states[componentState.id].states = expr_states;
                     states[componentState.id].environments = [];
                     for (let key of data.active_frames) {
                         states[componentState.id].environments.push(data.frame_lookup[key]);
                     }
                     states[componentState.id].moves = data.graphics;
                     states[componentState.id].out = data.out[0];
-                    states[componentState.id].start = data.states[0][0];
-                    states[componentState.id].end = data.states[0][1];
-                    states[componentState.id].index = data.states[0][0];
+                    states[componentState.id].start = expr_states[0][0];
+                    states[componentState.id].end = expr_states[0][1];
+                    states[componentState.id].index = expr_states[0][0];
                     states[componentState.id].expr_i = 0;
-                    states[componentState.id].roots = data.roots;
+                    states[componentState.id].roots = roots;
                     states[componentState.id].globalFrameID = data.globalFrameID;
+                    states[componentState.id].generation = data.generation;
                     states[componentState.id].heap = data.heap;
                     states[componentState.id].frameUpdates = data.frameUpdates;
                 } else {
@@ -267,13 +283,14 @@ function register(layout) {
                 request_update();
             }
 
-            let aj = $.post("./process2", {
+            let aj = process_stream({
                 code: code,
                 globalFrameID: -1,
                 curr_i: 0,
                 curr_f: 0,
-                tailViz: doTailViz()
-            });
+                tailViz: doTailViz(),
+                ...tree_depth_param(),
+            }, run_progress);
             terminable_command("executing code", aj, run_done);
         }
 
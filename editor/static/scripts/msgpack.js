@@ -0,0 +1,136 @@
+export {decode_msgpack, Incomplete};
+
+// Thrown when the bytes end in the middle of an object, so that a stream can be decoded as it arrives.
+class Incomplete extends Error {
+}
+
+const utf8 = new TextDecoder();
+
+// Reads one MessagePack object from bytes (a Uint8Array) at pos, and returns it with the position after it.
+// Reads what wire.pack in the server writes. Map keys become strings, as they would be in JSON.
+function decode_msgpack(bytes, pos = 0) {
+    let view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+
+    function need(n) {
+        if (pos + n > bytes.length) {
+            throw new Incomplete();
+        }
+    }
+
+    function read_length(size) {
+        need(size);
+        let n = size === 1 ? view.getUint8(pos) : size === 2 ? view.getUint16(pos) : view.getUint32(pos);
+        pos += size;
+        return n;
+    }
+
+    function read_str(n) {
+        need(n);
+        let out = utf8.decode(bytes.subarray(pos, pos + n));
+        pos += n;
+        return out;
+    }
+
+    function read_array(n) {
+        let out = new Array(n);
+        for (let i = 0; i !== n; ++i) {
+            out[i] = read();
+        }
+        return out;
+    }
+
+    function read_map(n) {
+        let out = {};
+        for (let i = 0; i !== n; ++i) {
+            let key = read();
+            out[key] = read();
+        }
+        return out;
+    }
+
+    function read() {
+        need(1);
+        let tag = bytes[pos++];
+        if (tag < 0x80) {
+            return tag;
+        } else if (tag >= 0xe0) {
+            return tag - 0x100;
+        } else if (tag < 0x90) {
+            return read_map(tag & 0x0f);
+        } else if (tag < 0xa0) {
+            return read_array(tag & 0x0f);
+        } else if (tag < 0xc0) {
+            return read_str(tag & 0x1f);
+        }
+        let out;
+        switch (tag) {
+            case 0xc0:
+                return null;
+            case 0xc2:
+                return false;
+            case 0xc3:
+                return true;
+            case 0xc4:
+            case 0xc5:
+            case 0xc6: {
+                let n = read_length(1 << (tag - 0xc4));
+                need(n);
+                out = bytes.slice(pos, pos + n);
+                pos += n;
+                return out;
+            }
+            case 0xca:
+                need(4);
+                out = view.getFloat32(pos);
+                pos += 4;
+                return out;
+            case 0xcb:
+                need(8);
+                out = view.getFloat64(pos);
+                pos += 8;
+                return out;
+            case 0xcc:
+            case 0xcd:
+            case 0xce:
+                return read_length(1 << (tag - 0xcc));
+            case 0xcf:
+                need(8);
+                // exact up to 2 ** 53, like the numbers that JSON.parse makes
+                out = view.getUint32(pos) * 2 ** 32 + view.getUint32(pos + 4);
+                pos += 8;
+                return out;
+            case 0xd0:
+                need(1);
+                return view.getInt8(pos++);
+            case 0xd1:
+                need(2);
+                out = view.getInt16(pos);
+                pos += 2;
+                return out;
+            case 0xd2:
+                need(4);
+                out = view.getInt32(pos);
+                pos += 4;
+                return out;
+            case 0xd3:
+                need(8);
+                out = view.getInt32(pos) * 2 ** 32 + view.getUint32(pos + 4);
+                pos += 8;
+                return out;
+            case 0xd9:
+            case 0xda:
+            case 0xdb:
+                return read_str(read_length(1 << (tag - 0xd9)));
+            case 0xdc:
+            case 0xdd:
+                return read_array(read_length(2 << (tag - 0xdc)));
+            case 0xde:
+            case 0xdf:
+                return read_map(read_length(2 << (tag - 0xde)));
+        }
+        throw new Error(`Unsupported MessagePack type: 0x${tag.toString(16)}`);
+    }
+
+    let out = read();
+    return [out, pos];
+}
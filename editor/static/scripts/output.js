@@ -5,6 +5,9 @@ import {open} from "./layout";
 import {display_elem} from "./env_diagram_worker";
 import {go_to_end} from "./navigation";
 import {doTailViz} from "./settings";
+import {decode_tree, make_tree_decoder, tree_depth_param} from "./tree_records";
+import {process_stream} from "./process_stream";
+import {session_id} from "./session";
 
 export {register};
 
@@ -168,6 +171,7 @@ function register(myLayout) {
                     $.post("./instant", {
                         code: [editor.getValue()],
                         globalFrameID: states[componentState.id].globalFrameID,
+                        sessionId: session_id,
                     }).done(function (data) {
                         preview = "";
                         if (!data) {
@@ -200,23 +204,35 @@ function register(myLayout) {
                 let displayVal = val.replace(/\n/g, "\n.... ");
                 states[componentState.id].out += "\nscm> " + displayVal;
                 request_update();
-                function run_done(data) {
-                    // editor.setValue(val.slice(firstTerminator + 1));
-                    data = $.parseJSON(data);
+                let prev_out = states[componentState.id].out;
+                function show_out(data) {
+                    states[componentState.id].out = prev_out;
                     if (data.out[0].trim() !== "") {
                         states[componentState.id].out += "\n" + data.out[0].trim();
                     }
+                }
+                function run_progress(chunk, data) {
+                    if (chunk.out) {
+                        $.extend(states[componentState.id].heap, chunk.heap);
+                        show_out(data);
+                        request_update();
+                    }
+                }
+                function run_done(data) {
+                    // editor.setValue(val.slice(firstTerminator + 1));
+                    show_out(data);
                     if (data.success) {
                         for (let key of data.active_frames) {
                             states[componentState.id].environments.push(data.frame_lookup[key]);
                         }
                         states[componentState.id].environments[0] =
                             data.frame_lookup[states[componentState.id].globalFrameID];
-                        states[componentState.id].states.push(...data.states);
-                        states[componentState.id].roots.push(...data.roots);
+                        decode_tree(make_tree_decoder(), data.tree,
+                            states[componentState.id].states, states[componentState.id].roots);
                         $.extend(states[componentState.id].heap, data.heap);
                         states[componentState.id].frameUpdates.push(...data.frameUpdates);
                         states[componentState.id].moves = data.graphics;
+                        states[componentState.id].generation = data.generation;
 
                         if (data.graphics_open) {
                             open("turtle_graphics", componentState.id);
@@ -226,13 +242,14 @@ function register(myLayout) {
                     request_update();
                     saveState(true);
                 }
-                let aj = $.post("./process2", {
+                let aj = process_stream({
                     code: [val],
                     globalFrameID: states[componentState.id].globalFrameID,
                     curr_i: states[componentState.id].states.slice(-1)[0][1],
                     curr_f: states[componentState.id].environments.length,
                     tailViz: doTailViz(),
-                });
+                    ...tree_depth_param(),
+                }, run_progress);
                 terminable_command("executing code", aj, run_done);
             }
 
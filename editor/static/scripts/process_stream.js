@@ -0,0 +1,117 @@
+import {decode_msgpack, Incomplete} from "./msgpack";
+import {session_id} from "./session";
+
+export {process_stream};
+
+// Posts params to ./process_stream, which sends the output of the code as it runs, one chunk at a time
+// (see Logger.export_changes), in MessagePack, or as newline-delimited JSON from servers that do not support it.
+// on_chunk is called with each chunk and the chunks merged so far.
+// Like $.post, returns an object whose done callback gets the merged chunks, in the format that ./process2
+// returns with treeFormat "delta".
+function process_stream(params, on_chunk) {
+    let data = {
+        success: false,
+        out: [""],
+        tree: [],
+        active_frames: [],
+        frame_lookup: {},
+        heap: {},
+        frameUpdates: [],
+    };
+    let request = fetch("./process_stream", {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+            "Accept": "application/x-msgpack, application/x-ndjson",
+        },
+        body: $.param({...params, sessionId: session_id}),
+    }).then(async function (response) {
+        let reader = response.body.getReader();
+        let read_chunks = response.headers.get("Content-Type").includes("msgpack") ? read_msgpack : read_lines;
+        let buffer = null;
+        while (true) {
+            let {done, value} = await reader.read();
+            if (done) {
+                break;
+            }
+            let chunks;
+            [chunks, buffer] = read_chunks(buffer, value);
+            for (let chunk of chunks) {
+                merge_chunk(data, chunk);
+                on_chunk(chunk, data);
+            }
+        }
+        return data;
+    });
+    return {
+        done: function (callback) {
+            request.then(callback);
+            return this;
+        },
+    };
+}
+
+const text_decoder = new TextDecoder();
+
+// Each returns the chunks completed by the bytes in value, and what is left over of the buffer.
+function read_lines(buffer, value) {
+    let lines = ((buffer || "") + text_decoder.decode(value, {stream: true})).split("\n");
+    buffer = lines.pop();
+    return [lines.map((line) => JSON.parse(line)), buffer];
+}
+
+function read_msgpack(buffer, value) {
+    if (buffer) {
+        let joined = new Uint8Array(buffer.length + value.length);
+        joined.set(buffer);
+        joined.set(value, buffer.length);
+        value = joined;
+    }
+    let chunks = [];
+    let pos = 0;
+    while (pos !== value.length) {
+        try {
+            let chunk;
+            [chunk, pos] = decode_msgpack(value, pos);
+            chunks.push(chunk);
+        } catch (e) {
+            if (!(e instanceof Incomplete)) {
+                throw e;
+            }
+            break;
+        }
+    }
+    return [chunks, value.subarray(pos)];
+}
+
+function merge_chunk(data, chunk) {
+    for (let [key, val] of Object.entries(chunk)) {
+        if (key === "out") {
+            data.out[0] += val;
+        } else if (key === "tree" || key === "active_frames") {
+            for (let x of val) {
+                data[key].push(x);
+            }
+        } else if (key === "frame_lookup") {
+            for (let [id, frame] of Object.entries(val)) {
+                if (data.frame_lookup[id]) {
+                    for (let binding of frame.bindings) {
+                        data.frame_lookup[id].bindings.push(binding);
+                    }
+                } else {
+                    data.frame_lookup[id] = frame;
+                }
+            }
+        } else if (key === "heap") {
+            $.extend(data.heap, val);
+        } else if (key === "frameUpdates") {
+            for (let i of val) {
+                if (data.frameUpdates[data.frameUpdates.length - 1] !== i) {
+                    data.frameUpdates.push(i);
+                }
+            }
+        } else {
+            data[key] = val;
+        }
+    }
+}
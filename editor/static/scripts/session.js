@@ -0,0 +1,9 @@
+export {session_id};
+
+// Identifies the interpreter session of this tab on the server (see local_server.client_session), so that code run
+// in other tabs does not share its global frames. It is kept across reloads of the tab, like the saved global frames.
+let session_id = sessionStorage.getItem("sessionId");
+if (session_id === null) {
+    session_id = Date.now().toString(36) + Math.random().toString(36).slice(2);
+    sessionStorage.setItem("sessionId", session_id);
+}
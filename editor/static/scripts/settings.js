@@ -1,6 +1,6 @@
 import {saveState} from "./state_handler";
 
-export {init, hide_return_frames, javastyle, doTailViz, getAllSettings, setAllSettings};
+export {init, hide_return_frames, javastyle, doTailViz, lazyTree, getAllSettings, setAllSettings};
 
 function init() {
     $("#settings-btn").click(function () {
@@ -30,11 +30,16 @@ function doTailViz() {
     return $("#tailVizCheckbox").prop('checked');
 }
 
+function lazyTree() {
+    return $("#lazyTreeCheckbox").prop('checked');
+}
+
 function getAllSettings() {
     return {
         "return_frames": hide_return_frames(),
         "javastyle": javastyle(),
         "tailViz": doTailViz(),
+        "lazyTree": lazyTree(),
     }
 }
 
@@ -42,4 +47,5 @@ function setAllSettings(data) {
     $("#hideReturnFramesCheckbox").prop('checked', data["return_frames"]);
     $("#javastyleCheckbox").prop('checked', data["javastyle"]);
     $("#tailVizCheckbox").prop('checked', data["tailViz"]);
+    $("#lazyTreeCheckbox").prop('checked', data["lazyTree"]);
 }
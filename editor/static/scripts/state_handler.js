@@ -1,6 +1,7 @@
 import {begin_slow, end_slow} from "./event_handler";
 import {getLayout, setLayout} from "./layout";
 import {getAllSettings, setAllSettings} from "./settings";
+import {session_id} from "./session";
 
 export {states, temp_file, loadState, saveState, make_new_state};
 
@@ -20,6 +21,7 @@ let base_state = {
     roots: ["demo"],
 
     globalFrameID: -1,
+    generation: -1,
     
     editor_open: false,
     sub_open: false,
@@ -96,6 +98,7 @@ async function saveState(full=false, layout=undefined) {
 
     await $.post("./save_state", {
         state: JSON.stringify({states: temp, layout: layout, settings: getAllSettings()}),
+        sessionId: session_id,
     }).done(function () {
         curr_saving = false;
         end_slow();
@@ -10,6 +10,7 @@ import {
 import {get_active_node} from "./navigation";
 
 import {javastyle} from "./settings";
+import {load_subtrees} from "./tree_records";
 
 export {
     display_tree,
@@ -117,7 +118,22 @@ async function _locate(elem, base_str, i, row, col) {
     }
 }
 
-function get_i(all_data, curr, i) {
+// missing collects the ids of the nodes that have not been loaded yet, which are shown as "..."
+function get_i(all_data, curr, i, missing) {
+    if (all_data[curr]["transitions"].length === 0) {
+        if (missing !== undefined) {
+            missing.push(curr);
+        }
+        return {
+            id: curr,
+            transition_type: "UNEVALUATED",
+            str: "...",
+            parent_str: "...",
+            children: [],
+            prev_children: [],
+        };
+    }
+
     let labels = [
         ["transitions", "transition_type"],
         ["strs", "str"],
@@ -147,7 +163,7 @@ function get_i(all_data, curr, i) {
 
     data["children"] = [];
     for (let child of all_data[curr]["children"][j][1]) {
-        data["children"].push(get_i(all_data, child, i));
+        data["children"].push(get_i(all_data, child, i, missing));
     }
 
     data["prev_children"] = [];
@@ -158,7 +174,7 @@ function get_i(all_data, curr, i) {
             }
         }
         for (let child of all_data[curr]["children"][j - 1][1]) {
-            data["prev_children"].push(get_i(all_data, child, i));
+            data["prev_children"].push(get_i(all_data, child, i, missing));
         }
     }
 
@@ -166,11 +182,13 @@ function get_i(all_data, curr, i) {
 }
 
 async function display_tree(id, svg, clear_svg, is_tree) {
-    let data = get_i(
-        states[id].states[states[id].expr_i][2],
-        states[id].roots[states[id].expr_i],
-        states[id].index,
-    );
+    let expr_state = states[id].states[states[id].expr_i];
+    let missing = [];
+    let data = get_i(expr_state[2], states[id].roots[states[id].expr_i], states[id].index, missing);
+    while (missing.length !== 0 && await load_subtrees(states[id].globalFrameID, expr_state, missing)) {
+        missing = [];
+        data = get_i(expr_state[2], states[id].roots[states[id].expr_i], states[id].index, missing);
+    }
 
     if (!is_tree) {
         await locate(data);
@@ -0,0 +1,96 @@
+import {lazyTree} from "./settings";
+import {session_id} from "./session";
+
+export {make_tree_decoder, decode_tree, tree_depth_param, load_subtrees};
+
+// how far below the root of each expression the server sends the tree when the lazyTree setting is on
+const TREE_DEPTH = 4;
+
+// same order as TRANSITION_TYPES in log.py
+const transition_types = ["UNEVALUATED", "EVALUATING", "EVALUATED", "APPLYING"];
+
+function make_tree_decoder() {
+    return {
+        strings: [],
+        nodes: {},
+    };
+}
+
+function get_node(decoder, id) {
+    id = String(id);
+    if (!(id in decoder.nodes)) {
+        decoder.nodes[id] = {transitions: [], strs: [], parent_strs: [], children: []};
+    }
+    return decoder.nodes[id];
+}
+
+// Adds the expressions finished by records (see Logger.tree_change) to states and roots.
+// Nodes of an unfinished expression are kept by the decoder until a later call finishes it.
+function decode_tree(decoder, records, states, roots) {
+    for (let record of records) {
+        if (record[0] === "expr") {
+            let [, start, end, root] = record;
+            if (root !== null) {
+                states.push([start, end, decoder.nodes]);
+                roots.push(String(root));
+            }
+            decoder.nodes = {};
+            continue;
+        }
+        let i = record[0];
+        for (let [id, field, value] of record.slice(1)) {
+            let node = get_node(decoder, id);
+            if (field === "t") {
+                node.transitions.push([i, transition_types[value]]);
+            } else if (field === "c") {
+                while (node.children.length && node.children[node.children.length - 1][0] === i) {
+                    node.children.pop();
+                }
+                node.children.push([i, value.map(String)]);
+                for (let child of value) {
+                    get_node(decoder, child);
+                }
+            } else {
+                if (typeof value === "number") {
+                    value = decoder.strings[value];
+                } else {
+                    decoder.strings.push(value);
+                }
+                (field === "s" ? node.strs : node.parent_strs).push([i, value]);
+            }
+        }
+    }
+}
+
+function tree_depth_param() {
+    return lazyTree() ? {treeDepth: TREE_DEPTH} : {};
+}
+
+// Fetches the subtrees of the nodes with ids that the server left out of expr_state (see Logger.lazy_tree),
+// and adds them to its nodes. Returns whether any were added.
+async function load_subtrees(global_frame_id, expr_state, ids) {
+    let [start, end, nodes] = expr_state;
+    let added = false;
+    await Promise.all(ids.map((id) => $.post("./subtree", {
+        globalFrameID: global_frame_id,
+        node: id,
+        start: start,
+        end: end,
+        depth: TREE_DEPTH,
+        sessionId: session_id,
+    }).done((data) => {
+        data = $.parseJSON(data);
+        if (!data.success) {
+            return;
+        }
+        let decoder = make_tree_decoder();
+        decode_tree(decoder, data.tree, [], []);
+        for (let [node_id, node] of Object.entries(decoder.nodes)) {
+            if (!(node_id in nodes) || nodes[node_id].transitions.length === 0) {
+                nodes[node_id] = node;
+                added = added || node.transitions.length !== 0;
+            }
+        }
+    })));
+    return added;
+}
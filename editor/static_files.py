@@ -0,0 +1,138 @@
+import email.utils
+import gzip
+import hashlib
+import io
+import mimetypes
+import os
+import stat
+from http import HTTPStatus
+from typing import Dict, List, Optional, Tuple
+
+# the types that are compressed, besides text
+COMPRESSIBLE = {"application/javascript", "application/json", "image/svg+xml"}
+MIN_COMPRESSED_SIZE = 1024  # bytes, below which compressing saves too little
+
+# the types sent for scripts and stylesheets, as they were before any others were
+CONTENT_TYPES = {".js": "application/javascript", ".css": "text/css"}
+
+
+class Asset:
+    """
+    A static file as it is sent, with its gzip encoding, which is computed once if it is any smaller, and the
+    validators that let clients revalidate their copies of it.
+    """
+
+    def __init__(self, body: bytes, content_type: str, mtime: float):
+        self.body = body
+        self.content_type = content_type
+        self.gzipped: bytes = None
+        if len(body) >= MIN_COMPRESSED_SIZE and (content_type.startswith("text/") or content_type in COMPRESSIBLE):
+            gzipped = compress(body)
+            if len(gzipped) < len(body):
+                self.gzipped = gzipped
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'  # each encoding is a representation of its own, with its own tag
+        self.mtime = int(mtime)
+        self.last_modified = email.utils.formatdate(mtime, usegmt=True)
+
+
+class AssetCache:
+    """
+    The static files under a directory, which are read once and kept in memory until they change on disk.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+        # the asset of each file, by its path, with the size, time and substitutions that it was made with
+        self.assets: Dict[str, Tuple[tuple, Asset]] = {}
+
+    def get(self, path: str, substitutions: Dict[bytes, bytes] = None) -> Optional[Asset]:
+        # the file at path, relative to the root, with each key of substitutions in it replaced by its value,
+        # or None if there is no such file under the root
+        full = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([full, self.root]) != self.root:
+            return None
+        try:
+            info = os.stat(full)
+        except OSError:
+            return None
+        if not stat.S_ISREG(info.st_mode):
+            return None
+        key = (info.st_mtime_ns, info.st_size, tuple((substitutions or {}).items()))
+        cached = self.assets.get(full)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(full, "rb") as file:
+            body = file.read()
+        for old, new in (substitutions or {}).items():
+            body = body.replace(old, new)
+        asset = Asset(body, content_type(full), info.st_mtime)
+        self.assets[full] = key, asset
+        return asset
+
+
+def content_type(path: str) -> str:
+    extension = os.path.splitext(path)[1]
+    if extension in CONTENT_TYPES:
+        return CONTENT_TYPES[extension]
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def respond(asset: Asset, headers) -> Tuple[HTTPStatus, List[Tuple[str, str]], bytes]:
+    """
+    Returns the status, the headers and the body of the response to a GET of asset, given the headers of the
+    request, which are looked up by lowercase names. Clients revalidate their copies every time, since the
+    paths of the files do not change with their contents, and get 304 Not Modified if they are still current.
+    """
+    gzipped = asset.gzipped is not None and accepts_gzip(headers.get("accept-encoding"))
+    etag = asset.gzip_etag if gzipped else asset.etag
+    out = [("ETag", etag), ("Last-Modified", asset.last_modified), ("Cache-Control", "no-cache")]
+    if asset.gzipped is not None:
+        out.append(("Vary", "Accept-Encoding"))
+    if not_modified(asset, etag, headers):
+        return HTTPStatus.NOT_MODIFIED, out, b""
+    body = asset.gzipped if gzipped else asset.body
+    out += [("Content-Type", asset.content_type), ("Content-Length", str(len(body)))]
+    if gzipped:
+        out.append(("Content-Encoding", "gzip"))
+    return HTTPStatus.OK, out, body
+
+
+def compress(body: bytes) -> bytes:
+    # gzip.compress only takes an mtime from Python 3.8, and a fixed one keeps the encoding the same across restarts
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=9, mtime=0) as file:
+        file.write(body)
+    return buffer.getvalue()
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for coding in (accept_encoding or "").split(","):
+        name, *params = coding.split(";")
+        if name.strip().lower() in ("gzip", "x-gzip", "*"):
+            for param in params:
+                key, _, value = param.strip().partition("=")
+                if key == "q":
+                    try:
+                        return float(value) > 0
+                    except ValueError:
+                        return False
+            return True
+    return False
+
+
+def not_modified(asset: Asset, etag: str, headers) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored if If-None-Match is sent, and tags match weakly, whether or not they are weak
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return since.timestamp() >= asset.mtime
+    return False
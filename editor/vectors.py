@@ -62,6 +62,7 @@ class VectorSet(BuiltIn):
             raise OperandDeduceError("vector-set! received out-of-range index "
                                      f"{operands[1]} for vector {operands[0]}.")
         operands[0].value[operands[1].value] = operands[2]
+        log.logger.forget_reprs()
         log.logger.raw_out("WARNING: Mutation operations on pairs are not yet supported by the debugger.\n")
         return Undefined
 
@@ -76,5 +77,6 @@ class VectorFill(BuiltIn):
             raise OperandDeduceError(f"vector-fill! expects a vector, received: {operands[0]}.")
         for i in range(len(operands[0].value)):
             operands[0].value[i] = operands[1]
+        log.logger.forget_reprs()
         log.logger.raw_out("WARNING: Mutation operations on pairs are not yet supported by the debugger.\n")
         return Undefined
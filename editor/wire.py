@@ -0,0 +1,187 @@
+import json
+import struct
+from typing import Tuple
+
+# the formats that the server can send its responses in, and their content types
+CONTENT_TYPES = {
+    "json": "application/JSON",
+    "msgpack": "application/x-msgpack",
+}
+
+
+class IncompleteData(Exception):
+    pass
+
+
+def negotiate(accept: str) -> str:
+    """
+    Returns the format to send a response in, given the Accept header of the request.
+    Clients that do not ask for MessagePack get JSON, as before.
+    """
+    if accept and CONTENT_TYPES["msgpack"] in accept:
+        return "msgpack"
+    return "json"
+
+
+def encode(obj, wire_format="json") -> bytes:
+    if wire_format == "msgpack":
+        out = bytearray()
+        pack(obj, out)
+        return bytes(out)
+    return bytes(json.dumps(obj), "utf-8")
+
+
+def pack(obj, out: bytearray):
+    """
+    Appends obj to out in MessagePack, as json.dumps would see it: tuples are arrays, and so are lists.
+    Unlike JSON, integer keys are kept as integers.
+    """
+    kind = type(obj)
+    if kind is str:
+        data = obj.encode("utf-8")
+        n = len(data)
+        if n < 32:
+            out.append(0xa0 | n)
+        elif n < 2 ** 8:
+            out += b"\xd9" + U8.pack(n)
+        elif n < 2 ** 16:
+            out += b"\xda" + U16.pack(n)
+        else:
+            out += b"\xdb" + U32.pack(n)
+        out += data
+    elif kind is int:
+        if 0 <= obj < 128:
+            out.append(obj)
+        elif -32 <= obj < 0:
+            out.append(obj & 0xff)
+        elif 0 <= obj < 2 ** 8:
+            out += b"\xcc" + U8.pack(obj)
+        elif 0 <= obj < 2 ** 16:
+            out += b"\xcd" + U16.pack(obj)
+        elif 0 <= obj < 2 ** 32:
+            out += b"\xce" + U32.pack(obj)
+        elif 0 <= obj < 2 ** 64:
+            out += b"\xcf" + struct.pack(">Q", obj)
+        elif -2 ** 7 <= obj < 0:
+            out += b"\xd0" + struct.pack(">b", obj)
+        elif -2 ** 15 <= obj < 0:
+            out += b"\xd1" + struct.pack(">h", obj)
+        elif -2 ** 31 <= obj < 0:
+            out += b"\xd2" + struct.pack(">i", obj)
+        elif -2 ** 63 <= obj < 0:
+            out += b"\xd3" + struct.pack(">q", obj)
+        else:
+            # too big for MessagePack, so send the float that JSON.parse would have made of it
+            out += b"\xcb" + struct.pack(">d", float(obj))
+    elif kind is list or kind is tuple:
+        n = len(obj)
+        if n < 16:
+            out.append(0x90 | n)
+        elif n < 2 ** 16:
+            out += b"\xdc" + U16.pack(n)
+        else:
+            out += b"\xdd" + U32.pack(n)
+        for item in obj:
+            pack(item, out)
+    elif kind is dict:
+        n = len(obj)
+        if n < 16:
+            out.append(0x80 | n)
+        elif n < 2 ** 16:
+            out += b"\xde" + U16.pack(n)
+        else:
+            out += b"\xdf" + U32.pack(n)
+        for key, val in obj.items():
+            pack(key, out)
+            pack(val, out)
+    elif obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif kind is float:
+        out += b"\xcb" + struct.pack(">d", obj)
+    elif isinstance(obj, (str, int, float, list, tuple, dict)):
+        # subclasses, such as enums, are sent as their base types, as json.dumps would
+        pack(json.loads(json.dumps(obj)), out)
+    else:
+        raise TypeError(f"Object of type {kind.__name__} cannot be sent to the client")
+
+
+U8 = struct.Struct(">B")
+U16 = struct.Struct(">H")
+U32 = struct.Struct(">I")
+
+FIXED = {
+    0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q",
+    0xd0: ">b", 0xd1: ">h", 0xd2: ">i", 0xd3: ">q",
+    0xca: ">f", 0xcb: ">d",
+}
+
+LENGTHS = {
+    0xd9: (">B", "str"), 0xda: (">H", "str"), 0xdb: (">I", "str"),
+    0xc4: (">B", "bin"), 0xc5: (">H", "bin"), 0xc6: (">I", "bin"),
+    0xdc: (">H", "array"), 0xdd: (">I", "array"),
+    0xde: (">H", "map"), 0xdf: (">I", "map"),
+}
+
+
+def unpack(data: bytes, pos=0) -> Tuple[object, int]:
+    """
+    Reads one MessagePack object from data at pos, and returns it with the position after it.
+    Raises IncompleteData if data ends first, so that a stream of objects can be read as it arrives.
+    Like static/scripts/msgpack.js, this reads the subset that pack writes, and binary data.
+    """
+    if pos >= len(data):
+        raise IncompleteData()
+    tag = data[pos]
+    pos += 1
+    if tag < 0x80:
+        return tag, pos
+    if tag >= 0xe0:
+        return tag - 0x100, pos
+    if tag == 0xc0:
+        return None, pos
+    if tag in (0xc2, 0xc3):
+        return tag == 0xc3, pos
+    if tag in FIXED:
+        end = pos + struct.calcsize(FIXED[tag])
+        if end > len(data):
+            raise IncompleteData()
+        return struct.unpack(FIXED[tag], data[pos:end])[0], end
+    if 0xa0 <= tag < 0xc0:
+        n = tag & 0x1f
+        kind = "str"
+    elif 0x90 <= tag < 0xa0:
+        n = tag & 0x0f
+        kind = "array"
+    elif 0x80 <= tag < 0x90:
+        n = tag & 0x0f
+        kind = "map"
+    elif tag in LENGTHS:
+        length, kind = LENGTHS[tag]
+        end = pos + struct.calcsize(length)
+        if end > len(data):
+            raise IncompleteData()
+        n = struct.unpack(length, data[pos:end])[0]
+        pos = end
+    else:
+        raise ValueError(f"Unsupported MessagePack type: {tag:#x}")
+
+    if kind in ("str", "bin"):
+        if pos + n > len(data):
+            raise IncompleteData()
+        val = bytes(data[pos:pos + n])
+        return val.decode("utf-8") if kind == "str" else val, pos + n
+    if kind == "array":
+        out = []
+        for _ in range(n):
+            item, pos = unpack(data, pos)
+            out.append(item)
+        return out, pos
+    out = {}
+    for _ in range(n):
+        key, pos = unpack(data, pos)
+        out[key], pos = unpack(data, pos)
+    return out, pos
@@ -0,0 +1,196 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+from multiprocessing.connection import Connection
+
+import session
+
+
+EXITED_MESSAGE = "The worker process running this session exited, click Run to start a new one."
+
+
+class WorkerError(Exception):
+    pass
+
+
+class WorkerExited(WorkerError):
+    pass
+
+
+class Worker:
+    # the parent's end of the pipe to a worker process, which can have several requests running at once
+
+    def __init__(self, process: multiprocessing.Process, connection: Connection):
+        self.process = process
+        self.connection = connection
+        self.send_lock = threading.Lock()
+        self.replies = {}  # the queue of the messages sent back for each request running, by request id
+        self.sessions = 0  # the number of sessions that the pool assigned to the worker
+        self.alive = True  # until the pipe to the worker closes, see WorkerPool.worker
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+    def send(self, request_id, *message) -> queue.Queue:
+        replies = self.replies[request_id] = queue.Queue()
+        try:
+            with self.send_lock:
+                self.connection.send((request_id, *message))
+        except OSError:  # the worker exited, and read may not have seen it yet
+            self.alive = False
+            replies.put(("exited", EXITED_MESSAGE))
+        if not self.alive:  # read had already answered the requests running
+            replies.put(("exited", EXITED_MESSAGE))
+        return replies
+
+    def read(self):
+        while True:
+            try:
+                request_id, kind, value = self.connection.recv()
+            except (EOFError, OSError):
+                break
+            self.replies[request_id].put((kind, value))
+        # the worker exited, so the requests running in it never will be answered
+        self.alive = False
+        for replies in list(self.replies.values()):
+            replies.put(("exited", EXITED_MESSAGE))
+
+
+class WorkerPool:
+    """
+    Runs the code of clients in worker processes, so that the server can evaluate code on more than one core.
+    Each worker is started along with the server, and evaluates a query before its first client does, so that
+    the builtins are loaded and the code of the interpreter is warm by then.
+    Every request of a client goes to the worker that its session was assigned to, which holds its global
+    frames and its traces. Sessions are assigned to the worker with the fewest of them when they are first seen.
+    Like the threaded server, each worker handles each request in a new thread, so a session can be canceled
+    while it runs.
+    A worker that exits is replaced by a new one, which its sessions are assigned to, and which tells their
+    clients that their frames expired.
+    """
+
+    def __init__(self, processes: int, options: dict = None):
+        # options are the attributes to set on the logger of each session, see local_server.client_session
+        self.options = options or {}
+        self.workers = [self.spawn() for _ in range(processes)]
+        self.assigned = {}  # the worker of each session and when the session was last used, by its id
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+
+    def spawn(self) -> Worker:
+        context = multiprocessing.get_context()
+        connection, child = context.Pipe()
+        process = context.Process(target=serve, args=(child, self.options), daemon=True)
+        process.start()
+        child.close()
+        return Worker(process, connection)
+
+    def worker(self, session_id) -> Worker:
+        now = time.monotonic()
+        with self.lock:
+            if session_id in self.assigned:
+                worker, _ = self.assigned[session_id]
+            else:
+                self.expire(now)
+                worker = min(self.workers, key=lambda worker: worker.sessions)
+                worker.sessions += 1
+            if not worker.alive:
+                worker = self.replace(worker)
+            self.assigned[session_id] = worker, now
+            return worker
+
+    def replace(self, dead: Worker) -> Worker:
+        # starts a worker in place of one that exited, and assigns its sessions to the new one
+        dead.connection.close()  # before the fork, so that the new worker holds no copy of it
+        dead.process.terminate()
+        dead.process.join()
+        worker = self.spawn()
+        worker.sessions = dead.sessions
+        self.workers[self.workers.index(dead)] = worker
+        for session_id, (assigned, last_used) in list(self.assigned.items()):
+            if assigned is dead:
+                self.assigned[session_id] = worker, last_used
+        return worker
+
+    def expire(self, now):
+        # forgets the sessions that their workers drop, see local_server.expire_sessions; the default one never is
+        for session_id, (worker, last_used) in list(self.assigned.items()):
+            if session_id is not None and now - last_used > session.SESSION_TTL:
+                del self.assigned[session_id]
+                worker.sessions -= 1
+
+    def call(self, session_id, name, *args, write=None, **kwargs):
+        """
+        Calls the function name of local_server in the session session_id, in its worker, and returns what it
+        returns. If write is given, it is passed to the function, and called with what the function writes.
+        Raises WorkerExited if the worker exits before the function returns.
+        """
+        worker = self.worker(session_id)
+        request_id = next(self.ids)
+        replies = worker.send(request_id, session_id, name, args, kwargs, write is not None)
+        try:
+            while True:
+                kind, value = replies.get()
+                if kind == "write":
+                    write(value)
+                elif kind == "return":
+                    return value
+                elif kind == "exited":
+                    raise WorkerExited(value)
+                else:
+                    raise WorkerError(value)
+        finally:
+            del worker.replies[request_id]
+
+    def close(self):
+        # forked workers hold copies of the parent's ends of the pipes, so they would not see them close
+        for worker in self.workers:
+            try:
+                with worker.send_lock:
+                    worker.connection.send(None)
+            except OSError:  # the worker exited
+                pass
+        for worker in self.workers:
+            worker.process.join()
+            worker.connection.close()
+
+
+def serve(connection: Connection, options: dict):
+    # the main loop of a worker process
+    import execution
+    import local_server
+    import log
+
+    local_server.handle(["(define (warm n) (if (= n 0) n (warm (- n 1)))) (warm 100)"], 0, 0, -1, False,
+                        threading.Event())
+    log.logger = log.Logger()  # sessions start with the options of the default one
+    for key, val in options.items():
+        setattr(log.logger, key, val)
+
+    send_lock = threading.Lock()
+
+    def send(*message):
+        with send_lock:
+            connection.send(message)
+
+    def run(request_id, session_id, name, args, kwargs, writes):
+        if writes:
+            kwargs["write"] = lambda value: send(request_id, "write", value)
+        try:
+            with session.activate(local_server.client_session(session_id)):
+                result = getattr(local_server, name)(*args, **kwargs)
+        except Exception:
+            send(request_id, "error", traceback.format_exc())
+        else:
+            send(request_id, "return", result)
+
+    while True:
+        try:
+            request = connection.recv()
+        except (EOFError, OSError):
+            return
+        if request is None:  # the server closed the pool
+            return
+        threading.Thread(target=run, args=request, daemon=True).start()
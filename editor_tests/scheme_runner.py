@@ -46,37 +46,44 @@ class SchemeTestCase(TestCase):
         return "SchemeTestCase(" + repr(self.queries) + ")"
 
     @staticmethod
-    def get_scm_response(code, reset, global_frame=None):
+    def reset_logger():
+        log.logger = log.Logger()
+        log.logger.autodraw = False
+        log.announce = log.logger.log
+
+    @staticmethod
+    def get_scm_response(code, reset, global_frame=None, backend="visual", tree_format="states", **options):
+        # options are attributes of the logger to set for this query, such as its policy or tree_depth
         try:
             if reset:
-                log.logger = log.Logger()
-                log.logger.autodraw = False
-                log.announce = log.logger.log
+                SchemeTestCase.reset_logger()
             if global_frame is not None:
                 log.logger.new_query(log.logger.frame_lookup[id(global_frame)])
             else:
                 log.logger.new_query()
+            for name, value in options.items():
+                setattr(log.logger, name, value)
             if isinstance(code, str):
                 code = [code]
             else:
                 code = ["\n".join(code)]
-            execution.string_exec(code, log.logger.out, False, global_frame)
+            execution.string_exec(code, log.logger.out, False, global_frame, backend)
         except ParseError as e:
             return {"success": False, "out": [str(e)]}
 
-        out = log.logger.export()
+        out = log.logger.export(tree_format)
         return out
 
-    def run(self):
+    def run(self, backend="visual"):
         global_frame = None
         for query in self.queries:
-            response = self.get_scm_response(query.code, query is self.queries[0], global_frame)
+            response = self.get_scm_response(query.code, query is self.queries[0], global_frame, backend)
             self.compare(response, query.expected, query.code)
             if global_frame is None:
                 global_frame = log.logger.frame_lookup[response["globalFrameID"]].base
 
 
-def run_case(case: str):
+def run_case(case: str, backend="visual"):
     sys.path.append(os.path.abspath('./editor_tests/scm_tests'))
     if not case.startswith("case"):
         case = "case_" + case
@@ -84,13 +91,13 @@ def run_case(case: str):
         case = case[:-3]
     cases = __import__(f"{case}")
     for case in cases.cases:
-        case.run()
+        case.run(backend)
 
 
-def run_all_cases(path):
+def run_all_cases(path, backend="visual"):
     if not path.startswith("/"):
         path = "/" + path
     files = filter(lambda x: x.lower().startswith("case"), os.listdir(os.curdir + "/editor_tests" + path))
     for file in files:
         print(file)
-        run_case(file)
+        run_case(file, backend)
@@ -0,0 +1,25 @@
+from scheme_runner import SchemeTestCase, Query
+
+cases = [
+    SchemeTestCase([
+        Query(code=['(+ 1 (call/cc (lambda (k) (+ 10 (k 5)))))'], expected={'out': ['6\n']}),
+        Query(code=['(define (find-neg lst) (call/cc (lambda (return) (define (walk lst) (cond ((null? lst) #f) '
+                    '((< (car lst) 0) (return (car lst))) (else (walk (cdr lst))))) (walk lst))))'],
+              expected={'out': ['find-neg\n']}),
+        Query(code=["(find-neg '(1 -2 3))"], expected={'out': ['-2\n']}),
+        Query(code=["(find-neg '(1 2 3))"], expected={'out': ['#f\n']}),
+        Query(code=['(call-with-current-continuation (lambda (k) 3))'], expected={'out': ['3\n']})
+    ]),
+    SchemeTestCase([
+        Query(code=['(call-with-values (lambda () (values 1 2 3)) list)'], expected={'out': ['(1 2 3)\n']}),
+        Query(code=['(call-with-values (lambda () 5) (lambda (x) (* x x)))'], expected={'out': ['25\n']}),
+        Query(code=['(values 4)'], expected={'out': ['4\n']})
+    ]),
+    SchemeTestCase([
+        Query(code=["(dynamic-wind (lambda () (display 'before)) (lambda () 'result) (lambda () (display 'after)))"],
+              expected={'out': ['beforeafterresult\n']}),
+        Query(code=["(call/cc (lambda (k) (dynamic-wind (lambda () (display 'in)) (lambda () (k 'escaped)) "
+                    "(lambda () (display 'out)))))"],
+              expected={'out': ['inoutescaped\n']})
+    ])
+]
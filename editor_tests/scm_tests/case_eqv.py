@@ -1,4 +1,5 @@
 from scheme_runner import SchemeTestCase, Query
 cases = [
-SchemeTestCase([Query(code=['(eq? 1.0 1.0)'], expected={'out': ['#f\n']}), Query(code=['(eqv? 1.0 1.0)'], expected={'out': ['#t\n']})])
+SchemeTestCase([Query(code=['(eq? 1.0 1.0)'], expected={'out': ['#f\n']}), Query(code=['(eqv? 1.0 1.0)'], expected={'out': ['#t\n']})]),
+SchemeTestCase([Query(code=['(eq? 1 1)'], expected={'out': ['#t\n']}), Query(code=['(eq? (+ 2 3) 5)'], expected={'out': ['#t\n']}), Query(code=['(eq? 5 (/ 10 2))'], expected={'out': ['#t\n']}), Query(code=['(eq? (* 2.5 2) (- 7.5 2.5))'], expected={'out': ['#t\n']}), Query(code=["(eq? #\\a (string-ref \"abc\" 0))"], expected={'out': ['#t\n']}), Query(code=["(eq? 'abc (string->symbol \"abc\"))"], expected={'out': ['#t\n']})])
 ]
@@ -0,0 +1,45 @@
+from scheme_runner import SchemeTestCase, Query
+
+cases = [
+    SchemeTestCase([
+        Query(code=['(define x 1)'], expected={'out': ['x\n']}),
+        Query(code=["(define (f) (define (g) x) (eval '(define x 2)) (g))"], expected={'out': ['f\n']}),
+        Query(code=['(f)'], expected={'out': ['2\n']}),
+        Query(code=['x'], expected={'out': ['1\n']})
+    ]),
+    SchemeTestCase([
+        Query(code=['(define x 1)'], expected={'out': ['x\n']}),
+        Query(code=['(define (f c) (if c (define x 2)) (lambda () x))'], expected={'out': ['f\n']}),
+        Query(code=['((f #t))'], expected={'out': ['2\n']}),
+        Query(code=['((f #f))'], expected={'out': ['1\n']})
+    ]),
+    SchemeTestCase([
+        Query(code=['(define-macro (def n v) `(define ,n ,v))'], expected={'out': ['def\n']}),
+        Query(code=['(define y 1)'], expected={'out': ['y\n']}),
+        Query(code=['(define (f) (def y 2) (lambda () y))'], expected={'out': ['f\n']}),
+        Query(code=['((f))'], expected={'out': ['2\n']}),
+        Query(code=['y'], expected={'out': ['1\n']})
+    ]),
+    SchemeTestCase([
+        Query(code=['(define (f a) (let* ((b (+ a 1)) (c (* b 2))) (define d (+ c 1)) (list a b c d)))'], expected={'out': ['f\n']}),
+        Query(code=['(f 1)'], expected={'out': ['(1 2 4 5)\n']})
+    ]),
+    SchemeTestCase([
+        Query(code=['(define (counter) (define n 0) (lambda () (set! n (+ n 1)) n))'], expected={'out': ['counter\n']}),
+        Query(code=['(define c (counter))'], expected={'out': ['c\n']}),
+        Query(code=['(c)'], expected={'out': ['1\n']}),
+        Query(code=['(c)'], expected={'out': ['2\n']})
+    ]),
+    SchemeTestCase([
+        Query(code=['(define (f x) (define g (mu () x)) (define (h x) (g)) (h 5))'], expected={'out': ['f\n']}),
+        Query(code=['(f 1)'], expected={'out': ['5\n']})
+    ]),
+    SchemeTestCase([
+        Query(code=['(define (f x) (let ((x (+ x 1)) (y x)) (list x y)))'], expected={'out': ['f\n']}),
+        Query(code=['(f 1)'], expected={'out': ['(2 1)\n']})
+    ]),
+    SchemeTestCase([
+        Query(code=['(define (outer a) (define (mid b) (define (inner c) (list a b c)) (inner 3)) (mid 2))'], expected={'out': ['outer\n']}),
+        Query(code=['(outer 1)'], expected={'out': ['(1 2 3)\n']})
+    ]),
+]
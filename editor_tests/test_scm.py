@@ -1,5 +1,543 @@
+import json
+import os
+import sys
+
 import scheme_runner
+import datamodel
+import evaluate_apply
+from execution_parser import get_expression
+from lexer import TokenBuffer
 
 
 def test_output():
     scheme_runner.run_all_cases("scm_tests")
+
+
+def test_headless_output():
+    scheme_runner.run_all_cases("scm_tests", backend="headless")
+
+
+def test_compiled_output():
+    scheme_runner.run_all_cases("scm_tests", backend="compiled")
+
+
+def test_iterative_output():
+    scheme_runner.run_all_cases("scm_tests", backend="iterative")
+
+
+def test_interned_symbols():
+    # every occurrence of a name is read as the same Symbol, so that they can be compared by identity
+    expr = get_expression(TokenBuffer(["(foo Foo FOO 'foo)"]))
+    assert expr.first is expr.rest.first is expr.rest.rest.first is datamodel.Symbol("foo")
+    assert expr.rest.rest.rest.first.rest.first is datamodel.Symbol("foo")
+    # including when sessions in several threads read a name at once
+    import threading
+    symbols = []
+    threads = [threading.Thread(target=lambda: symbols.append([datamodel.Symbol(f"thread{i}") for i in range(2000)]))
+               for _ in range(4)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert all(all(a is b for a, b in zip(symbols[0], other)) for other in symbols[1:])
+    # and a name is dropped from the table once the session that read it is gone
+    import gc
+    import session
+    with session.activate(session.Session()):
+        scheme_runner.SchemeTestCase.get_scm_response("(define (unshared-name x) x) (unshared-name 'unshared-quote)",
+                                                      True)
+        assert "unshared-name" in datamodel.Symbol.table
+    gc.collect()
+    assert "unshared-name" not in datamodel.Symbol.table and "unshared-quote" not in datamodel.Symbol.table
+    scheme_runner.SchemeTestCase([
+        scheme_runner.Query(code=["(eq? 'foo (string->symbol \"foo\"))"], expected=scheme_runner.out("#t")),
+        scheme_runner.Query(code=["(eq? 'foo 'FOO)"], expected=scheme_runner.out("#t")),
+    ]).run()
+
+
+def test_slots():
+    # the objects made for each step of an evaluation have no __dict__
+    log = scheme_runner.log
+    scheme_runner.SchemeTestCase.get_scm_response("(define x 1)", True)
+    frame = evaluate_apply.Frame("f")
+    pair = datamodel.Pair(datamodel.Number(1), datamodel.Nil)
+    holder = log.Holder(pair, None)
+    for obj in [pair, datamodel.Symbol("x"), datamodel.Number(1.5), datamodel.String("x"),
+                datamodel.Promise(pair, frame), frame, holder, holder.expression,
+                log.Node(holder.expression, log.HolderState.UNEVALUATED), log.logger.frame_lookup[id(frame)]]:
+        assert not hasattr(obj, "__dict__"), type(obj)
+
+
+def test_iterative_deep_recursion():
+    scheme_runner.SchemeTestCase([
+        scheme_runner.Query(code=["(define (count n) (if (= n 0) 0 (+ 1 (count (- n 1)))))"], expected={}),
+        scheme_runner.Query(code=["(count 20000)"], expected=scheme_runner.out("20000")),
+    ]).run("iterative")
+    # through each special form and builtin that evaluates expressions
+    for body in ["(case n ((0) 0) (else (+ 1 (f (- n 1)))))",
+                 "(if (= n 0) 0 (+ 1 (car `(,(f (- n 1))))))",
+                 "(if (= n 0) 0 (+ 1 (car `(,@(list (f (- n 1)))))))",
+                 "(if (= n 0) 0 (+ 1 (eval (list 'f (- n 1)))))",
+                 "(if (= n 0) 0 (+ 1 (apply f (list (- n 1)))))",
+                 "(if (= n 0) nil (cons n (force (delay (f (- n 1))))))"]:
+        scheme_runner.SchemeTestCase([
+            scheme_runner.Query(code=[f"(define (f n) {body})"], expected={}),
+            scheme_runner.Query(code=["(define result (f 20000))"], expected={}),
+            scheme_runner.Query(code=["(if (pair? result) (length result) result)"],
+                                expected=scheme_runner.out("20000")),
+        ]).run("iterative")
+    # but not through those that the interpreter runs, see iterative.py
+    out = scheme_runner.SchemeTestCase.get_scm_response(
+        "(define (f n) (if (= n 0) 0 (begin (expect (f (- n 1)) 0) n))) (f 20000)", True, backend="iterative")
+    assert out["out"][0].endswith("RecursionError('maximum recursion depth exceeded')\n")
+
+
+def test_iterative_reentrant_continuations():
+    scheme_runner.SchemeTestCase([
+        scheme_runner.Query(code=["(define saved nil)"], expected={}),
+        scheme_runner.Query(code=["(define count 0)"], expected={}),
+        scheme_runner.Query(code=["(begin (display (+ 1 (call/cc (lambda (k) (set! saved k) 0)))) "
+                                  "(set! count (+ count 1)) (if (< count 3) (saved count) 'end))"],
+                            expected=scheme_runner.out("123end")),
+    ]).run("iterative")
+    # each return to the bindings of a let makes a new frame, which closures made earlier do not see
+    for kind in ["let", "let*"]:
+        scheme_runner.SchemeTestCase([
+            scheme_runner.Query(code=["(define saved nil) (define fs nil)"], expected={}),
+            scheme_runner.Query(code=[f"(begin ({kind} ((a (call/cc (lambda (k) (set! saved k) 1))) (b 0)) "
+                                      "(set! fs (cons (lambda () (list a b)) fs))) "
+                                      "(if (< (length fs) 3) (saved (+ (length fs) 1))) "
+                                      "(list ((car fs)) ((cadr fs)) ((caddr fs))))"],
+                                expected=scheme_runner.out("((3 0) (2 0) (1 0))")),
+        ]).run("iterative")
+
+
+def test_multiple_values():
+    # values passed on where one is expected are shown as they are, and are an error to evaluate
+    for backend in ["visual", "headless", "compiled", "iterative"]:
+        scheme_runner.SchemeTestCase([
+            scheme_runner.Query(code=["(apply list (list (values 1 2)))"], expected=scheme_runner.out("(1 2)")),
+            scheme_runner.Query(code=["(eval (values 1 2))"], expected=scheme_runner.out("Error")),
+        ]).run(backend)
+
+
+def test_tracebacks():
+    # every backend prints the traceback the visual one does, however long the chain of tail calls
+    for code in ["(define (f x) (g x)) (define (g x) (car x)) (f 1)",
+                 "(define (f n) (if (= n 0) (car n) (+ 1 (f (- n 1))))) (f 30)",
+                 "(define (f n) (display n) (cond ((= n 0) (car n)) (else (let ((m (- n 1))) (f m))))) (f 30)",
+                 "(define-macro (my-if c a b) (list 'cond (list c a) (list 'else b))) "
+                 "(define (f n) (my-if (= n 0) (car n) (f (- n 1)))) (f 30)",
+                 "(define (f n) (call/cc (lambda (k) (if (= n 0) (car n) (f (- n 1)))))) (f 30)"]:
+        expected = scheme_runner.SchemeTestCase.get_scm_response(code, True)["out"]
+        for backend in ["headless", "compiled", "iterative"]:
+            observed = scheme_runner.SchemeTestCase.get_scm_response(code, True, backend=backend)["out"]
+            assert observed == expected, f"Code: {code}\nBackend: {backend}\nObserved: \n{observed[0]}"
+    # past what the visual backend can run, the entries left out are still counted
+    code = "(define (loop i) (if (= i 0) (car i) (loop (- i 1)))) (loop 30000)"
+    for backend in ["headless", "compiled", "iterative"]:
+        observed = scheme_runner.SchemeTestCase.get_scm_response(code, True, backend=backend)["out"][0]
+        assert "[59983 lines omitted from traceback]\n60002 (car i) " in observed, observed
+
+
+def test_return_values(monkeypatch):
+    # every backend binds the same names in the frames it makes, including the "Return Value" of each,
+    # which the frames of a chain of tail calls are all given
+    def frames(code, backend):
+        out = scheme_runner.SchemeTestCase.get_scm_response(code, True, backend=backend)
+        return {frame["name"]: [binding[1] for binding in frame["bindings"]]
+                for frame in out["frame_lookup"].values()}
+
+    for code in ["(define (f n) (* n 2)) (f 3)",
+                 "(define (f n) (if (= n 0) 'done (f (- n 1)))) (f 3)",
+                 "(define (g) 7) (define (f) (let ((a 1)) (let* ((b 2) (c 3)) (g)))) (f)",
+                 "(define-macro (m) '(let ((z 1)) (g z))) (define (g z) z) (define (f) (m)) (f)",
+                 "(define (f n) (let ((x n)) (g x))) (define (g y) (car y)) (f 4)",
+                 "(define (f) (call/cc (lambda (k) (k 3)))) (f)",
+                 "(apply (lambda (x) x) '(1))"]:
+        expected = frames(code, "visual")
+        for backend in ["headless", "compiled", "iterative"]:
+            assert frames(code, backend) == expected, f"Code: {code}\nBackend: {backend}"
+    # past what the trace records, frames are not kept, and those that are gone are dropped from the list
+    # of frames given the value of a chain of tail calls, so that it runs in constant space
+    log = scheme_runner.log
+    monkeypatch.setattr(log.logger, "policy", log.TracePolicy(0))
+    return_frames = None
+    for _ in range(1000):
+        return_frames = evaluate_apply.add_return_frame(evaluate_apply.Frame("f"), return_frames)
+    assert return_frames.length <= evaluate_apply.RETURN_FRAMES_LIMIT
+
+
+def test_headless_tail_calls():
+    # deeper than RECURSION_LIMIT if every tail call were kept on the eval stack
+    scheme_runner.SchemeTestCase([
+        scheme_runner.Query(code=["(define (loop i) (cond ((= i 0) 'done) "
+                                  "(else (and #t (or #f (let ((j (- i 1))) (loop j)))))))"], expected={}),
+        scheme_runner.Query(code=["(loop 21000)"], expected=scheme_runner.out("done")),
+    ]).run("headless")
+
+
+def test_lazy_traceback(monkeypatch):
+    # only the entries printed in a traceback are rendered, and only once it is printed
+    rendered = []
+    render = scheme_runner.execution.render_stack_entry
+    monkeypatch.setattr(scheme_runner.execution, "render_stack_entry",
+                        lambda *entry: rendered.append(entry) or render(*entry))
+    code = "(define (f n) (if (= n 0) (car n) (+ 1 (f (- n 1))))) (f 100)"
+    for backend in ["visual", "headless", "compiled", "iterative"]:
+        rendered.clear()
+        out = scheme_runner.SchemeTestCase.get_scm_response(code, True, backend=backend)["out"][0]
+        assert "[283 lines omitted from traceback]\n302 (car n) [frame = f101]\n" in out
+        assert len(rendered) == scheme_runner.log.MAX_TRACEBACK_LENGTH
+
+
+def normalize_export(export):
+    # node and heap ids depend on what ran before, so they are numbered by the order they appear in
+    nodes = set(export["roots"])
+    for _, _, states in export["states"]:
+        nodes.update(states)
+    number = {node: str(i) for i, node in enumerate(sorted(nodes, key=int))}
+    pointers = {}
+    return {
+        "roots": [number[root] for root in export["roots"]],
+        "states": [[start, end, {number[node]: {**data, "children": [[i, [number[child] for child in children]]
+                                                                     for i, children in data["children"]]}
+                                 for node, data in states.items()}]
+                   for start, end, states in export["states"]],
+        "frames": [[data["name"], data["label"], data["parent"],
+                    [[i, name, [is_pointer, pointers.setdefault(key, str(len(pointers))) if is_pointer else key]]
+                     for i, name, (is_pointer, key) in data["bindings"]]]
+                   for data in export["frame_lookup"].values() if data is not None],
+        "out": export["out"],
+    }
+
+
+def test_legacy_export():
+    # the roots and states rebuilt from the records of the tree are those that used to be exported
+    sys.path.append(os.path.abspath("./editor_tests/scm_tests"))
+    with open("editor_tests/legacy_exports.json") as file:
+        expected = json.load(file)
+    for name, exports in expected.items():
+        case = __import__(name).cases[0]
+        global_frame = None
+        for query, export in zip(case.queries, exports):
+            response = case.get_scm_response(query.code, query is case.queries[0], global_frame)
+            assert json.loads(json.dumps(normalize_export(response))) == export, f"Code: {query.code}"
+            if global_frame is None:
+                global_frame = scheme_runner.log.logger.frame_lookup[response["globalFrameID"]].base
+        assert len(exports) == len(case.queries)
+
+
+def test_streamed_output(monkeypatch):
+    # a chunk for every op, which together make up the same output and frames as a single export
+    code = "(define (f n) (if (= n 0) 'done (begin (display n) (f (- n 1))))) (f 30)"
+    expected = scheme_runner.SchemeTestCase.get_scm_response(code, True)
+    monkeypatch.setattr(scheme_runner.log, "STREAM_INTERVAL", 0)
+    chunks = []
+    scheme_runner.log.logger.new_query()
+    scheme_runner.log.logger.stream_to(chunks.append)
+    scheme_runner.execution.string_exec([code], scheme_runner.log.logger.out, False, None, "visual")
+    scheme_runner.log.logger.flush()
+    assert len(chunks) > 100
+    assert "".join(chunk["out"] for chunk in chunks) == expected["out"][0]
+    bindings = {}
+    for chunk in chunks:
+        for frame in chunk["frame_lookup"].values():
+            bindings.setdefault(frame["name"], []).extend(binding[1] for binding in frame["bindings"])
+    assert bindings == {frame["name"]: [binding[1] for binding in frame["bindings"]]
+                        for frame in expected["frame_lookup"].values() if frame is not None}
+
+
+def test_trace_policies():
+    # each policy records the end of a run that is past the first few steps, except within a small budget
+    log = scheme_runner.log
+    code = "(define (f n) (if (= n 0) 'done (f (- n 1)))) (f 300)"
+    for policy, complete in [(log.FirstAndLast(first=100, last=50), True), (log.TopLevels(depth=4), True),
+                             (log.EveryNth(n=10), True), (log.TracePolicy(budget=2 ** 16), False)]:
+        out = scheme_runner.SchemeTestCase.get_scm_response(code, True, tree_format="delta", policy=policy)
+        assert out["out"] == ["f\ndone\n"]
+        assert len(json.dumps(out["tree"])) < policy.budget
+        roots, states = log.states_from_tree(out["tree"])
+        root = states[-1][2][roots[-1]]
+        assert (root["transitions"][-1][1] == "EVALUATED") == complete
+        if complete:
+            assert root["strs"][-1][1] == "done"
+
+
+def test_released_frames():
+    # frames are kept while the client holds their global frame, and freed once it saves state without it
+    import gc
+    import weakref
+    import local_server
+    code = "(define (make-adder n) (lambda (x) (+ x n))) (define add1 (make-adder 1)) (add1 2)"
+    outs = [scheme_runner.SchemeTestCase.get_scm_response(code, reset) for reset in [True, False]]
+    frames = [weakref.ref(local_server.retained_frame(out["globalFrameID"])) for out in outs]
+    states = [{"globalFrameID": out["globalFrameID"], "generation": out["generation"]} for out in outs]
+    local_server.release_frames({"states": states})
+    gc.collect()
+    assert all(frame() is not None for frame in frames)
+    # a save while code runs in the session does not wait for it, and the frames are released once it is done
+    import session
+    with session.current().lock:
+        local_server.release_frames({"states": states[1:]})
+        gc.collect()
+        assert frames[0]() is not None
+    out = local_server.run(["(add1 3)"], 0, 0, outs[1]["globalFrameID"], False)
+    gc.collect()
+    assert "4" in out["out"][0]
+    assert frames[0]() is None and local_server.retained_frame(outs[0]["globalFrameID"]) is None
+    assert frames[1]() is local_server.retained_frame(outs[1]["globalFrameID"]) is not None
+
+
+def test_heap_ids():
+    # lists that are equal but not eq? have their own ids, and long or cyclic ones are recorded without recursion.
+    # The Return Values of the frames of range are long lists, so the budget is raised to record all of them
+    code = "(define (range n) (if (= n 0) nil (cons n (range (- n 1))))) (define a (range 3000)) " \
+           "(define b (range 3000)) (define c a) (eq? a b)"
+    policy = scheme_runner.log.TracePolicy(4 * scheme_runner.log.TRACE_BUDGET)
+    out = scheme_runner.SchemeTestCase.get_scm_response(code, True, backend="iterative", policy=policy)
+    keys = {name: key for _, (name, _), (_, key) in out["frame_lookup"][out["globalFrameID"]]["bindings"]}
+    assert out["out"][0].endswith("#f\n")
+    assert keys["a"] != keys["b"] and keys["a"] == keys["c"]
+    assert len(out["heap"]) == 1 + 2 * 3000  # range and the two lists
+    cycle = datamodel.Pair(datamodel.Number(1), datamodel.Pair(datamodel.Number(2), datamodel.Nil))
+    cycle.rest.rest = cycle
+    heap = scheme_runner.log.Heap()
+    key = heap.record(cycle)
+    entries = heap.export()
+    assert len(entries) == 2 and entries[entries[key[1]][1][1]][1] == key
+
+
+def test_wire_format():
+    # a run sent in MessagePack reads back as it would from JSON, except that integer keys stay integers
+    import wire
+    code = "(define (f n) (if (= n 0) (list 1.5 \"é\" #t) (cons (- n) (f (- n 1))))) (f 300)"
+    for tree_format in ["states", "delta"]:
+        payload = scheme_runner.SchemeTestCase.get_scm_response(code, True, tree_format=tree_format)
+        data = wire.encode(payload, "msgpack")
+        decoded, end = wire.unpack(data + data, len(data))
+        assert end == 2 * len(data) and len(data) < len(wire.encode(payload))
+        assert json.loads(json.dumps(decoded)) == json.loads(json.dumps(payload))
+
+
+def test_cached_reprs():
+    # the reprs of pairs are cached within a query, until a pair is mutated
+    code = "(define x (list 1 2)) (define (f y) y) (f x) (set-car! x 5) (f x)"
+    out = scheme_runner.SchemeTestCase.get_scm_response(code, True)
+    roots, states = out["roots"], out["states"]
+    assert states[2][2][roots[2]]["strs"][-1][1] == "(1 2)"
+    assert states[4][2][roots[4]]["strs"][-1][1] == "(5 2)"
+    assert out["frame_lookup"][out["active_frames"][-1]]["bindings"][0][1] == ("y", "(5 2)")
+
+
+def fetch_subtrees(out, depth):
+    # fills in the nodes that a lazy tree left out, as the client does, from the subtrees the server sends
+    import local_server
+    states = out["states"]
+    for start, end, nodes in states:
+        missing = [node_id for node_id, node in nodes.items() if not node["transitions"]]
+        while missing:
+            for node_id in missing:
+                response = json.loads(local_server.subtree(out["globalFrameID"], int(node_id), start, end, depth))
+                _, [(_, _, fetched)] = scheme_runner.log.states_from_tree(response["tree"] +
+                                                                         [["expr", start, end, node_id]])
+                nodes.update((i, node) for i, node in fetched.items() if i not in nodes or not nodes[i]["transitions"])
+            missing = [node_id for node_id, node in nodes.items() if not node["transitions"]]
+    return states
+
+
+def test_lazy_tree():
+    # a lazy tree leaves out the nodes deeper than tree_depth, which the client then fetches from the trace store
+    import session
+    code = "(define (f n) (if (= n 0) 0 (+ n (f (- n 1))))) (f 10)"
+    session.current().counter = 0  # so that both runs have the same node ids
+    full = scheme_runner.SchemeTestCase.get_scm_response(code, True)
+    session.current().counter = 0
+    out = scheme_runner.SchemeTestCase.get_scm_response(code, True, tree_depth=2)
+    assert out["roots"] == full["roots"]
+    assert any(not node["transitions"] for node in out["states"][-1][2].values())
+    assert fetch_subtrees(out, 2) == full["states"]
+
+
+def test_spilled_trace(tmp_path):
+    # a spilled trace is moved to a file while it is recorded, and reads back as it would from memory
+    import session
+    code = "(define (f n) (if (= n 0) 0 (+ n (f (- n 1))))) (f 300)"
+    results = []
+    for spill_dir in [None, str(tmp_path)]:
+        session.current().counter = 0  # so that both runs have the same node ids
+        out = scheme_runner.SchemeTestCase.get_scm_response(code, True, policy=scheme_runner.log.make_policy("all"),
+                                                            spill_dir=spill_dir,
+                                                            tree_depth=2 if spill_dir is None else None)
+        # a spilled tree is always sent lazily
+        assert any(not node["transitions"] for node in out["states"][-1][2].values())
+        results.append(json.loads(json.dumps(fetch_subtrees(out, 10 ** 6))))
+    assert results[0] == results[1]
+
+
+def test_profile():
+    # a profile counts the calls of each special form, builtin and procedure, whether or not they go through apply
+    import profiler
+    code = "(define (fib n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))) (fib 10) (map car '((1) (2) (3)))"
+    out = scheme_runner.SchemeTestCase.get_scm_response(code, True, backend="headless", profile=profiler.Profile())
+    rows = {(row["kind"], row["name"]): row for row in out["profile"]}
+    assert rows["procedure", "fib"]["calls"] == rows["special form", "if"]["calls"] == 177
+    assert rows["builtin", "+"]["calls"] == 88 and rows["builtin", "car"]["calls"] == 3
+    assert rows["special form", "define"]["calls"] == 1 and rows["builtin", "map"]["calls"] == 1
+    assert all(0 <= row["self"] <= row["time"] for row in rows.values())
+
+
+def test_concurrent_sessions():
+    # code run for different clients at once, each in its own session, does not see that of the others
+    import threading
+    import local_server
+    import session
+    results = {}
+
+    def run(name, n):
+        with session.activate(session.Session()) as current:
+            current.logger.autodraw = False
+            event = threading.Event()
+            first = local_server.handle([f"(define x {n})"], 0, 0, -1, False, event)
+            second = local_server.handle(["(define (f k) (if (= k 0) x (+ 1 (f (- k 1))))) (f 100)"], 0, 0,
+                                         first["globalFrameID"], False, event)
+            results[name] = first["globalFrameID"], second["out"][0].split()
+
+    threads = [threading.Thread(target=run, args=(name, n)) for name, n in [("a", 1), ("b", 2)]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results["a"][1] == ["f", "101"] and results["b"][1] == ["f", "102"]
+    assert local_server.retained_frame(results["a"][0]) is None  # frames are only retained by their sessions
+
+
+def test_expired_sessions(monkeypatch):
+    # the session of a client that is idle for longer than SESSION_TTL is dropped along with its frames
+    import gc
+    import threading
+    import weakref
+    import local_server
+    import session
+    out = local_server.dispatch("idle", "handle", ["(define x 1)"], 0, 0, -1, False, threading.Event())
+    idle = weakref.ref(local_server.client_session("idle"))
+    monkeypatch.setattr(session, "SESSION_TTL", -1)
+    local_server.client_session("new")
+    gc.collect()
+    assert idle() is None
+    again = local_server.dispatch("idle", "handle", ["x"], 0, 0, out["globalFrameID"], False, threading.Event())
+    assert again["out"] == [local_server.EXPIRED_MESSAGE]
+
+
+def test_worker_pool(monkeypatch):
+    # each session stays in the worker that holds its global frames, and its output is written back as it runs
+    import session
+    from worker_pool import WorkerPool
+    pool = WorkerPool(2)
+    try:
+        first = {name: pool.call(name, "run", [f"(define x {n})"], 0, 0, -1, False) for name, n in [("a", 1), ("b", 2)]}
+        assert pool.worker("a") is not pool.worker("b")
+        chunks = []
+        pool.call("a", "run_stream", ["x"], 0, 0, first["a"]["globalFrameID"], False, write=chunks.append)
+        assert chunks[-1]["done"] and "1" in "".join(chunk.get("out", "") for chunk in chunks)
+        second = pool.call("b", "run", ["x"], 0, 0, first["b"]["globalFrameID"], False)
+        assert second["success"] and "2" in second["out"][0]
+        if first["a"]["globalFrameID"] != first["b"]["globalFrameID"]:  # ids are addresses, which workers can share
+            assert "expired" in pool.call("b", "run", ["x"], 0, 0, first["a"]["globalFrameID"], False)["out"][0]
+        # a worker that exits is replaced, and the requests running in it are answered with an error
+        import threading
+        import time
+        import local_server
+        monkeypatch.setattr(local_server, "pool", pool)
+        worker, results = pool.worker("a"), []
+        thread = threading.Thread(target=lambda: results.append(
+            local_server.dispatch("a", "run", ["(define (f) (f)) (f)"], 0, 0, -1, False)))
+        thread.start()
+        while not worker.replies:
+            time.sleep(0.01)
+        worker.process.terminate()
+        thread.join()
+        assert not results[0]["success"] and "exited" in results[0]["out"][0]
+        assert "expired" in local_server.dispatch("a", "run", ["x"], 0, 0, first["a"]["globalFrameID"], False)["out"][0]
+        assert pool.worker("a") is not worker and pool.worker("a") in pool.workers and worker not in pool.workers
+        assert "3" in local_server.dispatch("a", "run", ["(+ 1 2)"], 0, 0, -1, False)["out"][0]
+        # sessions idle for longer than SESSION_TTL are no longer assigned to their workers
+        monkeypatch.setattr(session, "SESSION_TTL", -1)
+        pool.worker("c")
+        assert sum(worker.sessions for worker in pool.workers) == 1
+    finally:
+        pool.close()
+
+
+def test_shared_builtins():
+    # the global frames of all runs share one frame of builtins, which set! of a builtin does not change
+    import local_server
+    outs = [scheme_runner.SchemeTestCase.get_scm_response(code, reset)
+            for code, reset in [("(set! car cdr) (car '(1 2))", True), ("(car '(1 2))", False)]]
+    frames = [local_server.retained_frame(out["globalFrameID"]).base for out in outs]
+    assert frames[0].parent is frames[1].parent and "car" in frames[0].vars and "car" not in frames[1].vars
+    assert [out["out"] for out in outs] == [["(2)\n"], ["1\n"]]
+
+
+def test_async_server():
+    # the asyncio server answers several requests on one connection, including runs streamed in chunks
+    import http.client
+    import json
+    import socket
+    import struct
+    import threading
+    import async_server
+    server = async_server.Server(("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connection = http.client.HTTPConnection(*server.server_address)
+        bodies, sockets = [], set()
+        for path, body in [("/list_files", ""), ("/process2", "code[]=(%2B 1 2)&curr_i=0&curr_f=0&globalFrameID=-1&"
+                                                               "tailViz=false&sessionId=test"),
+                           ("/process_stream", "code[]=(%2B 3 4)&curr_i=0&curr_f=0&globalFrameID=-1&tailViz=false")]:
+            connection.request("POST", path, body, {"Content-Type": "application/x-www-form-urlencoded"})
+            bodies.append(connection.getresponse().read())
+            sockets.add(connection.sock)
+        assert len(sockets) == 1
+        assert "3" in json.loads(bodies[1])["out"][0]
+        chunks = [json.loads(line) for line in bodies[2].splitlines()]
+        assert chunks[-1]["done"] and "7" in "".join(chunk.get("out", "") for chunk in chunks)
+        # bodies and WebSocket messages larger than MAX_BODY_SIZE are refused before they are read
+        connection.putrequest("POST", "/process2")
+        connection.putheader("Content-Length", str(async_server.MAX_BODY_SIZE + 1))
+        connection.endheaders()
+        assert connection.getresponse().status == 413
+        sock = socket.create_connection(server.server_address)
+        sock.sendall(b"GET /socket HTTP/1.1\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n")
+        sock.sendall(struct.pack(">BBQ", 0x81, 0xFF, 2 ** 63) + b"mask")
+        response = b""
+        while not response.endswith(struct.pack(">BBH", 0x88, 2, 1009)):
+            data = sock.recv(4096)
+            assert data, response
+            response += data
+        sock.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_static_assets():
+    # static files are compressed once and revalidated by their tags, and only the page itself is a template
+    import gzip
+    import local_server
+    status, headers, body = local_server.static_file("/ace.min.js", {"accept-encoding": "gzip"})
+    headers = dict(headers)
+    with open("editor/static/ace.min.js", "rb") as file:
+        assert status == 200 and headers["Content-Encoding"] == "gzip" and gzip.decompress(body) == file.read()
+    status, _, body = local_server.static_file("/ace.min.js", {"accept-encoding": "gzip",
+                                                               "if-none-match": headers["ETag"]})
+    assert status == 304 and body == b""
+    assert local_server.static_file("/ace.min.js", {"if-none-match": headers["ETag"]})[0] == 200
+    assert b"<START_DATA>" not in local_server.static_file("/", {})[2]
+    assert local_server.static_file("/../requests.jsonl", {})[0] == 404